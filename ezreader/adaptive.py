@@ -0,0 +1,190 @@
+"""
+Adaptive number of trials.
+
+Conditions are simulated in rounds of trials. A condition stops as soon as the confidence intervals of the chosen measures are narrow enough (an absolute width, or a width relative to the mean), so easy conditions do not waste trials and noisy ones get more.
+
+All conditions use common random numbers: trial i has the same seed in every condition. With a reference condition, other conditions stop when their paired differences from the reference are precise enough, which usually needs far fewer trials than precise means. Per-trial seeds (engine "heap" or "simpy") make trials of different conditions strongly correlated; engine "vectorized" is much faster per trial, but its batches share random numbers only loosely.
+
+A word whose measure is undefined in every trial so far (e.g., the regression probability of a word that is never fixated) cannot get a confidence interval; it is left out of the stopping rule and reported in the Estimate as undefined.
+
+Conditions are a dictionary mapping names to sentences or to pairs (sentence, model parameters), e.g. {"walked": walked, "ambled": ambled, "slow": (walked, {"alpha1": 120})}.
+"""
+
+from collections import namedtuple
+import math
+import multiprocessing
+import os
+from statistics import NormalDist
+
+import numpy as np
+
+from ezreader.aggregate import Moments
+from ezreader.batch import run_trial, trial_seed
+from ezreader.measures import stack
+from ezreader.sentence import Sentence
+from ezreader.vectorized import VectorizedSimulation
+
+Estimate = namedtuple('Estimate', 'n_trials mean half_width difference difference_half_width converged undefined')
+
+def prepare_conditions(conditions, reference=None):
+    """
+    Validate conditions (see the module).
+
+    :param conditions: dictionary of conditions
+    :param reference: name of the reference condition, if any
+    return: dictionary mapping names to pairs (Sentence, model parameters or None)
+    """
+    if reference is not None and reference not in conditions:
+        raise ValueError("Unknown reference condition: %s" % reference)
+    prepared = {}
+    for name, condition in conditions.items():
+        if isinstance(condition, tuple) and len(condition) == 2 and (condition[1] is None or isinstance(condition[1], dict)):
+            sentence, model_parameters = condition
+        else:
+            sentence, model_parameters = condition, None
+        prepared[name] = (Sentence.of(sentence), model_parameters)
+    return prepared
+
+def simulate_trials(sentence, model_parameters, start, n_trials, seed, engine="heap"):
+    """
+    Measures of trials start, ..., start+n_trials-1 (trial i has the seed trial_seed(seed, i), or, with engine "vectorized", the batch has the seed trial_seed(seed, start)).
+
+    return: dictionary of arrays (trials x words), as ezreader.measures.stack
+    """
+    if engine == "vectorized":
+        return VectorizedSimulation(sentence, n_trials, model_parameters=model_parameters, seed=trial_seed(seed, start)).run().measures()
+    if engine in ("heap", "simpy"):
+        return stack([run_trial(sentence, trial_seed(seed, index), index, model_parameters, engine=engine).measures for index in range(start, start + n_trials)])
+    raise ValueError("Unknown engine: %s; use 'heap', 'simpy' or 'vectorized'." % engine)
+
+def _simulate_trials(task):
+    return simulate_trials(*task)
+
+def run_adaptive(conditions, measures=('gaze',), words=None, width=None, relative_error=None, confidence=0.95, reference=None, increment=500, min_trials=None, max_trials=100000, seed=0, engine="heap", workers=1):
+    """
+    Simulate every condition until its chosen measures are precise enough (or until max_trials).
+
+    :param conditions: dictionary of conditions (see the module)
+    :param measures: measures whose precision decides when to stop (see ezreader.measures)
+    :param words: indices of words whose measures decide when to stop; by default all words
+    :param width: stop when the half-width of every confidence interval is at most this (ms for durations, probability for probabilities)
+    :param relative_error: stop when the half-width of every confidence interval is at most this fraction of the absolute value of the mean (or of the difference); with width as well, meeting either is enough
+    :param confidence: confidence level of the intervals
+    :param reference: name of the reference condition; other conditions stop when their paired differences from it are precise enough (the reference runs as long as any other condition)
+    :param increment: number of trials added to a condition in one round
+    :param min_trials: minimum number of trials of every condition (by default, increment)
+    :param max_trials: maximum number of trials of every condition
+    :param seed: master seed, shared by all conditions (common random numbers)
+    :param engine: "heap" (default), "simpy" or "vectorized" (see the module)
+    :param workers: number of processes; None uses all cores
+    return: dictionary mapping names of conditions to Estimates (number of trials, mean measures and half-widths of their confidence intervals, the same for paired differences from the reference, or None, whether the condition converged, and, per measure, the words left out of the stopping rule because no trial had the measure)
+    """
+    if width is None and relative_error is None:
+        raise ValueError("Give width or relative_error (or both).")
+    prepared = prepare_conditions(conditions, reference)
+    if min_trials is None:
+        min_trials = increment
+
+    z = NormalDist().inv_cdf(0.5 + confidence/2)
+
+    moments, differences, n_trials, converged = {}, {}, {}, {}
+
+    def precise(stats):
+        for measure in measures:
+            half_width = stats[measure].half_width(z)
+            mean = np.abs(stats[measure].estimate())
+            undefined = stats[measure].count == 0 # no trial so far had the measure (see undefined_words)
+            if words is not None:
+                half_width, mean, undefined = half_width[words], mean[words], undefined[words]
+            within = undefined.copy()
+            if width is not None:
+                within |= half_width <= width
+            if relative_error is not None:
+                within |= half_width <= relative_error*mean
+            if not within.all():
+                return False
+        return True
+
+    def undefined_words(stats):
+        checked = range(len(stats[measures[0]].count)) if words is None else words
+        return {measure: [word for word in checked if stats[measure].count[word] == 0] for measure in measures}
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    pool = multiprocessing.Pool(processes=workers) if workers > 1 else None
+
+    # heap and simpy trials are seeded one by one, so a round can be split among workers; a vectorized round is one batch
+    if engine == "vectorized":
+        block = increment
+    else:
+        block = max(1, math.ceil(increment/(4*workers)))
+
+    try:
+        active = list(prepared)
+        start = 0
+        while active:
+            tasks, owners = [], []
+            for name in active:
+                sentence, model_parameters = prepared[name]
+                for first in range(start, start + increment, block):
+                    tasks.append((sentence, model_parameters, first, min(block, start + increment - first), seed, engine))
+                    owners.append(name)
+            results = pool.map(_simulate_trials, tasks) if pool is not None else map(_simulate_trials, tasks)
+
+            batches = {}
+            for name, result in zip(owners, results):
+                batches.setdefault(name, []).append(result)
+            batches = {name: {measure: np.concatenate([result[measure] for result in parts]).astype(float) for measure in measures} for name, parts in batches.items()}
+
+            for name, batch in batches.items():
+                if name not in moments:
+                    moments[name] = {measure: Moments(batch[measure].shape[1]) for measure in measures}
+                    n_trials[name] = 0
+                for measure in measures:
+                    moments[name][measure].add(batch[measure])
+                n_trials[name] += increment
+                if reference is not None and name != reference:
+                    if name not in differences:
+                        differences[name] = {measure: Moments(batch[measure].shape[1]) for measure in measures}
+                    for measure in measures:
+                        differences[name][measure].add(batch[measure] - batches[reference][measure])
+
+            start += increment
+
+            for name in active:
+                stats = differences[name] if reference is not None and name != reference else moments[name]
+                converged[name] = n_trials[name] >= min_trials and precise(stats)
+
+            active = [name for name in active if not converged[name] and n_trials[name] < max_trials]
+            # the reference is needed as long as some other condition runs
+            if reference is not None and reference not in active and any(name != reference for name in active):
+                active.insert(0, reference)
+
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    estimates = {}
+    for name in prepared:
+        mean = {measure: moments[name][measure].estimate() for measure in measures}
+        half_width = {measure: moments[name][measure].half_width(z) for measure in measures}
+        if name in differences:
+            difference = {measure: differences[name][measure].estimate() for measure in measures}
+            difference_half_width = {measure: differences[name][measure].half_width(z) for measure in measures}
+        else:
+            difference = difference_half_width = None
+        stats = differences[name] if name in differences else moments[name]
+        estimates[name] = Estimate(n_trials[name], mean, half_width, difference, difference_half_width, converged[name], undefined_words(stats))
+    return estimates
+
+if __name__ == "__main__":
+    #example: gaze durations on the first word in Staub (2011), see example2.py
+    from ezreader.sentence import Word
+    conditions = {}
+    for inttime, intfailure in [(25, 0.01), (150, 0.6)]:
+        conditions[("walked", inttime, intfailure)] = [Word('walked', 159, 0, inttime, intfailure), Word('across', 5e03, 0, 25, 0), Word('the', 1e05, 1, 25, 0), Word('quad', 10, 1, 25, 0)]
+        conditions[("ambled", inttime, intfailure)] = [Word('ambled', 1, 0, inttime, intfailure), Word('across', 5e03, 0, 25, 0), Word('the', 1e05, 1, 25, 0), Word('quad', 10, 1, 25, 0)]
+    estimates = run_adaptive(conditions, measures=('gaze',), words=[0], width=5, reference=("walked", 25, 0.01), increment=250, workers=4)
+    for name, estimate in estimates.items():
+        print(name, estimate.n_trials, estimate.mean['gaze'][0], estimate.half_width['gaze'][0], estimate.difference and estimate.difference['gaze'][0], estimate.converged)
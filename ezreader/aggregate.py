@@ -0,0 +1,283 @@
+"""
+Aggregation of measures of many trials in fixed memory.
+
+An Aggregate keeps, for every measure and word, the count of trials in which the measure is defined, its mean and variance and, for durations, a histogram from which quantiles are estimated. Trials are added in batches and thrown away, so memory does not grow with the number of trials. Aggregates of different workers or shards are merged exactly (merge, or save and load):
+
+aggregate = simulate(sentence, n_trials=10**6, workers=8)
+aggregate.mean()["gaze"], aggregate.quantile(0.9)["gaze"]
+
+Quantiles are interpolated within bins of the histogram, so they are exact up to the width of a bin (10 ms by default); values outside the bins are counted at the ends.
+"""
+
+import multiprocessing
+import os
+
+import numpy as np
+
+from ezreader.measures import DURATIONS, MEASURES, stack
+from ezreader.sentence import Sentence
+
+BINS = np.arange(0, 2010, 10.0) # edges of bins of histograms of durations (in ms)
+
+class Moments(object):
+    """
+    Count, mean and variance of values of words, updated by batches of trials (undefined values, nan, are left out).
+    """
+
+    def __init__(self, n_words):
+        self.count = np.zeros(n_words)
+        self.mean = np.zeros(n_words)
+        self.m2 = np.zeros(n_words) # sum of squared deviations from the mean
+
+    def add(self, values):
+        """
+        Add a batch of values (trials x words).
+        """
+        values = np.asarray(values, dtype=float)
+        defined = ~np.isnan(values)
+        count = defined.sum(axis=0)
+        total = np.where(defined, values, 0).sum(axis=0)
+        mean = np.divide(total, count, out=np.zeros_like(total), where=count > 0)
+        m2 = np.where(defined, (values - mean)**2, 0).sum(axis=0)
+        self.__combine__(count, mean, m2)
+
+    def merge(self, other):
+        """
+        Add the values of other Moments (e.g., of another worker).
+
+        return: self
+        """
+        self.__combine__(other.count, other.mean, other.m2)
+        return self
+
+    def __combine__(self, count, mean, m2):
+        # combine with the previous batches (Chan et al.)
+        combined = self.count + count
+        weight = np.divide(count, combined, out=np.zeros_like(combined, dtype=float), where=combined > 0)
+        delta = mean - self.mean
+        self.mean = self.mean + delta*weight
+        self.m2 = self.m2 + m2 + delta**2*self.count*weight
+        self.count = combined
+
+    def variance(self):
+        """
+        Sample variance (nan where there are fewer than two values).
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 1, self.m2/(self.count - 1), np.nan)
+
+    def half_width(self, z):
+        """
+        Half-width of the confidence intervals of means (inf where there are fewer than two values).
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 1, z*np.sqrt(self.m2/(self.count - 1)/self.count), np.inf)
+
+    def estimate(self):
+        return np.where(self.count > 0, self.mean, np.nan)
+
+class Histogram(object):
+    """
+    Counts of values of words in fixed bins (values below the first edge are counted in the first bin, values above the last edge in the last one).
+    """
+
+    def __init__(self, n_words, bins=BINS):
+        """
+        :param n_words: number of words
+        :param bins: increasing edges of bins
+        """
+        self.bins = np.asarray(bins, dtype=float)
+        if self.bins.ndim != 1 or len(self.bins) < 2 or np.any(np.diff(self.bins) <= 0):
+            raise ValueError("bins must be at least two increasing edges.")
+        self.counts = np.zeros((n_words, len(self.bins) - 1), dtype=np.int64)
+
+    def add(self, values):
+        """
+        Add a batch of values (trials x words); nan values are left out.
+        """
+        values = np.asarray(values, dtype=float)
+        trials, words = np.nonzero(~np.isnan(values))
+        bins = np.clip(np.searchsorted(self.bins, values[trials, words], side='right') - 1, 0, len(self.bins) - 2)
+        np.add.at(self.counts, (words, bins), 1)
+
+    def merge(self, other):
+        """
+        Add the counts of another Histogram with the same bins.
+
+        return: self
+        """
+        if not np.array_equal(self.bins, other.bins):
+            raise ValueError("Histograms with different bins cannot be merged.")
+        self.counts += other.counts
+        return self
+
+    def quantile(self, q):
+        """
+        Quantile q (between 0 and 1) of values of every word, interpolated linearly within bins (nan for words without values).
+        """
+        if not 0 <= q <= 1:
+            raise ValueError("q must be between 0 and 1.")
+        cumulative = np.cumsum(self.counts, axis=1)
+        totals = cumulative[:, -1]
+        result = np.full(len(self.counts), np.nan)
+        for word in np.flatnonzero(totals):
+            rank = q*totals[word]
+            i = min(int(np.searchsorted(cumulative[word], rank, side='right' if rank == 0 else 'left')), self.counts.shape[1] - 1)
+            below = cumulative[word, i - 1] if i > 0 else 0
+            fraction = (rank - below)/self.counts[word, i] if self.counts[word, i] else 0.0
+            result[word] = self.bins[i] + fraction*(self.bins[i + 1] - self.bins[i])
+        return result
+
+class Aggregate(object):
+    """
+    Moments of all measures and histograms of durations of every word, over any number of trials (see the module).
+    """
+
+    def __init__(self, n_words, measures=MEASURES, bins=BINS):
+        """
+        :param n_words: number of words
+        :param measures: measures to aggregate (see ezreader.measures)
+        :param bins: edges of bins of histograms of durations (in ms)
+        """
+        if not measures:
+            raise ValueError("At least one measure must be aggregated.")
+        unknown = [measure for measure in measures if measure not in MEASURES]
+        if unknown:
+            raise ValueError("Unknown measures: %s" % ", ".join(unknown))
+        self.n_words = n_words
+        self.measures = tuple(measures)
+        self.n_trials = 0
+        self.moments = {measure: Moments(n_words) for measure in self.measures}
+        self.histograms = {measure: Histogram(n_words, bins) for measure in self.measures if measure in DURATIONS}
+
+    def add(self, trials):
+        """
+        Add a batch of trials.
+
+        :param trials: Measures of one trial, a list of Measures, or a dictionary of arrays (trials x words) as returned by ezreader.measures.stack or VectorizedSimulation.measures
+        """
+        if not isinstance(trials, dict):
+            trials = stack([trials] if hasattr(trials, 'as_dict') else trials)
+        n_trials = len(trials[self.measures[0]])
+        for measure in self.measures:
+            values = np.asarray(trials[measure], dtype=float)
+            if values.shape != (n_trials, self.n_words):
+                raise ValueError("%s must be an array of %d trials x %d words." % (measure, n_trials, self.n_words))
+            self.moments[measure].add(values)
+            if measure in self.histograms:
+                self.histograms[measure].add(values)
+        self.n_trials += n_trials
+
+    def merge(self, other):
+        """
+        Add the trials of another Aggregate of the same words, measures and bins (e.g., of another worker or shard).
+
+        return: self
+        """
+        if other.n_words != self.n_words or other.measures != self.measures:
+            raise ValueError("Aggregates of different words or measures cannot be merged.")
+        if any(not np.array_equal(histogram.bins, other.histograms[measure].bins) for measure, histogram in self.histograms.items()):
+            raise ValueError("Aggregates with different bins cannot be merged.") # checked before anything is added
+        for measure in self.measures:
+            self.moments[measure].merge(other.moments[measure])
+            if measure in self.histograms:
+                self.histograms[measure].merge(other.histograms[measure])
+        self.n_trials += other.n_trials
+        return self
+
+    def count(self):
+        """
+        Number of trials in which measures are defined (dictionary of arrays, one value per word).
+        """
+        return {measure: self.moments[measure].count.copy() for measure in self.measures}
+
+    def mean(self):
+        """
+        Mean measures, as ezreader.measures.summary: durations averaged over the trials in which they are defined, probabilities over all trials.
+        """
+        return {measure: self.moments[measure].estimate() for measure in self.measures}
+
+    def variance(self):
+        return {measure: self.moments[measure].variance() for measure in self.measures}
+
+    def quantile(self, q):
+        """
+        Approximate quantile q of durations (see the module).
+        """
+        return {measure: histogram.quantile(q) for measure, histogram in self.histograms.items()}
+
+    def save(self, path):
+        """
+        Save to a .npz file (see load).
+        """
+        arrays = {'n_words': self.n_words, 'measures': np.array(self.measures), 'n_trials': self.n_trials, 'bins': next(iter(self.histograms.values())).bins if self.histograms else BINS}
+        for measure in self.measures:
+            moments = self.moments[measure]
+            arrays.update({measure + '.count': moments.count, measure + '.mean': moments.mean, measure + '.m2': moments.m2})
+            if measure in self.histograms:
+                arrays[measure + '.histogram'] = self.histograms[measure].counts
+        with open(path, 'wb') as saved:
+            np.savez(saved, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an Aggregate saved by save.
+        """
+        with np.load(path) as saved:
+            aggregate = cls(int(saved['n_words']), tuple(str(measure) for measure in saved['measures']), saved['bins'])
+            aggregate.n_trials = int(saved['n_trials'])
+            for measure in aggregate.measures:
+                moments = aggregate.moments[measure]
+                moments.count, moments.mean, moments.m2 = saved[measure + '.count'], saved[measure + '.mean'], saved[measure + '.m2']
+                if measure in aggregate.histograms:
+                    aggregate.histograms[measure].counts = saved[measure + '.histogram']
+        return aggregate
+
+def _aggregate_trials(task):
+    from ezreader.adaptive import simulate_trials
+
+    sentence, model_parameters, start, n_trials, seed, engine, measures, bins = task
+    aggregate = Aggregate(len(sentence), measures, bins)
+    aggregate.add(simulate_trials(sentence, model_parameters, start, n_trials, seed, engine))
+    return aggregate
+
+def simulate(sentence, n_trials, params=None, seed=0, engine="vectorized", workers=1, batch=10000, measures=MEASURES, bins=BINS):
+    """
+    Simulate n_trials trials of a sentence in batches and aggregate their measures; only one batch per worker is held in memory at a time.
+
+    :param sentence: a Sentence or a list of Words
+    :param n_trials: number of trials
+    :param params: a dictionary of model parameters overriding the default values
+    :param seed: master seed (batches get seeds as in ezreader.adaptive.simulate_trials, so results do not depend on workers)
+    :param engine: "vectorized" (default), "heap" or "simpy"
+    :param workers: number of processes; None uses all cores
+    :param batch: number of trials in one batch
+    :param measures: measures to aggregate
+    :param bins: edges of bins of histograms of durations (in ms)
+    return: Aggregate
+    """
+    sentence = Sentence.of(sentence)
+    tasks = [(sentence, params, start, min(batch, n_trials - start), seed, engine, measures, bins) for start in range(0, n_trials, batch)]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    total = Aggregate(len(sentence), measures, bins)
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            total.merge(_aggregate_trials(task))
+    else:
+        with multiprocessing.Pool(processes=workers) as pool:
+            for aggregate in pool.imap(_aggregate_trials, tasks):
+                total.merge(aggregate)
+    return total
+
+if __name__ == "__main__":
+    #example: distribution of gaze durations of words in 100,000 trials, aggregated in batches of 10,000
+    from ezreader.sentence import Word
+    sentence = [Word('john', 5e06, 0.01, 25, 0.01), Word('sleeps', 2e05, 0.01, 25, 0.01), Word('extremely', 1e03, 0.01, 25, 0.01), Word('long', 1e05, 0.01, 25, 0.01)]
+    aggregate = simulate(sentence, n_trials=100000, workers=2, seed=1)
+    print(aggregate.n_trials, aggregate.mean()['gaze'], np.sqrt(aggregate.variance()['gaze']))
+    for q in (0.1, 0.5, 0.9):
+        print(q, aggregate.quantile(q)['gaze'])
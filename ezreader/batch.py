@@ -0,0 +1,110 @@
+"""
+Running many trials of E-Z reader, possibly spread over several processes.
+"""
+
+from collections import namedtuple
+import multiprocessing
+import os
+
+import numpy as np
+import simpy
+
+from ezreader.sentence import Sentence
+from ezreader.simulation import Simulation
+
+Fixation = namedtuple('Fixation', 'position word start duration')
+Trial = namedtuple('Trial', 'index seed time fixations measures stats')
+
+def trial_seed(seed, index):
+    """
+    Seed of one trial, derived from the master seed.
+
+    The seed depends only on the master seed and the index of the trial, so a trial gets the same seed no matter in which process (or in which order) it is run.
+
+    :param seed: master seed (an integer)
+    :param index: index of the trial
+    return: seed of the trial (an integer)
+    """
+    return int(np.random.SeedSequence(seed, spawn_key=(index,)).generate_state(1)[0])
+
+def run_trial(sentence, seed, index=0, params=None, initial_fixation=1, regions=None, engine="simpy", stats=False):
+    """
+    Run one trial until the simulation is over and collect its fixations and eye-movement measures (see ezreader.measures).
+
+    :param sentence: a Sentence or a list of Words
+    :param seed: seed of the trial (see trial_seed)
+    :param index: index of the trial (only stored in the record)
+    :param params: a dictionary of model parameters overriding the default values
+    :param initial_fixation: where the first fixation is
+    :param regions: indices of words of interest; if given, the trial stops once their first-pass measures are final
+    :param engine: "simpy" or "heap" (see Simulation; both give the same trial for the same seed)
+    :param stats: should events be counted and steps timed (see ezreader.stats)? The Stats are stored in the record (otherwise, it holds None).
+    return: Trial
+    """
+    sim = Simulation(sentence=sentence, realtime=False, initial_fixation=initial_fixation, trace=False, model_parameters=params, measures=True, regions=regions, seed=seed, engine=engine, stats=stats)
+
+    fixations = []
+    fixation_point, fixated_word, start = sim.fixation_point, sim.fixated_word, sim.time
+
+    while True:
+        try:
+            sim.step()
+        except simpy.core.EmptySchedule:
+            break
+        if sim.fixation_point != fixation_point:
+            fixations.append(Fixation(fixation_point, fixated_word, start, sim.time - start))
+            fixation_point, fixated_word, start = sim.fixation_point, sim.fixated_word, sim.time
+
+    fixations.append(Fixation(fixation_point, fixated_word, start, sim.time - start))
+
+    return Trial(index, seed, sim.time, fixations, sim.measures, sim.stats)
+
+def _run_trial(task):
+    """
+    Unpack a task sent to a worker and run it.
+    """
+    return run_trial(*task)
+
+def run_trials(sentence, n_trials, params=None, workers=1, seed=None, initial_fixation=1, chunksize=None, regions=None, engine="simpy", stats=False):
+    """
+    Run n_trials simulations of one sentence.
+
+    Every trial gets its own seed, derived from the master seed and the index of the trial. The results are therefore identical for a given master seed, whatever the number of workers.
+
+    :param sentence: a Sentence or a list of Words
+    :param n_trials: how many trials should be run
+    :param params: a dictionary of model parameters overriding the default values
+    :param workers: number of processes; 1 runs everything in the current process, None uses all cores
+    :param seed: master seed; if None, a fresh one is drawn (it is stored in the seeds of the trials)
+    :param initial_fixation: where the first fixation is
+    :param chunksize: how many trials are sent to a worker at once (by default, n_trials // (4*workers), at least 1, i.e., about four chunks per worker)
+    :param regions: indices of words of interest; if given, every trial stops once their first-pass measures are final
+    :param engine: "simpy" or "heap" (see Simulation)
+    :param stats: should events be counted and steps timed in every trial? Stats of all trials (from all workers) are merged by ezreader.stats.merged.
+    return: list of Trial records, ordered by the index of the trial
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    sentence = Sentence.of(sentence) # bad input fails here, before any trial runs
+
+    tasks = [(sentence, trial_seed(seed, index), index, params, initial_fixation, regions, engine, stats) for index in range(n_trials)]
+
+    if workers <= 1 or n_trials <= 1:
+        return [_run_trial(task) for task in tasks]
+
+    if chunksize is None:
+        chunksize = max(1, n_trials // (4*workers))
+
+    with multiprocessing.Pool(processes=workers) as pool:
+        return pool.map(_run_trial, tasks, chunksize=chunksize)
+
+if __name__ == "__main__":
+    #example how to run a batch of trials
+    from ezreader.simulation import Word
+    trials = run_trials([Word('john', 5e06, 0.01, 25, 0.01), Word('sleeps', 2e05, 0.01, 25, 0.01), Word('extremely', 1e03, 0.01, 25, 0.01), Word('long', 1e05, 0.01, 25, 0.01)], n_trials=100, workers=2, seed=1)
+    print(trials[0])
+    print(np.mean([trial.time for trial in trials]))
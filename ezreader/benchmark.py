@@ -0,0 +1,189 @@
+"""
+Benchmarks of the simulation engines.
+
+Every benchmark simulates synthetic sentences of a given length (4 to 500 words) in a given parameter regime with one engine, and measures trials per second, events per second and the peak memory of one trial (traced separately, since tracing slows simulations down). Events are model events as recorded by ezreader.recording (all but fixations), counted the same way in all engines; for the simpy and heap engines, they are counted by replaying the timed trials with recording on, so recording does not slow down the timed runs. Results are written as JSON, so that two versions can be compared:
+
+python -m ezreader.benchmark --output before.json
+python -m ezreader.benchmark --output after.json --compare before.json
+"""
+
+import argparse
+import datetime
+import json
+import math
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import simpy
+
+from ezreader import __version__
+from ezreader.recording import FIXATION
+from ezreader.sentence import Sentence, Word
+from ezreader.simulation import Simulation
+from ezreader.vectorized import VectorizedSimulation
+
+ENGINES = ('simpy', 'heap', 'vectorized')
+
+LENGTHS = (4, 20, 100, 500)
+
+# regimes: ranges of frequencies (log-uniform), predictabilities and integration failures of words
+REGIMES = {
+        'default': {'frequency': (1e02, 1e06), 'predictability': (0, 0.3), 'integration_failure': (0, 0.05)},
+        'high_failure': {'frequency': (1e02, 1e06), 'predictability': (0, 0.3), 'integration_failure': (0.3, 0.6)},
+        'low_frequency': {'frequency': (1, 1e02), 'predictability': (0, 0.1), 'integration_failure': (0, 0.05)},
+        }
+
+def synthetic_sentence(n_words, regime='default', seed=0):
+    """
+    A random sentence of n_words words in the regime (see REGIMES).
+    """
+    rng = np.random.default_rng(seed)
+    ranges = REGIMES[regime]
+    lengths = rng.integers(2, 11, n_words)
+    frequency = np.exp(rng.uniform(*np.log(ranges['frequency']), n_words))
+    predictability = rng.uniform(*ranges['predictability'], n_words)
+    failure = rng.uniform(*ranges['integration_failure'], n_words)
+    return Sentence([Word('w' * int(length), float(f), float(p), 25, float(fail)) for length, f, p, fail in zip(lengths, frequency, predictability, failure)])
+
+def run_trial(sentence, engine, seed, record=False):
+    """
+    Simulate one trial with the simpy or heap engine.
+
+    :param record: should events be recorded and counted?
+    return: number of model events (all recorded events but fixations), or None if they are not recorded
+    """
+    sim = Simulation(sentence, trace=False, engine=engine, seed=seed, record=record)
+    try:
+        while True:
+            sim.step()
+    except simpy.core.EmptySchedule:
+        pass
+    if record:
+        return int(np.count_nonzero(sim.events.records['event'] != FIXATION))
+    return None
+
+def run_batch(sentence, n_trials, seed):
+    """
+    Simulate n_trials trials with the vectorized engine.
+
+    return: number of model events (all counted events but fixations, as in run_trial)
+    """
+    sim = VectorizedSimulation(sentence, n_trials, seed=seed).run()
+    return int(sim.counts.sum() - sim.counts[:, FIXATION].sum())
+
+def measure(engine, n_words, regime='default', min_time=1.0, min_trials=5, batch=None):
+    """
+    Run one benchmark: simulate trials until min_time seconds (and min_trials trials) have passed.
+
+    :param batch: number of trials in one batch of the vectorized engine (by default, fewer for longer sentences)
+    return: dictionary of results
+    """
+    sentence = synthetic_sentence(n_words, regime)
+    if engine != 'vectorized':
+        batch = 1
+    elif batch is None:
+        batch = max(50, 20000 // n_words)
+
+    trials = events = 0
+    start = time.perf_counter()
+    while True:
+        if engine == 'vectorized':
+            events += run_batch(sentence, batch, seed=trials)
+            trials += batch
+        else:
+            run_trial(sentence, engine, seed=trials)
+            trials += 1
+        seconds = time.perf_counter() - start
+        if seconds >= min_time and trials >= min_trials:
+            break
+
+    if engine != 'vectorized':
+        # replay the timed trials to count their events
+        events = sum(run_trial(sentence, engine, seed, record=True) for seed in range(trials))
+
+    # peak memory of one trial (of one batch for the vectorized engine, divided by the number of trials)
+    tracemalloc.start()
+    if engine == 'vectorized':
+        run_batch(sentence, batch, seed=0)
+    else:
+        run_trial(sentence, engine, seed=0)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    if engine == 'vectorized':
+        peak /= batch
+
+    return {'engine': engine, 'words': n_words, 'regime': regime, 'batch': batch, 'trials': trials, 'events': events, 'seconds': seconds, 'trials_per_second': trials/seconds, 'events_per_second': events/seconds, 'peak_memory_per_trial': peak}
+
+def run_benchmarks(engines=ENGINES, lengths=LENGTHS, regimes=tuple(REGIMES), min_time=1.0, log=None):
+    """
+    Run all combinations of engines, lengths of sentences and regimes.
+
+    return: dictionary with a description of the environment and the list of results
+    """
+    results = []
+    for engine in engines:
+        for regime in regimes:
+            for n_words in lengths:
+                result = measure(engine, n_words, regime, min_time=min_time)
+                results.append(result)
+                if log is not None:
+                    log("%-10s %-13s %3d words: %10.1f trials/s %12.0f events/s %10.0f B/trial" % (engine, regime, n_words, result['trials_per_second'], result['events_per_second'], result['peak_memory_per_trial']))
+    return {'ezreader': __version__, 'python': platform.python_version(), 'numpy': np.__version__, 'simpy': simpy.__version__, 'platform': platform.platform(), 'date': datetime.datetime.now().isoformat(timespec='seconds'), 'results': results}
+
+def compare(old, new, threshold=0.1):
+    """
+    Compare two runs of benchmarks.
+
+    :param old: results of run_benchmarks (the baseline)
+    :param new: results of run_benchmarks
+    :param threshold: relative slowdown (or growth of memory) reported as a regression
+    return: list of (engine, regime, words, metric, old value, new value, ratio new/old, regression?)
+    """
+    baseline = {(result['engine'], result['regime'], result['words']): result for result in old['results']}
+    comparison = []
+    for result in new['results']:
+        key = (result['engine'], result['regime'], result['words'])
+        if key not in baseline:
+            continue
+        for metric, higher_is_better in (('trials_per_second', True), ('events_per_second', True), ('peak_memory_per_trial', False)):
+            before, after = baseline[key][metric], result[metric]
+            ratio = after/before if before else math.inf
+            regression = ratio < 1 - threshold if higher_is_better else ratio > 1 + threshold
+            comparison.append(key + (metric, before, after, ratio, regression))
+    return comparison
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m ezreader.benchmark', description="Benchmarks of E-Z reader engines (trials/s, events/s, peak memory per trial).")
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--compare', help="JSON file with results of an earlier run; regressions are reported and make the exit status 1")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative change reported as a regression (default: 0.1)")
+    parser.add_argument('--engines', nargs='+', default=ENGINES, choices=ENGINES)
+    parser.add_argument('--lengths', nargs='+', type=int, default=LENGTHS)
+    parser.add_argument('--regimes', nargs='+', default=list(REGIMES), choices=list(REGIMES))
+    parser.add_argument('--min-time', type=float, default=1.0, help="seconds spent on every benchmark (default: 1)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.engines, args.lengths, args.regimes, args.min_time, log=lambda message: print(message, file=sys.stderr))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+
+    if args.compare:
+        with open(args.compare) as old:
+            comparison = compare(json.load(old), results, args.threshold)
+        regressions = [row for row in comparison if row[-1]]
+        for engine, regime, words, metric, before, after, ratio, _ in regressions:
+            print("regression: %s %s %d words %s %.4g -> %.4g (x%.2f)" % (engine, regime, words, metric, before, after, ratio), file=sys.stderr)
+        print("%d comparisons, %d regressions" % (len(comparison), len(regressions)), file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Command-line driver of corpus simulations (the ezreader console script).
+
+The corpus is split into shards of consecutive sentences. Every shard is written to its own file in the output directory when all its sentences are simulated; files are written to a temporary file and renamed, so a shard file is either complete or missing. When a job is run again (e.g., after it was pre-empted), complete shards are skipped. Every sentence has its own seed derived from the master seed and its index in the corpus, so results do not depend on shards, workers or restarts. When all shards are done, they are merged into results.tsv.
+
+Example:
+
+ezreader corpus.tsv --params params.json --trials 1000 --workers 8 --output results
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+
+from ezreader import __version__
+from ezreader.corpus import read_corpus, simulate_corpus, write_results
+from ezreader.simulation import Simulation
+from ezreader.utilities import write_atomically
+
+MANIFEST = 'job.json'
+MERGED = 'results.tsv'
+SHARD = 'shard-%05d.tsv'
+SHARD_PATTERN = re.compile(r'^shard-(\d+)\.tsv$')
+
+def load_parameters(path):
+    """
+    Model parameters from a JSON file with a dictionary of parameters overriding the default values.
+    """
+    with open(path) as parameters:
+        parameters = json.load(parameters)
+    if not isinstance(parameters, dict):
+        raise ValueError("%s must contain a dictionary of model parameters." % path)
+    unknown = [name for name in parameters if name not in Simulation.model_parameters]
+    if unknown:
+        raise ValueError("Unknown model parameters in %s: %s" % (path, ", ".join(unknown)))
+    return parameters
+
+def completed_shards(output):
+    """
+    Numbers of shards written in the output directory.
+    """
+    return {int(match.group(1)) for match in map(SHARD_PATTERN.match, os.listdir(output)) if match}
+
+def merge_shards(output, n_shards):
+    """
+    Concatenate shards 0, ..., n_shards-1 into one file (with one header).
+    """
+    def write(path):
+        with open(path, 'w', newline='') as merged:
+            for shard in range(n_shards):
+                with open(os.path.join(output, SHARD % shard), newline='') as rows:
+                    header = rows.readline()
+                    if shard == 0:
+                        merged.write(header)
+                    for row in rows:
+                        merged.write(row)
+    write_atomically(os.path.join(output, MERGED), write)
+
+def run_job(corpus, output, params=None, n_trials=100, workers=1, seed=0, shard_size=100, delimiter=None, log=None):
+    """
+    Simulate a corpus shard by shard, skipping shards that are already done (see the module).
+
+    :param corpus: path to the corpus file (see ezreader.corpus)
+    :param output: output directory
+    :param params: a dictionary of model parameters overriding the default values
+    :param n_trials: number of trials per sentence
+    :param workers: number of processes; None uses all cores
+    :param seed: master seed
+    :param shard_size: number of sentences in a shard
+    :param delimiter: delimiter of columns of the corpus (by default, guessed from the extension)
+    :param log: function called with progress messages
+    return: number of shards
+    """
+    os.makedirs(output, exist_ok=True)
+
+    # a directory holds one job; resuming with different settings would mix results
+    manifest = {'version': __version__, 'corpus': os.path.abspath(corpus), 'parameters': params or {}, 'n_trials': n_trials, 'seed': seed, 'shard_size': shard_size}
+    manifest_path = os.path.join(output, MANIFEST)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as previous:
+            if json.load(previous) != manifest:
+                raise ValueError("%s holds results of a different job (see %s); use another output directory." % (output, manifest_path))
+    else:
+        def write(path):
+            with open(path, 'w') as job:
+                json.dump(manifest, job, indent=1)
+        write_atomically(manifest_path, write)
+
+    done = completed_shards(output)
+    if log is not None and done:
+        log("%d shards already done" % len(done))
+
+    n_sentences = [0]
+    def sentences():
+        for item in read_corpus(corpus, delimiter):
+            n_sentences[0] += 1
+            yield item
+
+    def save(shard, results):
+        write_atomically(os.path.join(output, SHARD % shard), lambda path: write_results(results, path))
+        if log is not None:
+            log("shard %d done (%d sentences)" % (shard, len(results)))
+
+    results = simulate_corpus(sentences(), n_trials=n_trials, seed=seed, params=params, workers=workers, chunksize=max(1, min(16, shard_size)), skip=lambda index: index // shard_size in done)
+
+    # results come in the order of sentences, so a shard is complete when the next one starts
+    shard, buffered = None, []
+    for result in results:
+        if result.index // shard_size != shard:
+            if buffered:
+                save(shard, buffered)
+            shard, buffered = result.index // shard_size, []
+        buffered.append(result)
+    if buffered:
+        save(shard, buffered)
+
+    n_shards = math.ceil(n_sentences[0] / shard_size)
+    merge_shards(output, n_shards)
+    if log is not None:
+        log("%d sentences in %d shards merged into %s" % (n_sentences[0], n_shards, os.path.join(output, MERGED)))
+    return n_shards
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='ezreader', description="Simulate eye movements on a corpus with E-Z reader. Results are written in shards; re-running the same command resumes an interrupted job.")
+    parser.add_argument('corpus', help="corpus file (TSV/CSV with columns sentence, token, frequency, predictability, integration_time, integration_failure)")
+    parser.add_argument('--params', help="JSON file with a dictionary of model parameters overriding the default values")
+    parser.add_argument('--trials', type=int, default=100, help="number of trials per sentence (default: 100)")
+    parser.add_argument('--workers', type=int, default=1, help="number of processes (default: 1; 0 uses all cores)")
+    parser.add_argument('--output', default='ezreader-results', help="output directory (default: ezreader-results)")
+    parser.add_argument('--seed', type=int, default=0, help="master seed (default: 0)")
+    parser.add_argument('--shard-size', type=int, default=100, help="number of sentences per shard (default: 100)")
+    parser.add_argument('--delimiter', help="delimiter of columns of the corpus (default: tab for .tsv and .txt, comma otherwise)")
+    parser.add_argument('--quiet', action='store_true', help="do not report progress")
+    parser.add_argument('--version', action='version', version='%(prog)s ' + __version__)
+    args = parser.parse_args(argv)
+
+    if args.trials < 1 or args.shard_size < 1 or args.workers < 0:
+        parser.error("--trials and --shard-size must be positive and --workers non-negative")
+
+    log = None if args.quiet else lambda message: print(message, file=sys.stderr)
+
+    try:
+        params = load_parameters(args.params) if args.params else None
+        run_job(args.corpus, args.output, params=params, n_trials=args.trials, workers=args.workers or None, seed=args.seed, shard_size=args.shard_size, delimiter=args.delimiter, log=log)
+    except (OSError, ValueError) as error:
+        print("ezreader: error: %s" % error, file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Simulation of whole corpora.
+
+Sentences are streamed from a TSV/CSV file, simulated concurrently in chunks and results are streamed out, so memory stays constant whatever the size of the corpus.
+
+The corpus file has a header and one row per word. Columns (in any order): sentence (sentence id), token, frequency, predictability, integration_time, integration_failure. Words of one sentence must be in consecutive rows.
+"""
+
+from collections import deque, namedtuple
+import csv
+import itertools
+import multiprocessing
+import os
+
+import numpy as np
+
+from ezreader.batch import trial_seed
+from ezreader.measures import MEASURES, summary
+from ezreader.sentence import Sentence, Word
+from ezreader.vectorized import VectorizedSimulation
+
+COLUMNS = ('sentence', 'token', 'frequency', 'predictability', 'integration_time', 'integration_failure')
+
+# other accepted names of columns
+ALIASES = {'sentence_id': 'sentence', 'word': 'token', 'failure': 'integration_failure', 'integration': 'integration_time'}
+
+SentenceResult = namedtuple('SentenceResult', 'index sentence_id sentence time measures')
+
+def read_corpus(path, delimiter=None):
+    """
+    Stream sentences from a corpus file.
+
+    :param path: path to the file
+    :param delimiter: delimiter of columns; by default tab for .tsv and .txt files, comma otherwise
+    return: generator of (sentence id, Sentence); invalid words raise ValueError as soon as their sentence is read
+    """
+    if delimiter is None:
+        delimiter = '\t' if os.path.splitext(path)[1].lower() in ('.tsv', '.txt') else ','
+
+    with open(path, newline='') as corpus:
+        reader = csv.reader(corpus, delimiter=delimiter)
+        header = [ALIASES.get(name.strip().lower(), name.strip().lower()) for name in next(reader)]
+        missing = [column for column in COLUMNS if column not in header]
+        if missing:
+            raise ValueError("Missing columns in %s: %s" % (path, ", ".join(missing)))
+        positions = [header.index(column) for column in COLUMNS]
+
+        rows = (row for row in reader if row)
+        for sentence_id, words in itertools.groupby(([row[position] for position in positions] for row in rows), key=lambda row: row[0]):
+            try:
+                sentence = Sentence(Word(*word[1:]) for word in words)
+            except ValueError as error:
+                raise ValueError("Sentence %s in %s: %s" % (sentence_id, path, error)) from None
+            yield sentence_id, sentence
+
+def simulate_sentence(index, sentence_id, sentence, n_trials, seed, params=None):
+    """
+    Simulate one sentence and aggregate the results.
+
+    :param index: index of the sentence in the corpus (the seed of the sentence is derived from it)
+    return: SentenceResult (mean time of trials and mean measures of words)
+    """
+    sim = VectorizedSimulation(sentence, n_trials, model_parameters=params, seed=trial_seed(seed, index)).run()
+    return SentenceResult(index, sentence_id, sentence, float(sim.time.mean()), summary(sim.measures()))
+
+def _simulate_chunk(task):
+    chunk, n_trials, seed, params = task
+    return [simulate_sentence(index, sentence_id, sentence, n_trials, seed, params) for index, sentence_id, sentence in chunk]
+
+def simulate_corpus(sentences, n_trials=100, seed=0, params=None, workers=1, chunksize=16, pending=None, skip=None):
+    """
+    Simulate sentences and stream results out, in the order of sentences.
+
+    Sentences are sent to workers in chunks; at most pending chunks are read ahead, so memory does not grow with the size of the corpus. Every sentence gets its own seed derived from seed and its index, so results do not depend on workers or chunksize.
+
+    :param sentences: iterable of (sentence id, Sentence or list of Words), e.g. from read_corpus
+    :param n_trials: number of trials per sentence
+    :param seed: master seed
+    :param params: a dictionary of model parameters overriding the default values
+    :param workers: number of processes; 1 runs everything in the current process, None uses all cores
+    :param chunksize: number of sentences sent to a worker at once
+    :param pending: maximum number of chunks in progress (by default, twice the number of workers)
+    :param skip: function of the index of a sentence; sentences for which it is true are not simulated (e.g., they were simulated before)
+    return: generator of SentenceResult
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    numbered = ((index, sentence_id, sentence) for index, (sentence_id, sentence) in enumerate(sentences) if skip is None or not skip(index))
+    chunks = iter(lambda: list(itertools.islice(numbered, chunksize)), [])
+
+    if workers <= 1:
+        for chunk in chunks:
+            yield from _simulate_chunk((chunk, n_trials, seed, params))
+        return
+
+    if pending is None:
+        pending = 2*workers
+
+    with multiprocessing.Pool(processes=workers) as pool:
+        running = deque()
+        for chunk in chunks:
+            running.append(pool.apply_async(_simulate_chunk, ((chunk, n_trials, seed, params),)))
+            if len(running) >= pending:
+                yield from running.popleft().get()
+        while running:
+            yield from running.popleft().get()
+
+def write_results(results, path, delimiter='\t'):
+    """
+    Stream results to a file with one row per word (sentence id, index of word, token, mean time of trials of the sentence and mean measures).
+
+    :param results: iterable of SentenceResult
+    :param path: path to the file
+    return: number of sentences written
+    """
+    count = 0
+    with open(path, 'w', newline='') as output:
+        writer = csv.writer(output, delimiter=delimiter)
+        writer.writerow(('sentence', 'word', 'token', 'sentence_time') + MEASURES)
+        for result in results:
+            for i, word in enumerate(result.sentence):
+                writer.writerow([result.sentence_id, i, word.token, result.time] + ['' if np.isnan(result.measures[measure][i]) else result.measures[measure][i] for measure in MEASURES])
+            count += 1
+    return count
+
+if __name__ == "__main__":
+    #example: simulate a small corpus file
+    import tempfile
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "corpus.tsv")
+    with open(path, "w") as corpus:
+        corpus.write("sentence\ttoken\tfrequency\tpredictability\tintegration_time\tintegration_failure\n")
+        for sentence in range(100):
+            for token, frequency in (('john', 5e06), ('sleeps', 2e05), ('extremely', 1e03), ('long', 1e05)):
+                corpus.write("%d\t%s\t%s\t0.01\t25\t0.01\n" % (sentence, token, frequency))
+    print(write_results(simulate_corpus(read_corpus(path), n_trials=200, workers=2), os.path.join(directory, "results.tsv")))
+    with open(os.path.join(directory, "results.tsv")) as results:
+        print(results.read()[:500])
@@ -0,0 +1,173 @@
+"""
+Differential simulation of conditions that differ in attributes of a few words.
+
+Every trial of the reference condition is simulated once (heap engine, seed of the trial as in ezreader.batch). Just before the trial first uses an attribute that differs in another condition (L1 of the word for frequency and predictability, its integration for integration time and failure), the simulation is branched: the branch continues with the attributes of the condition and the rest of the same random numbers. The result of every condition is therefore exactly the trial with the same seed simulated from scratch, but the common beginning is simulated only once, and conditions are compared on common random numbers.
+
+Conditions with other model parameters differ from the first event and are simulated from scratch (with the same seeds). Conditions are given as in ezreader.adaptive: a dictionary mapping names to sentences or to pairs (sentence, model parameters); all sentences must have the same tokens.
+"""
+
+from collections import namedtuple
+import copy
+import multiprocessing
+import os
+
+import simpy
+
+from ezreader.adaptive import prepare_conditions
+from ezreader.batch import trial_seed
+from ezreader.measures import stack
+from ezreader.simulation import Simulation
+
+Differential = namedtuple('Differential', 'measures events events_from_scratch')
+
+USES = ("lexical", "integration") # attributes used at L1 and at integration of a word, in the order of their first use
+
+ATTRIBUTES = {"lexical": ("frequency", "predictability"), "integration": ("integration_time", "integration_failure")}
+
+def first_use(reference, sentence):
+    """
+    The first use of an attribute that differs between two sentences with the same tokens.
+
+    return: (index of the word, "lexical" or "integration"), or None if the sentences are the same
+    """
+    if reference.tokens != sentence.tokens:
+        raise ValueError("Conditions must have the same tokens (only attributes of words can differ).")
+    for word, (old, new) in enumerate(zip(reference, sentence)):
+        for use in USES:
+            if any(getattr(old, attribute) != getattr(new, attribute) for attribute in ATTRIBUTES[use]):
+                return (word, use)
+    return None
+
+def _order(use):
+    word, kind = use
+    return 2*word + USES.index(kind)
+
+def _finish(sim):
+    """
+    Run a simulation until it is over.
+
+    return: number of steps
+    """
+    steps = 0
+    try:
+        while True:
+            sim.step()
+            steps += 1
+    except simpy.core.EmptySchedule:
+        pass
+    return steps
+
+def simulate_trial(conditions, reference, seed, initial_fixation=1, regions=None):
+    """
+    One trial of all conditions (see the module).
+
+    :param conditions: dictionary mapping names to pairs (Sentence, model parameters or None)
+    :param reference: name of the reference condition
+    :param seed: seed of the trial
+    return: (dictionary mapping names to Measures, number of events simulated, number of events if every condition was simulated from scratch)
+    """
+    sentence, model_parameters = conditions[reference]
+    sim = Simulation(sentence, trace=False, engine="heap", initial_fixation=initial_fixation, model_parameters=model_parameters, measures=True, regions=regions, seed=seed)
+
+    results = {}
+    events = from_scratch = 0
+    pending, same = [], [] # conditions branched from the reference (order of the first use, name, sentence), conditions equal to it
+    for name, (other, other_parameters) in conditions.items():
+        if name == reference:
+            continue
+        if other_parameters != model_parameters:
+            fresh = Simulation(other, trace=False, engine="heap", initial_fixation=initial_fixation, model_parameters=other_parameters, measures=True, regions=regions, seed=seed)
+            steps = _finish(fresh)
+            results[name] = fresh.measures
+            events += steps
+            from_scratch += steps
+            continue
+        use = first_use(sentence, other)
+        if use is None:
+            same.append(name)
+        else:
+            pending.append((_order(use), name, other))
+    pending.sort(key=lambda branch: branch[0])
+
+    steps = 0
+    try:
+        while True:
+            if pending:
+                use = sim.next_use()
+                while pending and use is not None and _order(use) >= pending[0][0]:
+                    _, name, other = pending.pop(0)
+                    branch = sim.branch(sentence=other)
+                    branch_steps = _finish(branch)
+                    results[name] = branch.measures
+                    events += branch_steps
+                    from_scratch += steps + branch_steps
+            sim.step()
+            steps += 1
+    except simpy.core.EmptySchedule:
+        pass
+
+    results[reference] = sim.measures
+    events += steps
+    from_scratch += steps
+    # conditions that never diverged (e.g., the trial stopped at regions before) are the same as the reference
+    for name in same + [name for _, name, _ in pending]:
+        results[name] = copy.deepcopy(sim.measures)
+        from_scratch += steps
+    return results, events, from_scratch
+
+def _simulate_trials(task):
+    conditions, reference, seed, indices, initial_fixation, regions = task
+    results = {name: [] for name in conditions}
+    events = from_scratch = 0
+    for index in indices:
+        trial, trial_events, trial_from_scratch = simulate_trial(conditions, reference, trial_seed(seed, index), initial_fixation, regions)
+        events += trial_events
+        from_scratch += trial_from_scratch
+        for name, measures in trial.items():
+            results[name].append(measures)
+    return results, events, from_scratch
+
+def run_differential(conditions, n_trials, reference=None, seed=0, initial_fixation=1, regions=None, workers=1):
+    """
+    Simulate n_trials trials of all conditions (see the module).
+
+    :param conditions: dictionary of conditions
+    :param n_trials: number of trials of every condition
+    :param reference: name of the reference condition, simulated in full (by default, the first condition)
+    :param seed: master seed; trial i has the seed trial_seed(seed, i) in every condition
+    :param initial_fixation: where the first fixation is
+    :param regions: indices of words of interest; if given, trials stop once their first-pass measures are final
+    :param workers: number of processes; None uses all cores
+    return: Differential (measures of every condition, as ezreader.measures.stack; number of events simulated; number of events needed to simulate every condition from scratch)
+    """
+    if reference is None:
+        reference = next(iter(conditions))
+    prepared = prepare_conditions(conditions, reference)
+    for sentence, _ in prepared.values():
+        first_use(prepared[reference][0], sentence) # different tokens fail here
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    size = max(1, n_trials // (4*workers))
+    tasks = [(prepared, reference, seed, range(start, min(start + size, n_trials)), initial_fixation, regions) for start in range(0, n_trials, size)]
+
+    if workers <= 1 or len(tasks) <= 1:
+        parts = [_simulate_trials(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(processes=workers) as pool:
+            parts = pool.map(_simulate_trials, tasks)
+
+    measures = {name: stack([trial for results, _, _ in parts for trial in results[name]]) for name in prepared}
+    return Differential(measures, sum(part[1] for part in parts), sum(part[2] for part in parts))
+
+if __name__ == "__main__":
+    #example: the conditions of Staub (2011), see example2.py; they differ only in the first word, so little is shared, but the contrasts use common random numbers
+    import numpy as np
+    from ezreader.sentence import Word
+    conditions = {}
+    for inttime, intfailure in [(25, 0.01), (150, 0.01), (25, 0.6), (150, 0.6)]:
+        conditions[(inttime, intfailure)] = [Word('walked', 159, 0, inttime, intfailure), Word('across', 5e03, 0, 25, 0), Word('the', 1e05, 1, 25, 0), Word('quad', 10, 1, 25, 0)]
+    result = run_differential(conditions, n_trials=1000, seed=1, workers=2)
+    for name, values in result.measures.items():
+        print(name, np.nanmean(values['go_past'][:, 0]), np.nanmean(values['go_past'][:, 0] - result.measures[(25, 0.01)]['go_past'][:, 0]))
+    print("%d events simulated, %d from scratch" % (result.events, result.events_from_scratch))
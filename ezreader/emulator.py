@@ -0,0 +1,242 @@
+"""
+Emulator of E-Z reader: fast predictions of mean measures of words for parameters within a region.
+
+An Emulator is trained on simulations of design points spread over a box of parameters (a Latin hypercube; every point is simulated by one VectorizedSimulation batch, all with the same seed). For every measure and word, the mean and the variance over trials are interpolated by radial basis functions (thin-plate splines with a linear term), so a prediction takes microseconds instead of a simulation:
+
+emulator = Emulator.train(sentence, {"alpha1": (80, 140), "eccentricity": (1.1, 1.4)}, workers=4)
+emulator.predict({"alpha1": 110, "eccentricity": 1.2}).mean["gaze"]
+
+After training, predictions are validated against fresh simulations (other points, another seed); only measures whose errors are within the simulation noise are trusted. Parameters outside the box, and measures that are not trusted, are simulated instead (fallback), so the emulator never extrapolates. Parameters are named as in ezreader.sweep.
+"""
+
+from collections import namedtuple
+import multiprocessing
+import os
+
+import numpy as np
+
+from ezreader.aggregate import Aggregate
+from ezreader.measures import MEASURES, PROBABILITIES
+from ezreader.sentence import Sentence
+from ezreader.sweep import apply_parameters
+from ezreader.vectorized import VectorizedSimulation
+
+SMOOTHING = 0.0 # added to the diagonal of the kernel matrix; design points share a seed, so their noise is smooth in the parameters and interpolating them exactly works best (smoothing helps with noisier training data)
+
+Prediction = namedtuple('Prediction', 'mean variance emulated')
+
+Validation = namedtuple('Validation', 'error z trusted')
+
+def latin_hypercube(n_points, dimension, seed=0):
+    """
+    Points spread over the unit cube: every parameter has exactly one point in each of n_points equal intervals.
+
+    return: array (n_points x dimension)
+    """
+    rng = np.random.default_rng(seed)
+    return (np.argsort(rng.random((n_points, dimension)), axis=0) + rng.random((n_points, dimension))) / n_points
+
+def _kernel(squared):
+    # thin-plate spline r**2 log r of squared distances (0 at r = 0)
+    return 0.5*squared*np.log(np.maximum(squared, 1e-300))
+
+def simulate(sentence, parameters, n_trials, seed, measures=MEASURES):
+    """
+    Simulate one parameter set by a VectorizedSimulation batch.
+
+    return: (means, variances over trials, counts of trials in which measures are defined), dictionaries of arrays (one value per word)
+    """
+    modified, model_parameters = apply_parameters(sentence, parameters)
+    aggregate = Aggregate(len(modified), measures)
+    aggregate.add(VectorizedSimulation(modified, n_trials, model_parameters=model_parameters, seed=seed).run().measures())
+    return aggregate.mean(), aggregate.variance(), aggregate.count()
+
+def _simulate(task):
+    return simulate(*task)
+
+def _simulate_all(sentence, parameter_sets, n_trials, seed, measures, workers):
+    tasks = [(sentence, parameters, n_trials, seed, measures) for parameters in parameter_sets]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(tasks) <= 1:
+        return [_simulate(task) for task in tasks]
+    with multiprocessing.Pool(processes=workers) as pool:
+        return pool.map(_simulate, tasks)
+
+class Emulator(object):
+    """
+    Interpolation of means and variances of measures of words over a box of parameters (see the module).
+    """
+
+    def __init__(self, sentence, parameters, points, means, variances, n_trials, seed=0, smoothing=SMOOTHING):
+        """
+        Fit the emulator to simulated design points (usually called by train).
+
+        :param sentence: a Sentence or a list of Words
+        :param parameters: dictionary mapping parameters to their bounds (low, high); parameters are named as in ezreader.sweep
+        :param points: design points (points x parameters, in the order of parameters)
+        :param means: dictionary mapping measures to means at the design points (points x words)
+        :param variances: dictionary mapping measures to variances over trials at the design points (points x words)
+        :param n_trials: number of trials simulated for every point (also used by fallback simulations)
+        :param seed: seed of the simulations (also used by fallback simulations)
+        :param smoothing: smoothing of the interpolation (see SMOOTHING)
+        """
+        self.sentence = Sentence.of(sentence)
+        self.names = list(parameters)
+        self.low = np.array([float(parameters[name][0]) for name in self.names])
+        self.high = np.array([float(parameters[name][1]) for name in self.names])
+        if np.any(self.high <= self.low):
+            raise ValueError("Every parameter needs bounds (low, high) with low < high.")
+        self.measures = tuple(means)
+        self.n_trials = n_trials
+        self.seed = seed
+        self.n_emulated = 0
+        self.n_simulated = 0
+        self.validation = None
+
+        self.__centers = (np.asarray(points, dtype=float) - self.low) / (self.high - self.low)
+        n_points, dimension = self.__centers.shape
+        if n_points < dimension + 2:
+            raise ValueError("At least %d design points are needed for %d parameters." % (dimension + 2, dimension))
+        n_words = len(self.sentence)
+        outputs = np.hstack([np.asarray(means[measure], dtype=float) for measure in self.measures] + [np.asarray(variances[measure], dtype=float) for measure in self.measures])
+
+        polynomial = np.hstack([np.ones((n_points, 1)), self.__centers])
+        system = np.zeros((n_points + dimension + 1, n_points + dimension + 1))
+        system[:n_points, :n_points] = _kernel(np.sum((self.__centers[:, None] - self.__centers[None])**2, axis=2)) + smoothing*np.eye(n_points)
+        system[:n_points, n_points:] = polynomial
+        system[n_points:, :n_points] = polynomial.T
+        right = np.zeros((n_points + dimension + 1, outputs.shape[1]))
+        right[:n_points] = np.where(np.isnan(outputs), 0, outputs)
+        solution = np.linalg.lstsq(system, right, rcond=None)[0]
+        self.__weights, self.__linear = solution[:n_points], solution[n_points:]
+        # columns of measures in the outputs, and upper bounds of predictions (probabilities are at most 1)
+        self.__columns = [(measure, slice(i*n_words, (i + 1)*n_words), slice((len(self.measures) + i)*n_words, (len(self.measures) + i + 1)*n_words)) for i, measure in enumerate(self.measures)]
+        self.__upper = np.full(outputs.shape[1], np.inf)
+        for measure, mean, _ in self.__columns:
+            if measure in PROBABILITIES:
+                self.__upper[mean] = 1
+        # measures undefined at some design point (e.g., a word that is never fixated) are not emulated
+        defined = ~np.isnan(outputs).any(axis=0)
+        self.trusted = set(measure for measure, mean, variance in self.__columns if defined[mean].all() and defined[variance].all())
+
+    @classmethod
+    def train(cls, sentence, parameters, n_points=None, n_trials=2000, seed=0, measures=MEASURES, smoothing=SMOOTHING, validation_points=20, tolerance=3.0, workers=1):
+        """
+        Simulate design points over the box of parameters, fit an emulator to them and validate it.
+
+        :param sentence: a Sentence or a list of Words
+        :param parameters: dictionary mapping parameters to their bounds (low, high)
+        :param n_points: number of design points; by default 40 per parameter (at least 80)
+        :param n_trials: number of trials simulated for every point
+        :param seed: seed of the simulations (the same for all points, i.e., common random numbers) and of the design
+        :param measures: measures to emulate
+        :param smoothing: smoothing of the interpolation (see SMOOTHING)
+        :param validation_points: number of fresh points to validate the emulator (0: no validation, all measures are trusted)
+        :param tolerance: see validate
+        :param workers: number of processes simulating points; None uses all cores
+        return: Emulator
+        """
+        sentence = Sentence.of(sentence)
+        names = list(parameters)
+        low = np.array([float(parameters[name][0]) for name in names])
+        high = np.array([float(parameters[name][1]) for name in names])
+        if n_points is None:
+            n_points = max(80, 40*len(names))
+        points = low + latin_hypercube(n_points, len(names), seed)*(high - low)
+
+        results = _simulate_all(sentence, [dict(zip(names, point)) for point in points], n_trials, seed, measures, workers)
+        means = {measure: np.array([result[0][measure] for result in results]) for measure in measures}
+        variances = {measure: np.array([result[1][measure] for result in results]) for measure in measures}
+        emulator = cls(sentence, parameters, points, means, variances, n_trials, seed, smoothing)
+        if validation_points:
+            emulator.validate(validation_points, tolerance=tolerance, workers=workers)
+        return emulator
+
+    def validate(self, n_points=20, seed=None, tolerance=3.0, workers=1):
+        """
+        Compare predicted means with fresh simulations at other points of the box and with another seed. Errors are measured in standard errors of the difference between two simulations with n_trials; measures whose root mean square error is within tolerance are trusted, the others are simulated from then on.
+
+        :param n_points: number of points
+        :param seed: seed of the points and of their simulations; by default seed + 1
+        :param tolerance: largest root mean square error (in standard errors) of trusted measures
+        :param workers: number of processes; None uses all cores
+        return: Validation (root mean square error of every measure, in its units; in standard errors; trusted measures)
+        """
+        if seed is None:
+            seed = self.seed + 1
+        points = self.low + latin_hypercube(n_points, len(self.names), seed)*(self.high - self.low)
+        results = _simulate_all(self.sentence, [dict(zip(self.names, point)) for point in points], self.n_trials, seed, self.measures, workers)
+
+        error, z = {}, {}
+        for measure in self.measures:
+            predicted = np.array([self.__interpolate__((point - self.low) / (self.high - self.low))[0][measure] for point in points])
+            simulated = np.array([result[0][measure] for result in results])
+            variance = np.array([result[1][measure] for result in results])
+            count = np.array([result[2][measure] for result in results])
+            if measure in PROBABILITIES:
+                # with rare events, the binomial variance is too small to judge errors (at least one event in n_trials is assumed)
+                variance = np.maximum(variance, 1.0/self.n_trials)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                scores = (predicted - simulated) / np.sqrt(2*variance/count)
+            used = ~np.isnan(scores)
+            error[measure] = float(np.sqrt(np.mean((predicted - simulated)[used]**2))) if used.any() else np.nan
+            z[measure] = float(np.sqrt(np.mean(scores[used]**2))) if used.any() else np.nan
+
+        trusted = set(measure for measure in self.trusted if z[measure] <= tolerance)
+        self.trusted = trusted
+        self.validation = Validation(error, z, trusted)
+        return self.validation
+
+    def inside(self, parameters):
+        """
+        Are the parameters within the box of the emulator?
+        """
+        point = self.__point__(parameters)
+        return bool(point.min() >= 0 and point.max() <= 1)
+
+    def predict(self, parameters, measures=None):
+        """
+        Means and variances over trials of measures of words. They are interpolated if the parameters are within the box and all measures are trusted; otherwise the parameters are simulated (with n_trials and seed of the emulator).
+
+        :param parameters: dictionary of values of all parameters of the emulator
+        :param measures: measures that are needed (by default all measures of the emulator)
+        return: Prediction (dictionary of means, dictionary of variances, whether they were emulated)
+        """
+        point = self.__point__(parameters)
+        if measures is None:
+            measures = self.measures
+        if point.min() >= 0 and point.max() <= 1 and all(measure in self.trusted for measure in measures):
+            self.n_emulated += 1
+            means, variances = self.__interpolate__(point)
+            return Prediction(means, variances, True)
+        self.n_simulated += 1
+        means, variances, _ = simulate(self.sentence, dict(zip(self.names, (parameters[name] for name in self.names))), self.n_trials, self.seed, self.measures)
+        return Prediction(means, variances, False)
+
+    def __point__(self, parameters):
+        if set(parameters) != set(self.names):
+            raise ValueError("The emulator needs values of exactly these parameters: %s" % ", ".join(str(name) for name in self.names))
+        return (np.array([float(parameters[name]) for name in self.names]) - self.low) / (self.high - self.low)
+
+    def __interpolate__(self, point):
+        values = np.minimum(np.maximum(_kernel(np.sum((self.__centers - point)**2, axis=1)) @ self.__weights + self.__linear[0] + point @ self.__linear[1:], 0), self.__upper)
+        return {measure: values[mean] for measure, mean, _ in self.__columns}, {measure: values[variance] for measure, _, variance in self.__columns}
+
+if __name__ == "__main__":
+    #example: emulate measures over two parameters, time predictions and recover parameters by fitting with the emulator
+    import time
+    from ezreader.fitting import fit
+    from ezreader.sentence import Word
+    sentence = [Word('john', 5e06, 0.01, 25, 0.01), Word('sleeps', 2e05, 0.01, 25, 0.01), Word('extremely', 1e03, 0.01, 25, 0.01), Word('long', 1e05, 0.01, 25, 0.01)]
+    box = {"alpha1": (80, 140), "eccentricity": (1.1, 1.4)}
+    emulator = Emulator.train(sentence, box, workers=4)
+    print(emulator.validation)
+    start = time.perf_counter()
+    for _ in range(10000):
+        emulator.predict({"alpha1": 110, "eccentricity": 1.2})
+    print("%.1f us per prediction" % ((time.perf_counter() - start) / 10000 * 1e06))
+    print(emulator.predict({"alpha1": 150, "eccentricity": 1.2}).emulated) # outside the box: simulated
+    target = simulate(sentence, {"alpha1": 120, "eccentricity": 1.25}, 20000, 5)[0]
+    result = fit(sentence, {measure: target[measure] for measure in ("first_fixation", "gaze", "skipped")}, box, emulator=emulator)
+    print(result.parameters, result.evaluations, emulator.n_simulated)
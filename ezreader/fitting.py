@@ -0,0 +1,162 @@
+"""
+Fitting parameters of E-Z reader to observed eye-movement measures.
+
+Parameters are optimized by Nelder-Mead (derivative-free). All candidates of one step of the optimizer (reflection, expansion and both contractions, or all points of a shrunk simplex) are simulated at once, in parallel, each by one VectorizedSimulation batch. Every candidate is simulated with the same seed (common random numbers), so differences between candidates are not swamped by simulation noise.
+
+Observed data are mean measures of words (see ezreader.measures), e.g. {"gaze": [250, 310, nan, 280], "skipped": [0.1, 0.05, 0.6, 0.2]}; nan marks words that should be ignored.
+"""
+
+from collections import namedtuple
+import multiprocessing
+import os
+
+import numpy as np
+
+from ezreader.measures import PROBABILITIES
+from ezreader.simulation import Simulation
+from ezreader.sweep import sweep
+
+# default weight of probabilities; with it, an error of 0.01 in a probability counts as much as 1 ms in a duration
+PROBABILITY_WEIGHT = 1e04
+
+Fit = namedtuple('Fit', 'parameters objective iterations evaluations history')
+
+def discrepancy(simulated, observed, weights=None):
+    """
+    Weighted sum of squared differences between simulated and observed measures.
+
+    :param simulated: dictionary of simulated mean measures of words
+    :param observed: dictionary of observed mean measures of words (nan values are ignored)
+    :param weights: dictionary of weights of measures; by default 1 for durations and PROBABILITY_WEIGHT for probabilities
+    return: discrepancy (inf if a simulated measure is undefined where it is observed)
+    """
+    total = 0.0
+    for measure, values in observed.items():
+        values = np.asarray(values, dtype=float)
+        used = ~np.isnan(values)
+        if weights and measure in weights:
+            weight = weights[measure]
+        else:
+            weight = PROBABILITY_WEIGHT if measure in PROBABILITIES else 1
+        difference = np.asarray(simulated[measure], dtype=float)[used] - values[used]
+        if np.isnan(difference).any():
+            return np.inf
+        total += weight * np.sum(difference**2)
+    return total
+
+def fit(sentence, observed, parameters, initial=None, n_trials=2000, seed=0, weights=None, workers=1, max_iterations=100, tolerance=1e-3, step=0.1, cache_dir=None, callback=None, emulator=None):
+    """
+    Find parameters minimizing the discrepancy between simulated and observed measures.
+
+    :param sentence: a list of Words
+    :param observed: dictionary of observed mean measures of words (see the module)
+    :param parameters: dictionary mapping the parameters to fit to their bounds (low, high); parameters are names of model parameters or (index of word, attribute), as in ezreader.sweep
+    :param initial: dictionary of starting values; by default the current values (model parameters or attributes of words)
+    :param n_trials: number of trials simulated for every candidate
+    :param seed: seed shared by all candidates (common random numbers)
+    :param weights: weights of measures (see discrepancy)
+    :param workers: number of processes evaluating candidates; None uses all cores
+    :param max_iterations: maximum number of steps of the optimizer
+    :param tolerance: stop when the simplex is smaller than this (in units of the bounds, i.e., 1 = the whole range of every parameter)
+    :param step: size of the initial simplex (in units of the bounds)
+    :param cache_dir: directory caching simulated candidates (see ezreader.sweep), so an interrupted fit can be resumed cheaply
+    :param callback: function called after every step with (iteration, best parameters, best discrepancy)
+    :param emulator: an ezreader.emulator.Emulator of the parameters; candidates are then predicted by it (or simulated where it falls back) instead of simulated with n_trials and seed
+    return: Fit (best parameters, their discrepancy, number of iterations, number of simulated candidates, history of best discrepancies)
+    """
+    names = list(parameters)
+    low = np.array([float(parameters[name][0]) for name in names])
+    high = np.array([float(parameters[name][1]) for name in names])
+
+    if initial is None:
+        initial = {}
+    start = []
+    for name in names:
+        if name in initial:
+            start.append(initial[name])
+        elif isinstance(name, tuple):
+            start.append(getattr(sentence[name[0]], name[1]))
+        else:
+            start.append(Simulation.model_parameters[name])
+    start = (np.array(start, dtype=float) - low) / (high - low)
+
+    def to_parameters(point):
+        return {name: float(value) for name, value in zip(names, low + np.clip(point, 0, 1)*(high - low))}
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    pool = multiprocessing.Pool(processes=workers) if workers > 1 and emulator is None else None
+
+    evaluations = [0]
+
+    def evaluate(points):
+        points = [np.clip(point, 0, 1) for point in points]
+        evaluations[0] += len(points)
+        if emulator is not None:
+            return points, [discrepancy(emulator.predict(to_parameters(point), measures=list(observed)).mean, observed, weights) for point in points]
+        results = sweep(sentence, [to_parameters(point) for point in points], n_trials=n_trials, seed=seed, cache_dir=cache_dir, pool=pool)
+        return points, [discrepancy(result.measures, observed, weights) for result in results]
+
+    try:
+        dimension = len(names)
+        simplex = [np.clip(start, 0, 1)]
+        for i in range(dimension):
+            vertex = simplex[0].copy()
+            vertex[i] = vertex[i] + step if vertex[i] + step <= 1 else vertex[i] - step
+            simplex.append(vertex)
+        simplex, values = evaluate(simplex)
+
+        history = []
+        iteration = 0
+        for iteration in range(1, max_iterations + 1):
+            order = np.argsort(values)
+            simplex = [simplex[i] for i in order]
+            values = [values[i] for i in order]
+            history.append(values[0])
+            if callback is not None:
+                callback(iteration, to_parameters(simplex[0]), values[0])
+
+            if max(np.max(np.abs(vertex - simplex[0])) for vertex in simplex[1:]) < tolerance:
+                break
+
+            centroid = np.mean(simplex[:-1], axis=0)
+            worst = simplex[-1]
+            reflection = centroid + (centroid - worst)
+            expansion = centroid + 2*(centroid - worst)
+            outside = centroid + 0.5*(centroid - worst)
+            inside = centroid - 0.5*(centroid - worst)
+
+            # all candidates of this step are simulated at once
+            (reflection, expansion, outside, inside), (f_reflection, f_expansion, f_outside, f_inside) = evaluate([reflection, expansion, outside, inside])
+
+            if f_reflection < values[0]:
+                simplex[-1], values[-1] = (expansion, f_expansion) if f_expansion < f_reflection else (reflection, f_reflection)
+            elif f_reflection < values[-2]:
+                simplex[-1], values[-1] = reflection, f_reflection
+            elif f_reflection < values[-1] and f_outside <= f_reflection:
+                simplex[-1], values[-1] = outside, f_outside
+            elif f_reflection >= values[-1] and f_inside < values[-1]:
+                simplex[-1], values[-1] = inside, f_inside
+            else:
+                # shrink towards the best point
+                shrunk, shrunk_values = evaluate([simplex[0] + 0.5*(vertex - simplex[0]) for vertex in simplex[1:]])
+                simplex = simplex[:1] + shrunk
+                values = values[:1] + shrunk_values
+
+        best = int(np.argmin(values))
+        return Fit(to_parameters(simplex[best]), values[best], iteration, evaluations[0], history)
+
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+if __name__ == "__main__":
+    #example: recover alpha1 and eccentricity from measures simulated with known values
+    from ezreader.simulation import Word
+    from ezreader.sweep import apply_parameters, simulate
+    sentence = [Word('john', 5e06, 0.01, 25, 0.01), Word('sleeps', 2e05, 0.01, 25, 0.01), Word('extremely', 1e03, 0.01, 25, 0.01), Word('long', 1e05, 0.01, 25, 0.01)]
+    target = simulate(*apply_parameters(sentence, {"alpha1": 120, "eccentricity": 1.25}), n_trials=4000, seed=1)['measures']
+    observed = {measure: np.array(target[measure], dtype=float) for measure in ("first_fixation", "gaze", "skipped")}
+    result = fit(sentence, observed, {"alpha1": (80, 140), "eccentricity": (1.0, 1.5)}, workers=4)
+    print(result.parameters, result.objective, result.iterations, result.evaluations)
@@ -0,0 +1,147 @@
+"""
+Layout of a sentence: where words start and end (in number of letters), and how the text is broken into lines.
+
+A layout is computed once per sentence and shared by all simulations of that sentence.
+
+Positions are counted through the whole text, as if the lines were one (a line break takes the place of a space), so words are found by bisection, whatever the length of the text. Lines matter only for saccades between them (return sweeps): their length is the horizontal distance within the lines, long sweeps undershoot their target and the eyes always land on the line of the target.
+"""
+
+from bisect import bisect_left
+import functools
+import math
+
+import numpy as np
+
+class Layout(object):
+    """
+    Positions of words in a sentence. Words are separated by one space and the first letter of the sentence is at position 1.
+
+    Word i spans from starts[i] to ends[i] (the space after the word included), so neighbouring words share one point; a fixation on that point belongs to the first word. Line k spans from line_starts[k] to line_ends[k].
+    """
+
+    __slots__ = ('tokens', 'lengths', 'starts', 'ends', 'centres', 'n_lines', 'lines', 'line_starts', 'line_ends', '_starts', '_ends', '_line_starts', '_line_ends')
+
+    def __init__(self, tokens, breaks=()):
+        """
+        :param tokens: tokens (strings) of the sentence.
+        :param breaks: indices of words that start a new line (the first line starts with the first word).
+        """
+        self.tokens = tuple(str(token) for token in tokens)
+        self.lengths = np.array([len(token) for token in self.tokens], dtype=float)
+        self.starts = 1 + np.concatenate(([0], np.cumsum(self.lengths + 1)[:-1])) # first letters of words
+        self.ends = self.starts + self.lengths + 1
+        self.centres = self.starts - 0.5 + self.lengths/2 # middles of words, targets of saccades
+
+        breaks = sorted(set(breaks))
+        if breaks and not (0 < breaks[0] and breaks[-1] < len(self.tokens)):
+            raise ValueError("Line breaks must be indices of words (except the first one).")
+        self.n_lines = len(breaks) + 1
+        self.lines = np.searchsorted(breaks, np.arange(len(self.tokens)), side='right') # line of every word
+        self.line_starts = self.starts[[0] + breaks] # first letters of lines
+        self.line_ends = self.ends[[first - 1 for first in breaks] + [len(self.tokens) - 1]]
+
+        # plain lists for fast scalar bisection
+        self._starts = self.starts.tolist()
+        self._ends = self.ends.tolist()
+        self._line_starts = self.line_starts.tolist()
+        self._line_ends = self.line_ends.tolist()
+
+    def __len__(self):
+        return len(self.tokens)
+
+    @classmethod
+    def for_sentence(cls, sentence):
+        """
+        Layout of a sentence (a list of Words). Layouts are cached, so all trials of a sentence share the same layout.
+        """
+        return _cached_layout(tuple(str(word.token) for word in sentence))
+
+    @classmethod
+    def of(cls, sentence, layout=None):
+        """
+        Layout of a Sentence: layout if given (it must have the tokens of the sentence), otherwise the cached layout of the sentence.
+        """
+        if layout is None:
+            return sentence.layout
+        if layout.tokens != tuple(str(token) for token in sentence.tokens):
+            raise ValueError("The layout does not match the sentence (its tokens differ).")
+        return layout
+
+    @classmethod
+    def wrapped(cls, tokens, width, breaks=()):
+        """
+        Layout of a text broken into lines of at most width letters (spaces included); a word longer than width gets a line of its own. Layouts are cached.
+
+        :param tokens: tokens (strings) of the text
+        :param width: number of letters in a line
+        :param breaks: indices of words that must start a new line (e.g., first words of paragraphs)
+        """
+        if width < 1:
+            raise ValueError("width must be positive.")
+        tokens = tuple(str(token) for token in tokens)
+        forced = set(breaks)
+        lines = []
+        used = None # letters used on the current line
+        for i, token in enumerate(tokens):
+            if used is not None and (i in forced or used + 1 + len(token) > width):
+                lines.append(i)
+                used = None
+            used = len(token) if used is None else used + 1 + len(token)
+        return _cached_layout(tokens, tuple(lines))
+
+    def word_at(self, position):
+        """
+        Index of the word at the position (in number of letters), or None if the position is outside of the sentence.
+        """
+        i = bisect_left(self._ends, position)
+        if i < len(self._ends) and position >= self._starts[i]:
+            return i
+        return None
+
+    def line_at(self, position):
+        """
+        Index of the line at the position (positions in front of the text are on the first line, after it on the last).
+        """
+        return max(0, bisect_left(self._line_starts, position) - 1)
+
+    def saccade(self, source, target):
+        """
+        Geometry of a saccade from source to target (positions).
+
+        return: intended length (horizontal, within the lines), direction (-1 for sweeps to the left, otherwise 1) and the lowest and highest landing point (the line of the target, for saccades between lines)
+        """
+        source_line, target_line = self.line_at(source), self.line_at(target)
+        if source_line == target_line:
+            return abs(source - target), 1, -math.inf, math.inf
+        length = (target - self._line_starts[target_line]) - (source - self._line_starts[source_line])
+        low = -math.inf if target_line == 0 else float(np.nextafter(self._line_starts[target_line], math.inf)) # the first point of a line belongs to the line before
+        high = math.inf if target_line == self.n_lines - 1 else self._line_ends[target_line]
+        return abs(length), 1 if length >= 0 else -1, low, high
+
+    def saccades(self, sources, targets):
+        """
+        Geometry of saccades (arrays), see saccade.
+        """
+        sources, targets = np.asarray(sources, dtype=float), np.asarray(targets, dtype=float)
+        source_lines = np.maximum(np.searchsorted(self.line_starts, sources, side='left') - 1, 0)
+        target_lines = np.maximum(np.searchsorted(self.line_starts, targets, side='left') - 1, 0)
+        between = source_lines != target_lines
+        length = np.where(between, (targets - self.line_starts[target_lines]) - (sources - self.line_starts[source_lines]), targets - sources)
+        direction = np.where(between & (length < 0), -1, 1)
+        low = np.where(between & (target_lines > 0), np.nextafter(self.line_starts[target_lines], np.inf), -np.inf)
+        high = np.where(between & (target_lines < self.n_lines - 1), self.line_ends[target_lines], np.inf)
+        return np.abs(length), direction, low, high
+
+    def words_at(self, positions, outside=-1):
+        """
+        Indices of the words at positions (an array). Positions outside of the sentence get the value outside.
+        """
+        positions = np.asarray(positions)
+        words = np.searchsorted(self.ends, positions, side='left')
+        inside = words < len(self.tokens)
+        inside[inside] = positions[inside] >= self.starts[words[inside]]
+        return np.where(inside, words, outside)
+
+@functools.lru_cache(maxsize=256)
+def _cached_layout(tokens, breaks=()):
+    return Layout(tokens, breaks)
@@ -0,0 +1,287 @@
+"""
+Standard eye-movement measures of words, computed incrementally while fixations begin and end.
+
+Measures (one value per word):
+
+first_fixation: first-fixation duration (first pass only)
+single_fixation: single-fixation duration (words fixated exactly once in the first pass)
+gaze: gaze duration (sum of first-pass fixations)
+go_past: go-past time (from the first fixation on the word until a word to the right is fixated)
+total: total time (sum of all fixations)
+skipped: the word was not fixated in the first pass
+refixated: the word was fixated more than once in the first pass
+regression: the first pass ended by a regression (a saccade to the left)
+
+Durations of words that were not fixated in the first pass are nan (total time is 0).
+"""
+
+import numpy as np
+
+MEASURES = ('first_fixation', 'single_fixation', 'gaze', 'go_past', 'total', 'skipped', 'refixated', 'regression')
+
+DURATIONS = ('first_fixation', 'single_fixation', 'gaze', 'go_past', 'total')
+
+PROBABILITIES = ('skipped', 'refixated', 'regression')
+
+# stages of words
+NOT_READ, FIRST_PASS, READ = range(3)
+
+class Measures(object):
+    """
+    Measures of the words of one trial. Feed it with fixations (fixate) as they begin; the previous fixation ends when the next one begins or when the trial is closed (close).
+    """
+
+    def __init__(self, n_words):
+        """
+        :param n_words: number of words in the sentence.
+        """
+        self.n_words = n_words
+
+        self.first_fixation = np.full(n_words, np.nan)
+        self.single_fixation = np.full(n_words, np.nan)
+        self.gaze = np.full(n_words, np.nan)
+        self.go_past = np.full(n_words, np.nan)
+        self.total = np.zeros(n_words)
+        self.skipped = np.zeros(n_words, dtype=bool)
+        self.refixated = np.zeros(n_words, dtype=bool)
+        self.regression = np.zeros(n_words, dtype=bool)
+
+        self.rightmost = -1 # the rightmost word fixated so far
+        self.closed = False
+        self.__stage = [NOT_READ]*n_words
+        self.__first_pass_fixations = [0]*n_words
+        self.__go_past = [] # words whose go-past time is running
+        self.__word = None # currently fixated word
+        self.__start = None # start of the current fixation
+
+    def fixate(self, word, time):
+        """
+        A new fixation begins.
+
+        :param word: index of the fixated word; -1 for fixations in front of the sentence, n_words for fixations after it
+        :param time: when the fixation begins (in ms)
+        """
+        previous = self.__word
+        if previous is not None:
+            self.__end_fixation__(time)
+
+            # leaving a word ends its first pass
+            if word != previous and 0 <= previous < self.n_words and self.__stage[previous] == FIRST_PASS:
+                self.__end_first_pass__(previous, regression=word < previous)
+
+        # moving to the right ends go-past times
+        if self.__go_past and word > self.__go_past[0]:
+            self.__go_past = [running for running in self.__go_past if running >= word]
+
+        if word > self.rightmost:
+            # words jumped over were skipped (even if they are fixated later)
+            for skipped in range(self.rightmost + 1, min(word, self.n_words)):
+                self.skipped[skipped] = True
+                self.__stage[skipped] = READ
+
+            if word < self.n_words:
+                self.__stage[word] = FIRST_PASS
+                self.first_fixation[word] = 0
+                self.gaze[word] = 0
+                self.go_past[word] = 0
+                self.__go_past.append(word)
+
+            self.rightmost = word
+
+        self.__word = word
+        self.__start = time
+
+    def __end_fixation__(self, time):
+        """
+        Add the duration of the current fixation to the measures.
+        """
+        word = self.__word
+        duration = time - self.__start
+
+        for running in self.__go_past:
+            self.go_past[running] += duration
+
+        if 0 <= word < self.n_words:
+            self.total[word] += duration
+
+            if self.__stage[word] == FIRST_PASS:
+                if self.__first_pass_fixations[word] == 0:
+                    self.first_fixation[word] = duration
+                self.__first_pass_fixations[word] += 1
+                self.gaze[word] += duration
+
+    def __end_first_pass__(self, word, regression):
+        self.__stage[word] = READ
+        self.regression[word] = regression
+        if self.__first_pass_fixations[word] == 1:
+            self.single_fixation[word] = self.first_fixation[word]
+        else:
+            self.refixated[word] = True
+
+    def resolved(self, regions):
+        """
+        Are the first-pass measures of all the words in regions final? They are when a word to the right of the regions has been fixated (or the trial is closed). Only total time can still change after that.
+
+        :param regions: indices of words
+        """
+        return self.closed or self.rightmost > max(regions)
+
+    def close(self, time, finished=True):
+        """
+        End the current fixation (at the end of the trial or when the trial is stopped).
+
+        :param time: when the trial ends (in ms)
+        :param finished: did the trial run until the end? If so, words never reached are marked as skipped; otherwise, they are left as not read.
+        """
+        if self.closed:
+            return
+
+        if self.__word is not None:
+            self.__end_fixation__(time)
+
+            if 0 <= self.__word < self.n_words and self.__stage[self.__word] == FIRST_PASS:
+                self.__end_first_pass__(self.__word, regression=False)
+
+        if finished:
+            for skipped in range(self.rightmost + 1, self.n_words):
+                self.skipped[skipped] = True
+                self.__stage[skipped] = READ
+
+        self.__word = None
+        self.closed = True
+
+    def as_dict(self):
+        """
+        Measures as a dictionary of arrays (one value per word).
+        """
+        return {measure: getattr(self, measure) for measure in MEASURES}
+
+def word_of(layout, position):
+    """
+    Index of the word at the position as used by Measures: -1 in front of the sentence, number of words after it.
+    """
+    word = layout.word_at(position)
+    if word is None:
+        return -1 if position < layout.starts[0] else len(layout)
+    return word
+
+def words_of(layout, positions):
+    """
+    Indices of words at positions (an array), see word_of.
+    """
+    positions = np.asarray(positions)
+    words = layout.words_at(positions, outside=-2)
+    return np.where(words == -2, np.where(positions < layout.starts[0], -1, len(layout)), words)
+
+def from_fixations(fixations, n_words, time=None):
+    """
+    Measures of one trial from its fixations.
+
+    :param fixations: list of (word, start, duration); word is the index of the word as in Measures.fixate
+    :param n_words: number of words
+    :param time: end of the trial; if None, the end of the last fixation
+    return: Measures
+    """
+    measures = Measures(n_words)
+    end = 0
+    for word, start, duration in fixations:
+        measures.fixate(word, start)
+        end = start + duration
+    measures.close(end if time is None else time)
+    return measures
+
+def from_arrays(trial, word, start, time, n_words, finished=None):
+    """
+    Measures of many trials at once, computed from arrays of their fixations (as collected by VectorizedSimulation). The result is the same as if every trial was fed to Measures.
+
+    :param trial: index of the trial of every fixation; fixations are ordered by trial and time
+    :param word: index of the fixated word of every fixation (see word_of)
+    :param start: start of every fixation (in ms)
+    :param time: end of every trial (an array with one value per trial)
+    :param n_words: number of words
+    :param finished: which trials ran until the end (see Measures.close); all by default
+    return: dictionary of arrays (trials x words)
+    """
+    trial, word, start, time = np.asarray(trial), np.asarray(word), np.asarray(start, dtype=float), np.asarray(time, dtype=float)
+    n_trials, n = len(time), len(trial)
+    width = n_words + 2
+
+    last = np.append(trial[1:] != trial[:-1], True)
+    end = np.where(last, time[trial], np.append(start[1:], 0))
+    duration = end - start
+    inside = (word >= 0) & (word < n_words)
+
+    # the rightmost word fixated so far (keys grow with trials, so one running maximum serves all trials)
+    key = trial*width + word + 1
+    rightmost = np.maximum.accumulate(key)
+    first = np.append(True, trial[1:] != trial[:-1])
+    previous_rightmost = np.where(first, trial*width, np.append(0, rightmost[:-1]))
+
+    # runs of fixations on one word; a run that enters a word right of everything fixated so far is its first pass
+    run_start = first | np.append(True, word[1:] != word[:-1])
+    run = np.cumsum(run_start) - 1
+    starts = np.flatnonzero(run_start)
+    first_pass_run = (key[starts] > previous_rightmost[starts]) & inside[starts]
+    first_pass = first_pass_run[run] & inside
+
+    result = {measure: np.full((n_trials, n_words), np.nan) for measure in DURATIONS}
+    result['total'] = np.zeros((n_trials, n_words))
+    np.add.at(result['total'], (trial[inside], word[inside]), duration[inside])
+
+    runs = starts[first_pass_run]
+    t, w = trial[runs], word[runs]
+    fixations_in_run = np.bincount(run[first_pass], minlength=len(starts))[first_pass_run]
+    gaze = np.bincount(run[first_pass], weights=duration[first_pass], minlength=len(starts))[first_pass_run]
+    result['first_fixation'][t, w] = duration[runs]
+    result['gaze'][t, w] = gaze
+    result['single_fixation'][t, w] = np.where(fixations_in_run == 1, duration[runs], np.nan)
+
+    # go-past time lasts until the first fixation right of the word (or until the end of the trial)
+    after = np.searchsorted(rightmost, key[runs], side='right')
+    stopped = (after >= n) | (trial[np.minimum(after, n - 1)] != t)
+    result['go_past'][t, w] = np.where(stopped, time[t], start[np.minimum(after, n - 1)]) - start[runs]
+
+    refixated = np.zeros((n_trials, n_words), dtype=bool)
+    refixated[t, w] = fixations_in_run > 1
+    result['refixated'] = refixated
+
+    # the first pass ends by a regression if the next fixation (in the same trial) is left of the word
+    following = runs + fixations_in_run
+    regression = np.zeros((n_trials, n_words), dtype=bool)
+    regression[t, w] = (following < n) & (trial[np.minimum(following, n - 1)] == t) & (word[np.minimum(following, n - 1)] < w)
+    result['regression'] = regression
+
+    # words without first pass were skipped if the eyes went past them (or the trial is over)
+    read = np.zeros((n_trials, n_words), dtype=bool)
+    read[t, w] = True
+    reached = np.full(n_trials, -1)
+    np.maximum.at(reached, trial, word)
+    if finished is not None:
+        reached = np.where(finished, n_words, reached)
+    else:
+        reached[:] = n_words
+    result['skipped'] = ~read & (np.arange(n_words) < reached[:, None])
+
+    return result
+
+def stack(trials):
+    """
+    Measures of many trials (a list of Measures) as a dictionary of arrays (trials x words).
+    """
+    return {measure: np.array([getattr(trial, measure) for trial in trials]) for measure in MEASURES}
+
+def summary(trials):
+    """
+    Mean measures over trials: durations are averaged over the trials in which they are defined, probabilities over all trials.
+
+    :param trials: list of Measures, or a dictionary of arrays (trials x words) as returned by from_arrays or stack
+    return: dictionary of arrays (one value per word)
+    """
+    if not isinstance(trials, dict):
+        trials = stack(trials)
+    result = {}
+    for measure in MEASURES:
+        values = np.asarray(trials[measure], dtype=float)
+        counts = np.sum(~np.isnan(values), axis=0)
+        result[measure] = np.where(counts > 0, np.nansum(values, axis=0) / np.maximum(counts, 1), np.nan)
+    return result
@@ -0,0 +1,189 @@
+"""
+Real-time simulations under asyncio.
+
+Many simulated readers run on one event loop (instead of one blocked thread per simpy.RealtimeEnvironment). Every reader waits for its next event with asyncio timers, so a reader costs nothing while it waits, and delivers its events to subscribers, which read them as async iterators:
+
+reader = RealtimeReader(Simulation(sentence, trace=False, engine="heap", record=True), speed=2)
+async for event in reader.subscribe():
+    ...
+
+Events are due at absolute wall-clock times (start of the reader + simulated time / speed), so delays do not accumulate: every event is processed as soon as possible after it is due, and how late it was is kept in lag statistics.
+"""
+
+import asyncio
+from collections import namedtuple
+import math
+
+import simpy
+
+from ezreader.recording import describe
+
+Event = namedtuple('Event', 'reader action code word source target lag')
+
+_CLOSED = object() # end of a subscription
+
+class Subscription(object):
+    """
+    Events of a reader as an async iterator (ends when the reader is done).
+    """
+
+    def __init__(self):
+        self.__queue = asyncio.Queue()
+
+    def put(self, event):
+        self.__queue.put_nowait(event)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self.__queue.get()
+        if event is _CLOSED:
+            raise StopAsyncIteration
+        return event
+
+class RealtimeReader(object):
+    """
+    A simulation run in real time (scaled by speed) on the asyncio event loop.
+    """
+
+    def __init__(self, simulation, speed=1.0, name=None):
+        """
+        :param simulation: Simulation with engine="heap" and record=True (events are read from simulation.events)
+        :param speed: how many simulated seconds pass in one second of wall-clock time (math.inf runs as fast as possible)
+        :param name: name of the reader, stored in its events (by default, the seed of the simulation)
+        """
+        if simulation.engine != "heap":
+            raise ValueError("Realtime readers need a simulation with the heap engine.")
+        if simulation.events is None:
+            raise ValueError("Realtime readers need a simulation with record=True.")
+        if not speed > 0:
+            raise ValueError("speed must be positive.")
+        self.simulation = simulation
+        self.speed = speed
+        self.name = simulation.seed if name is None else name
+        self.done = False
+        self.__subscriptions = []
+        self.__delivered = 0 # records already delivered
+
+        # lag statistics (ms of wall-clock time between when an event was due and when it was processed)
+        self.n_events = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+
+    @property
+    def mean_lag(self):
+        return self.total_lag / self.n_events if self.n_events else 0.0
+
+    def subscribe(self):
+        """
+        Subscribe to events of the reader (from now on).
+
+        return: Subscription, an async iterator of Events
+        """
+        subscription = Subscription()
+        if self.done:
+            subscription.put(_CLOSED)
+        else:
+            self.__subscriptions.append(subscription)
+        return subscription
+
+    def __publish__(self, lag):
+        records = self.simulation.events.records[self.__delivered:].tolist()
+        self.__delivered += len(records)
+        tokens = self.simulation.layout.tokens
+        for record in records:
+            event = Event(self.name, describe(tokens, *record), record[0], record[1], record[3], record[4], lag)
+            for subscription in self.__subscriptions:
+                subscription.put(event)
+
+    async def run(self):
+        """
+        Run the simulation until it is over, delivering its events to subscribers.
+        """
+        loop = asyncio.get_running_loop()
+        env = self.simulation.env
+        start, simulated_start = loop.time(), env.now
+
+        self.__publish__(0.0) # the initial fixation
+
+        try:
+            while True:
+                next_time = env.peek()
+                lag = 0.0
+                if next_time != math.inf:
+                    due = start + (next_time - simulated_start) / self.speed
+                    delay = due - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    else:
+                        await asyncio.sleep(0) # let other readers run
+                    if self.speed != math.inf:
+                        lag = max(0.0, 1000*(loop.time() - due))
+                    self.n_events += 1
+                    self.total_lag += lag
+                    self.max_lag = max(self.max_lag, lag)
+
+                # process everything due at this time (at the end, step closes measures and raises EmptySchedule)
+                try:
+                    self.simulation.step()
+                    while env.peek() <= next_time:
+                        self.simulation.step()
+                finally:
+                    self.__publish__(lag)
+
+        except simpy.core.EmptySchedule:
+            pass
+
+        finally:
+            self.done = True
+            for subscription in self.__subscriptions:
+                subscription.put(_CLOSED)
+            self.__subscriptions = []
+
+async def run_readers(readers):
+    """
+    Run many readers concurrently on the current event loop.
+    """
+    await asyncio.gather(*(reader.run() for reader in readers))
+
+async def merged(readers):
+    """
+    Run readers and yield the events of all of them, in the order in which they happen.
+
+    return: async generator of Events (the name of the reader is in Event.reader)
+    """
+    queue = asyncio.Queue()
+    subscriptions = [reader.subscribe() for reader in readers]
+
+    async def forward(subscription):
+        async for event in subscription:
+            queue.put_nowait(event)
+
+    runner = asyncio.ensure_future(asyncio.gather(run_readers(readers), *(forward(subscription) for subscription in subscriptions)))
+    runner.add_done_callback(lambda _: queue.put_nowait(_CLOSED))
+    try:
+        while True:
+            event = await queue.get()
+            if event is _CLOSED:
+                break
+            yield event
+        runner.result() # raise errors of readers
+    finally:
+        if not runner.done():
+            runner.cancel()
+
+if __name__ == "__main__":
+    #example: 50 simulated readers, 5 times faster than real time; print fixations as they happen
+    from ezreader.simulation import Simulation, Word
+    from ezreader.recording import FIXATION
+    sentence = [Word('john', 5e06, 0.01, 25, 0.01), Word('sleeps', 2e05, 0.01, 25, 0.01), Word('extremely', 1e03, 0.01, 25, 0.01), Word('long', 1e05, 0.01, 25, 0.01)]
+    readers = [RealtimeReader(Simulation(sentence, trace=False, engine="heap", record=True, seed=seed), speed=5, name=seed) for seed in range(50)]
+
+    async def main():
+        async for event in merged(readers):
+            if event.code == FIXATION and event.reader < 3:
+                print(event.reader, event.action)
+
+    asyncio.run(main())
+    print("mean lag %.3f ms, max lag %.3f ms" % (sum(reader.total_lag for reader in readers) / sum(reader.n_events for reader in readers), max(reader.max_lag for reader in readers)))
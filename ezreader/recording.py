@@ -0,0 +1,100 @@
+"""
+Recording of E-Z reader events as compact typed records.
+
+Every event is stored as one row of a NumPy structured array (event code, word index, time, source and target fixation). Human-readable Actions are built from the records only when someone asks for them.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+Action = namedtuple('Action', 'name details time')
+
+# names of events, in the order of their codes; the two kinds of attention shift differ in details ("From word" vs. "To word")
+EVENTS = ('Started saccade', 'Interrupted saccade programming', 'Saccade programming finished', 'Saccade finished', 'Started integration', 'Failed integration', 'Successful integration', 'Attention shift', 'Attention shift', 'L1', 'L1 FAKE', 'L2', 'Fixation')
+
+STARTED_SACCADE, INTERRUPTED_SACCADE, FINISHED_PROGRAMMING, FINISHED_SACCADE, STARTED_INTEGRATION, FAILED_INTEGRATION, SUCCESSFUL_INTEGRATION, ATTENTION_SHIFT, ATTENTION_SHIFT_BACK, L1, L1_FAKE, L2, FIXATION = range(len(EVENTS))
+
+SACCADE_EVENTS = (STARTED_SACCADE, INTERRUPTED_SACCADE, FINISHED_PROGRAMMING, FINISHED_SACCADE)
+
+ZEROTH_WORD = -1 # index of the zeroth word ('None'), attended after regressions in front of the integrated word
+
+EVENT_DTYPE = np.dtype([('event', np.uint8), ('word', np.int32), ('time', np.float64), ('source', np.float64), ('target', np.float64)])
+
+def token(tokens, word):
+    """
+    Token of the word with the index word (the zeroth word included).
+    """
+    if word == ZEROTH_WORD:
+        return 'None'
+    return tokens[word]
+
+def describe(tokens, event, word, time, source, target):
+    """
+    Build the Action of one event.
+
+    :param tokens: tokens of the sentence
+    :param event: code of the event
+    :param word: index of the word (for saccades, the word the saccade goes to)
+    :param time: time of the event (in ms)
+    :param source: fixation point when the event happened (for fixations, where the saccade was launched)
+    :param target: for saccades, the planned fixation point; for fixations, the landing point
+    return: Action
+    """
+    if event in SACCADE_EVENTS:
+        details = " ".join(['Planned saccade:', str(source), '->',  str(target), 'Word:', token(tokens, word)])
+    elif event == FIXATION:
+        details = " ".join(['Saccade:', str(source), '->',  str(target), 'Word:', token(tokens, word)])
+    elif event == ATTENTION_SHIFT:
+        details = " ".join(["From word:", token(tokens, word)])
+    elif event == ATTENTION_SHIFT_BACK:
+        details = " ".join(["To word:", token(tokens, word)])
+    else:
+        details = " ".join(["Word:", token(tokens, word)])
+    return Action(EVENTS[event], details, time)
+
+class EventRecorder(object):
+    """
+    Growable structured array of event records (see EVENT_DTYPE).
+    """
+
+    def __init__(self, tokens, capacity=256):
+        """
+        :param tokens: tokens of the sentence (used to describe events)
+        :param capacity: initial number of records; the array doubles when full
+        """
+        self.tokens = tokens
+        self.__records = np.empty(capacity, dtype=EVENT_DTYPE)
+        self.__size = 0
+
+    def __len__(self):
+        return self.__size
+
+    def append(self, event, word, time, source, target):
+        """
+        Append one record.
+        """
+        if self.__size == len(self.__records):
+            self.__records = np.concatenate((self.__records, np.empty(len(self.__records), dtype=EVENT_DTYPE)))
+        self.__records[self.__size] = (event, word, time, source, target)
+        self.__size += 1
+
+    @property
+    def records(self):
+        """
+        Recorded events (a view into the structured array).
+        """
+        return self.__records[:self.__size]
+
+    def fixations(self):
+        """
+        Records of fixations (the scanpath): time, word, launch site (source) and landing point (target).
+        """
+        records = self.records
+        return records[records['event'] == FIXATION]
+
+    def actions(self):
+        """
+        Recorded events as Actions (with human-readable details).
+        """
+        return [describe(self.tokens, *record) for record in self.records.tolist()]
@@ -0,0 +1,123 @@
+"""
+Random numbers of one simulation.
+
+Every simulation draws from its own numpy.random.Generator, so trials are reproducible whatever process runs them, and several simulations can share the same random numbers (common random numbers) by sharing a seed. Numbers are drawn in blocks and handed out one by one.
+"""
+
+import copy
+
+import numpy as np
+
+NOISE = ("gamma", "normal") # distributions of noise of durations
+
+def copy_generator(generator):
+    """
+    Independent copy of a numpy.random.Generator in the same state (faster than copy.deepcopy).
+    """
+    bit_generator = type(generator.bit_generator)()
+    bit_generator.state = generator.bit_generator.state
+    return np.random.Generator(bit_generator)
+
+def noise_factors(generator, distribution, cv, size):
+    """
+    Multiplicative noise of durations: random numbers with mean 1 and the coefficient of variation cv (standard deviation / mean).
+
+    :param generator: numpy.random.Generator
+    :param distribution: "gamma" (shape 1/cv**2, so the mean is kept) or "normal" (truncated at 0)
+    :param cv: coefficient of variation
+    :param size: how many numbers
+    """
+    if distribution == "gamma":
+        shape = 1/cv**2
+        return generator.standard_gamma(shape, size)/shape
+    if distribution == "normal":
+        return np.maximum(1 + cv*generator.standard_normal(size), 0)
+    raise ValueError("Unknown distribution of noise: %s; use one of %s." % (distribution, ", ".join(NOISE)))
+
+class RandomStream(object):
+    """
+    Uniform and normal random numbers drawn in blocks from buffers that refill automatically.
+
+    Uniforms and normals come from two independent generators (spawned from the seed), so the sequence of uniforms does not depend on how many normals were drawn and vice versa.
+    """
+
+    def __init__(self, seed=None, block=1024, first_block=32):
+        """
+        :param seed: seed (an integer or numpy.random.SeedSequence); if None, a fresh seed is drawn from the operating system
+        :param block: how many numbers are drawn at once
+        :param first_block: how many numbers are drawn the first time; blocks double up to block (short trials do not pay for numbers they never use)
+        """
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.seed = seed # the same seed replays the same numbers
+        self.block = block
+
+        # children of the seed (built directly rather than by spawn, which would give new children every time)
+        if isinstance(seed, np.random.SeedSequence):
+            entropy, spawn_key = seed.entropy, seed.spawn_key
+        else:
+            entropy, spawn_key = seed, ()
+        self.__entropy, self.__spawn_key = entropy, spawn_key
+        uniform_seed, normal_seed = (np.random.SeedSequence(entropy, spawn_key=spawn_key + (i,)) for i in range(2))
+        self.__uniform_generator = np.random.Generator(np.random.PCG64(uniform_seed))
+        self.__normal_generator = np.random.Generator(np.random.PCG64(normal_seed))
+        self.__uniforms = []
+        self.__normals = []
+        self.__uniform_block = self.__normal_block = self.__factor_block = first_block
+        self.__factors = []
+        self.__noise_generator = None # created only when noise is used (see factor)
+
+    def __deepcopy__(self, memo):
+        """
+        Copy that continues with the same numbers (used by snapshots and branches of simulations); buffers hold only floats, so they are copied shallowly.
+        """
+        clone = copy.copy(self)
+        clone.__uniforms, clone.__normals, clone.__factors = list(self.__uniforms), list(self.__normals), list(self.__factors)
+        clone.__uniform_generator = copy_generator(self.__uniform_generator)
+        clone.__normal_generator = copy_generator(self.__normal_generator)
+        if self.__noise_generator is not None:
+            clone.__noise_generator = copy_generator(self.__noise_generator)
+        memo[id(self)] = clone
+        return clone
+
+    def uniform(self):
+        """
+        One random number from the uniform distribution on [0, 1).
+        """
+        try:
+            return self.__uniforms.pop()
+        except IndexError:
+            # the buffer is reversed, so that numbers are handed out in the order in which they were drawn
+            self.__uniforms = self.__uniform_generator.random(self.__uniform_block)[::-1].tolist()
+            self.__uniform_block = min(2*self.__uniform_block, self.block)
+            return self.__uniforms.pop()
+
+    def normal(self, loc=0.0, scale=1.0):
+        """
+        One random number from the normal distribution.
+
+        :param loc: mean
+        :param scale: standard deviation
+        """
+        try:
+            return loc + scale*self.__normals.pop()
+        except IndexError:
+            self.__normals = self.__normal_generator.standard_normal(self.__normal_block)[::-1].tolist()
+            self.__normal_block = min(2*self.__normal_block, self.block)
+            return loc + scale*self.__normals.pop()
+
+    def factor(self, distribution, cv):
+        """
+        One multiplicative noise factor of a duration (see noise_factors).
+
+        :param distribution: "gamma" or "normal"
+        :param cv: coefficient of variation
+        """
+        try:
+            return self.__factors.pop()
+        except IndexError:
+            if self.__noise_generator is None:
+                self.__noise_generator = np.random.Generator(np.random.PCG64(np.random.SeedSequence(self.__entropy, spawn_key=self.__spawn_key + (2,))))
+            self.__factors = noise_factors(self.__noise_generator, distribution, cv, self.__factor_block)[::-1].tolist()
+            self.__factor_block = min(2*self.__factor_block, self.block)
+            return self.__factors.pop()
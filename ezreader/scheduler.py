@@ -0,0 +1,102 @@
+"""
+A small discrete-event core for E-Z reader, used instead of simpy.Environment when Simulation is created with engine="heap".
+
+Events are plain callbacks kept in a priority queue. Instead of interrupting processes by exceptions, events can carry a Token; cancelling the token makes the scheduler skip the callbacks of all events that carry it. A cancelled event still advances the clock when its time comes, as the timeout of an interrupted simpy process does, so both engines end trials at the same time.
+"""
+
+import heapq
+import math
+
+from simpy.core import EmptySchedule
+
+class Token(object):
+    """
+    Cancellable token of scheduled events (E-Z reader uses it for saccades that can be interrupted).
+    """
+
+    __slots__ = ('cancelled',)
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Cancel all events carrying this token that have not happened yet (their callbacks are not called).
+        """
+        self.cancelled = True
+
+class Scheduler(object):
+    """
+    Priority queue of events. The API follows the parts of simpy.Environment used by Simulation (now, step, run, peek).
+    """
+
+    def __init__(self, initial_time=0):
+        """
+        :param initial_time: at which time the scheduler starts.
+        """
+        self.now = initial_time
+        self.__queue = []
+        self.__eid = 0 # order of scheduling (a plain number, so that schedulers can be copied, see Simulation.snapshot)
+
+    def schedule(self, delay, callback, *args, token=None):
+        """
+        Schedule callback(*args) to be called after delay. Events at the same time are called in the order in which they were scheduled.
+
+        :param delay: delay (in the units of now)
+        :param callback: function to be called
+        :param token: Token; if it is cancelled before the event happens, the callback is not called
+        """
+        self.__eid += 1
+        heapq.heappush(self.__queue, (self.now + delay, self.__eid, callback, args, token))
+
+    def peek(self):
+        """
+        Time of the next event, cancelled or not (infinity if there is no event scheduled).
+        """
+        if self.__queue:
+            return self.__queue[0][0]
+        return math.inf
+
+    def next_event(self):
+        """
+        Callback and arguments of the next event (None if there is no event scheduled or the next event was cancelled).
+        """
+        if not self.__queue:
+            return None
+        event = self.__queue[0]
+        if event[4] is not None and event[4].cancelled:
+            return None
+        return event[2:4]
+
+    def step(self):
+        """
+        Process the next event (a cancelled event only advances the clock). Raise EmptySchedule (as simpy does) if there is no event left.
+        """
+        if not self.__queue:
+            raise EmptySchedule()
+        time, _, callback, args, token = heapq.heappop(self.__queue)
+        self.now = time
+        if token is None or not token.cancelled:
+            callback(*args)
+
+    def run(self, until=None):
+        """
+        Run until there is no event left or until the time until is reached (events at until are not processed).
+
+        :param until: time at which to stop
+        """
+        if until is not None and until <= self.now:
+            raise ValueError("until (%s) must be greater than the current time (%s)" % (until, self.now))
+
+        queue = self.__queue
+        while queue:
+            time, _, callback, args, token = queue[0]
+            if until is not None and time >= until:
+                break
+            heapq.heappop(queue)
+            self.now = time
+            if token is None or not token.cancelled:
+                callback(*args)
+
+        if until is not None:
+            self.now = until
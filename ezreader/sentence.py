@@ -0,0 +1,105 @@
+"""
+Words and sentences.
+
+A Sentence is validated and converted once, so simulations read ready-made floats instead of converting attributes of Words in every trial. Everything that takes a list of Words also takes a Sentence (lists are converted to cached Sentences).
+"""
+
+from array import array
+from collections import namedtuple
+import functools
+import math
+
+from ezreader.layout import Layout
+
+Word = namedtuple('Word', 'token frequency predictability integration_time integration_failure')
+
+class Sentence(object):
+    """
+    Validated sequence of Words. Numeric attributes are also stored in typed arrays (one value per word), e.g. sentence.integration_time[i].
+    """
+
+    __slots__ = ('words', 'tokens', 'lengths', 'frequency', 'predictability', 'integration_time', 'integration_failure', 'lexical_key', 'layout')
+
+    def __init__(self, words):
+        """
+        :param words: Words (or tuples token, frequency, predictability, integration_time, integration_failure)
+        """
+        converted = []
+        for i, word in enumerate(words):
+            try:
+                token, frequency, predictability, integration_time, integration_failure = word
+                word = Word(str(token), float(frequency), float(predictability), float(integration_time), float(integration_failure))
+            except (TypeError, ValueError):
+                raise ValueError("Word %d (%r) is not a Word (token, frequency, predictability, integration_time, integration_failure)." % (i, word)) from None
+            if not word.token:
+                raise ValueError("Word %d has an empty token." % i)
+            if not (0 < word.frequency < math.inf):
+                raise ValueError("Word %d (%s): frequency must be positive, not %s." % (i, word.token, word.frequency))
+            if not (0 <= word.predictability <= 1):
+                raise ValueError("Word %d (%s): predictability must be between 0 and 1, not %s." % (i, word.token, word.predictability))
+            if not (0 <= word.integration_time < math.inf):
+                raise ValueError("Word %d (%s): integration_time must be non-negative, not %s." % (i, word.token, word.integration_time))
+            if not (0 <= word.integration_failure <= 1):
+                raise ValueError("Word %d (%s): integration_failure must be between 0 and 1, not %s." % (i, word.token, word.integration_failure))
+            converted.append(word)
+        if not converted:
+            raise ValueError("A sentence needs at least one word.")
+
+        self.words = tuple(converted)
+        self.tokens = tuple(word.token for word in self.words)
+        self.lengths = array('l', (len(token) for token in self.tokens))
+        self.frequency = array('d', (word.frequency for word in self.words))
+        self.predictability = array('d', (word.predictability for word in self.words))
+        self.integration_time = array('d', (word.integration_time for word in self.words))
+        self.integration_failure = array('d', (word.integration_failure for word in self.words))
+        self.lexical_key = tuple(zip(self.frequency, self.predictability)) # what lexical times depend on (see ezreader.utilities.lexical_times)
+        self.layout = Layout.for_sentence(self.words)
+
+    @classmethod
+    def of(cls, sentence):
+        """
+        The sentence as a Sentence. Lists of Words are converted once and cached, so repeated simulations of the same list do not validate it again.
+        """
+        if isinstance(sentence, cls):
+            return sentence
+        words = tuple(sentence)
+        try:
+            return _cached_sentence(words)
+        except TypeError: # unhashable words
+            return cls(words)
+
+    @classmethod
+    def join(cls, sentences):
+        """
+        One text made of several sentences (Sentences or lists of Words), e.g., a paragraph to be broken into lines (see ezreader.layout.Layout.wrapped).
+        """
+        return cls([word for sentence in sentences for word in cls.of(sentence)])
+
+    def __len__(self):
+        return len(self.words)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Sentence(self.words[index])
+        return self.words[index]
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def __eq__(self, other):
+        if isinstance(other, Sentence):
+            return self.words == other.words
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.words)
+
+    def __repr__(self):
+        return "Sentence(%r)" % (list(self.words),)
+
+    def __reduce__(self):
+        return (Sentence, (self.words,))
+
+@functools.lru_cache(maxsize=256)
+def _cached_sentence(words):
+    return Sentence(words)
@@ -2,22 +2,29 @@
 Simulation of E-Z reader.
 """
 
-# TODO:
-# add noise (gamma, normal)
-
-from collections import namedtuple
+import copy
 import math
+import time
 import numpy as np
 
-from numpy.random import uniform, normal
 import simpy
 
 import ezreader.utilities as ut
+from ezreader.layout import Layout
+from ezreader.measures import Measures, word_of
+from ezreader.rng import NOISE, RandomStream
+from ezreader.recording import Action, EventRecorder, describe, ZEROTH_WORD
+from ezreader.recording import STARTED_SACCADE, INTERRUPTED_SACCADE, FINISHED_PROGRAMMING, FINISHED_SACCADE, STARTED_INTEGRATION, FAILED_INTEGRATION, SUCCESSFUL_INTEGRATION, ATTENTION_SHIFT, ATTENTION_SHIFT_BACK, L1, L1_FAKE, L2, FIXATION
+from ezreader.scheduler import Scheduler, Token
+from ezreader.sentence import Sentence, Word
+from ezreader.stats import Stats
+
+# Action and Word are defined elsewhere now, but they are still exported from here, as they always were
+__all__ = ['Simulation', 'Snapshot', 'Action', 'Word', 'OPTIMAL_SACCADE_LENGTH', 'NONE_WORD']
 
 OPTIMAL_SACCADE_LENGTH = 7
 
-Word = namedtuple('Word', 'token frequency predictability integration_time integration_failure')
-Action = namedtuple('Action', 'name details time')
+NONE_WORD = Word('None', 1e06, 1, 0, 0) # the zeroth word (outside of the text)
 
 class Simulation(object):
     """
@@ -39,44 +46,100 @@ class Simulation(object):
             "eta1": 0.5,
             "eta2": 0.15,
             "lambda": 0.16,
-            "probability_correct_regression": 0.6 # see Reichle et al. 2009, p. 13 - last word 0.6
+            "probability_correct_regression": 0.6, # see Reichle et al. 2009, p. 13 - last word 0.6
+            "noise_cv": 0.22 # coefficient of variation (sd/mean) of durations with noise; the shape of gamma noise is 1/noise_cv**2
             }
 
-    def __init__(self, sentence, realtime=False, noise=False, initial_time=0, initial_fixation=1, trace=True):
+    def __init__(self, sentence, realtime=False, noise=False, initial_time=0, initial_fixation=1, trace=True, model_parameters=None, engine="simpy", layout=None, record=False, measures=False, regions=None, seed=None, rng=None, stats=False):
         """
-        :param sentence: a list of Word triples representing the sentence.
+        :param sentence: a Sentence or a list of Words representing the sentence.
         :param realtime: should simulation run in real time?
-        :param noise: should noise be switched on/off?
+        :param noise: noise of durations of L1, L2, M1, M2, attention shifts and integration: False (off), "gamma" (or True) or "normal" (truncated at 0); the mean duration is kept and the coefficient of variation is the model parameter noise_cv.
         :param initial_time: at which simulation time does the simulation start?
+        :param model_parameters: a dictionary of model parameters overriding the default values (only for this simulation).
+        :param engine: what runs the simulation: "simpy" (simpy processes) or "heap" (a lightweight priority queue of events, see ezreader.scheduler; faster, but not available in real time).
+        :param layout: Layout of the sentence (with the same tokens, otherwise ValueError is raised); if None, the (cached) layout of the sentence is used (one line). Texts broken into lines are simulated with Layout.wrapped (see ezreader.layout).
+        :param record: should all events be recorded (in events, see ezreader.recording)?
+        :param measures: should eye-movement measures of words be computed while fixations begin and end (in measures, see ezreader.measures)?
+        :param regions: indices of words of interest; if given, measures are computed and the simulation stops as soon as the first-pass measures of these words are final (a word to their right is fixated).
+        :param seed: seed of the random numbers of this simulation (the same seed replays the same trial); if None, it is drawn from numpy's global random generator, so numpy.random.seed still makes simulations reproducible.
+        :param rng: RandomStream to draw random numbers from (instead of creating one from seed); see ezreader.rng.
+        :param stats: should events be counted and steps timed by process (in stats, see ezreader.stats)? True creates new Stats; a Stats object accumulates stats of many simulations.
         """
 
-        if realtime:
+        if model_parameters:
+            self.model_parameters = dict(self.model_parameters, **model_parameters)
+
+        if noise is True:
+            noise = "gamma"
+        if noise and noise not in NOISE:
+            raise ValueError("Unknown noise: %s; use False, True or one of %s." % (noise, ", ".join(NOISE)))
+        self.noise = noise or None
+
+        if engine not in ("simpy", "heap"):
+            raise ValueError("Unknown engine: %s; use 'simpy' or 'heap'." % engine)
+        self.engine = engine
+
+        if engine == "heap":
+            if realtime:
+                raise ValueError("Realtime simulation is only available with the simpy engine.")
+            self.env = Scheduler(initial_time=initial_time)
+        elif realtime:
             self.env = simpy.RealtimeEnvironment(initial_time=initial_time)
         else:
             self.env = simpy.Environment(initial_time=initial_time)
 
-        self.env.process(self.__visual_processing__(sentence))
+        if rng is None:
+            if seed is None:
+                seed = int(np.random.randint(2**63 - 1, dtype=np.int64))
+            rng = RandomStream(seed)
+        self.rng = rng # random numbers of this simulation
+        self.seed = rng.seed
+
+        sentence = Sentence.of(sentence) # validated once
+        self.__sentence = sentence
+        self.__lexical = ut.lexical_times(sentence, self.model_parameters) # base times of L1 and L2 (shared by simulations of the sentence)
+
+        if engine == "heap":
+            # state of visual processing (local variables of __visual_processing__ in the simpy engine)
+            self.__word_index = 0
+            self.__first_letter = 1
+            self.__new_fixation_point = 0.5 + sentence.lengths[0]/2 # the middle of the first word (see __visual_processing__)
+            self.__next_word = 0
+            self.__saccade_target = None
+            self.env.schedule(0, self.__start_word__)
+        else:
+            self.env.process(self.__visual_processing__(sentence))
         self.fixation_point = initial_fixation #the point at which fixation starts (default = 1 = the first letter)
         self.attended_word = None #what word is currently attended?
         self.fixated_word = None #what word is currently fixated?
-        self.last_action = None # what was the last action?
         self.trace = trace # should we print trace?
+        self.__last_event = None # what was the last action (as a record, see last_action)?
         self.__canbeinterrupted = True
         self.__plan_sacade = False
         self.__saccade = None
         self.__repeated_attention = 0 # time on repeated attention due to integration failure
         self.__fixation_launch_site = 0
-        self.__word__position_dict = {}
+        self.layout = Layout.of(sentence, layout) # positions of words
+        self.events = EventRecorder(self.layout.tokens) if record else None # all events, if recorded
 
-        position = 1
-        for word in sentence:
-            self.__word__position_dict[(position, position+1+len(word.token))] = word.token
-            position += 1+len(word.token)
+        if stats is True:
+            stats = Stats()
+        self.stats = stats or None # counters and timers, if instrumented
+        if self.stats is not None:
+            self.stats.simulations += 1
 
-        for position in self.__word__position_dict:
-            if initial_fixation >= position[0] and initial_fixation <= position[1]:
-                self.fixated_word = self.__word__position_dict[position]
-                break
+        fixated = self.layout.word_at(initial_fixation)
+        if fixated is not None:
+            self.fixated_word = self.layout.tokens[fixated]
+
+        if self.events is not None:
+            self.events.append(FIXATION, ZEROTH_WORD if fixated is None else fixated, self.time, initial_fixation, initial_fixation)
+
+        self.regions = regions
+        self.measures = Measures(len(self.layout)) if measures or regions is not None else None # measures of words, if computed
+        if self.measures is not None:
+            self.measures.fixate(word_of(self.layout, initial_fixation), self.time)
 
     @property
     def time(self):
@@ -85,6 +148,23 @@ class Simulation(object):
         """
         return 1000*self.env.now
 
+    @property
+    def last_action(self):
+        """
+        The last action (namedtuple Action), built only when asked for.
+        """
+        if self.__last_event is None:
+            return None
+        return describe(self.layout.tokens, *self.__last_event)
+
+    def __word__(self, word):
+        """
+        Word with the index word; ZEROTH_WORD gives the zeroth word (outside of the text).
+        """
+        if word == ZEROTH_WORD:
+            return NONE_WORD
+        return self.__sentence[word]
+
     def __timeout__(self, time_in_ms):
         """
         Translate from ms to s and create a timeout event.
@@ -92,29 +172,80 @@ class Simulation(object):
         """
         return self.env.timeout(time_in_ms/1000)
 
-    def __collect_action__(self, action):
+    def __noisy__(self, time_in_ms):
+        """
+        Duration with noise (if noise is switched on).
+        :param time_in_ms: mean duration (in ms)
+        """
+        if self.noise is None:
+            return time_in_ms
+        return time_in_ms*self.rng.factor(self.noise, self.model_parameters["noise_cv"])
+
+    def __collect_action__(self, event, word, target=math.nan):
         """
-        Collect action and print if trace parameter of the model set to True.
-        :param action: namedtuple Action
+        Collect action, record it if events are recorded and print if trace parameter of the model set to True.
+        :param event: code of the event (see ezreader.recording)
+        :param word: index of the word
+        :param target: where a saccade goes (only for saccades)
         """
-        self.last_action = action
+        self.__last_event = (event, word, self.time, self.fixation_point, target)
+
+        if self.events is not None:
+            self.events.append(*self.__last_event)
+
+        if self.stats is not None and not self.resolved: # events after the regions are resolved are not counted (the engines stop at different points of the step)
+            self.stats.event(event)
 
         if self.trace:
             print(self.last_action)
 
-    def __prepare_saccade__(self, new_fixation_point, word, canbeinterrupted=True):
+    def __start_saccade__(self, new_fixation_point, word, canbeinterrupted=True):
         """
-        Prepare saccade. This function checks if a saccade can be interrupted, interrupts it if possible and sends a request to start a new saccade.
+        Start saccadic programming: a new process in the simpy engine, the first event of M1 carrying a cancellable token in the heap engine.
         """
-        if self.__canbeinterrupted:
+        if self.engine == "simpy":
+            self.__saccade = self.env.process(self.__saccadic_programming__(new_fixation_point=new_fixation_point, word=word, canbeinterrupted=canbeinterrupted))
+
+        else:
+            self.__collect_action__(STARTED_SACCADE, word, new_fixation_point)
 
+            self.__canbeinterrupted = canbeinterrupted
+            self.__saccade = Token()
+            self.__saccade_target = (new_fixation_point, word)
+            self.__schedule__(self.__noisy__(self.model_parameters['saccade_programming']), self.__saccade_programmed__, new_fixation_point, word, canbeinterrupted, token=self.__saccade)
+
+    def __interrupt_saccade__(self):
+        """
+        Interrupt the labile stage of saccadic programming (M1) if it is going on.
+        """
+        if self.engine == "simpy":
             # try to interrupt unless __saccade is None (at start) or RunTimeError (it was already terminated by some other process)
             try:
                 self.__saccade.interrupt()
             except (AttributeError, RuntimeError):
                 pass
-            if (float(self.fixation_point) <  float(new_fixation_point) - len(word)/2) or (float(self.fixation_point) >  float(new_fixation_point) + len(word)/2): # start a saccade only if fixation away from the current word
-                self.__saccade = self.env.process(self.__saccadic_programming__(new_fixation_point=new_fixation_point, word=word, canbeinterrupted=canbeinterrupted))
+
+        elif self.__saccade is not None:
+            self.__saccade.cancel()
+            self.__saccade = None
+            new_fixation_point, word = self.__saccade_target
+            self.__collect_action__(INTERRUPTED_SACCADE, word, new_fixation_point)
+            self.__canbeinterrupted = True
+
+    def __prepare_saccade__(self, new_fixation_point, word, canbeinterrupted=True):
+        """
+        Prepare saccade. This function checks if a saccade can be interrupted, interrupts it if possible and sends a request to start a new saccade.
+
+        :param new_fixation_point: where to move (in number of letters)
+        :param word: index of the word the saccade goes to
+        """
+        if self.__canbeinterrupted:
+
+            self.__interrupt_saccade__()
+
+            wordlength = len(self.__word__(word).token)
+            if (float(self.fixation_point) <  float(new_fixation_point) - wordlength/2) or (float(self.fixation_point) >  float(new_fixation_point) + wordlength/2): # start a saccade only if fixation away from the current word
+                self.__start_saccade__(new_fixation_point=new_fixation_point, word=word, canbeinterrupted=canbeinterrupted)
 
         # mark that the next saccade should be started if saccade is going on but cannot be interrupted
         else:
@@ -126,13 +257,13 @@ class Simulation(object):
         Generator simulating saccadic programming.
 
         :param new_fixation_point: where to move (in number of letters)
-        :param word: what word is saccade into
+        :param word: index of the word the saccade goes to
         """
-        self.__collect_action__(Action('Started saccade', " ".join(['Planned saccade:', str(self.fixation_point), '->',  str(new_fixation_point), 'Word:', word]), self.time))
+        self.__collect_action__(STARTED_SACCADE, word, new_fixation_point)
 
         # labile saccade programming M1 (unless canbeinterrupted is specified as False)
         self.__canbeinterrupted = canbeinterrupted
-        tM1 = self.model_parameters['saccade_programming'] #tM1, see p. 5
+        tM1 = self.__noisy__(self.model_parameters['saccade_programming']) #tM1, see p. 5
 
         try:
             # try to run the full M1 process
@@ -140,111 +271,141 @@ class Simulation(object):
 
         except simpy.Interrupt:
             # unless it was interrupted; in that case, stop
-            self.__collect_action__(Action('Interrupted saccade programming', " ".join(['Planned saccade:', str(self.fixation_point), '->',  str(new_fixation_point), 'Word:', word]), self.time))
+            self.__collect_action__(INTERRUPTED_SACCADE, word, new_fixation_point)
             self.__canbeinterrupted = True
 
         else:
 
             # if the process was not interrupted, proceed to M2 (non-labile process)
             self.__canbeinterrupted = False
-            self.__collect_action__(Action('Saccade programming finished', " ".join(['Planned saccade:', str(self.fixation_point), '->',  str(new_fixation_point), 'Word:', word]), self.time))
+            self.__collect_action__(FINISHED_PROGRAMMING, word, new_fixation_point)
 
-            tM2 = self.model_parameters['saccade_finishing'] #tM2
+            tM2 = self.__noisy__(self.model_parameters['saccade_finishing']) #tM2
 
             yield self.__timeout__(tM2)
 
-            self.__collect_action__(Action('Saccade finished', " ".join(['Planned saccade:', str(self.fixation_point), '->',  str(new_fixation_point), 'Word:', word]), self.time))
-            
+            self.__collect_action__(FINISHED_SACCADE, word, new_fixation_point)
 
-            intended_saccade_length = abs(self.fixation_point - new_fixation_point)
+            self.__move_eyes__(new_fixation_point)
 
-            systematic_error = (OPTIMAL_SACCADE_LENGTH - intended_saccade_length) * ( (self.model_parameters["omega1"] - math.log(self.time - self.__fixation_launch_site)) / (self.model_parameters["omega2"]))
+            self.__continue_saccades__(new_fixation_point, word, canbeinterrupted)
 
-            self.__fixation_launch_site = self.time
+    def __move_eyes__(self, new_fixation_point):
+        """
+        Move the eyes at the end of a saccade, adding systematic and random error to the intended fixation point.
+        """
+        launch_site = self.fixation_point
 
-            self.fixation_point = normal( new_fixation_point + systematic_error, self.model_parameters["eta1"] + self.model_parameters["eta2"]*intended_saccade_length)
-            
-            # store what word is now fixated
-            for position in self.__word__position_dict:
-                if self.fixation_point >= position[0] and self.fixation_point <= position[1]:
-                    self.fixated_word = self.__word__position_dict[position]
-                    break
-
-            # finally, if there was meanwhile request for another saccade (by __plan_saccade), start executing it now; otherwise set __saccade at done (None, the starting point)
-            if self.__plan_sacade:
-                self.__saccade = self.env.process(self.__saccadic_programming__(new_fixation_point=self.__plan_sacade[0], word=self.__plan_sacade[1], canbeinterrupted=self.__plan_sacade[2]))
-                self.__plan_sacade = False
-            else:
+        # between lines (return sweeps), the length is horizontal, long sweeps to the left undershoot to the right and the eyes land on the line of the target (see ezreader.layout)
+        if self.layout.n_lines == 1:
+            intended_saccade_length, direction, lowest, highest = abs(self.fixation_point - new_fixation_point), 1, -math.inf, math.inf
+        else:
+            intended_saccade_length, direction, lowest, highest = self.layout.saccade(self.fixation_point, new_fixation_point)
 
-                # now two situations: either refixation, or done;
-                random_draw = uniform()
-                if self.model_parameters["lambda"] * abs(self.fixation_point - new_fixation_point) >= random_draw:
-                    self.__saccade = self.env.process(self.__saccadic_programming__(new_fixation_point=new_fixation_point, word=word, canbeinterrupted=canbeinterrupted))
-                else:
-                    self.__saccade = None
-                    self.__canbeinterrupted = True
+        systematic_error = direction * (OPTIMAL_SACCADE_LENGTH - intended_saccade_length) * ( (self.model_parameters["omega1"] - math.log(self.time - self.__fixation_launch_site)) / (self.model_parameters["omega2"]))
+
+        self.__fixation_launch_site = self.time
+
+        self.fixation_point = min(max(self.rng.normal( new_fixation_point + systematic_error, self.model_parameters["eta1"] + self.model_parameters["eta2"]*intended_saccade_length), lowest), highest)
 
-    def __integration__(self, last_letter, new_fixation_point, new_fixation_point2, elem, elem_for_attention, next_elem):
+        # store what word is now fixated (if the fixation is outside of the sentence, the last fixated word is kept)
+        fixated = self.layout.word_at(self.fixation_point)
+        if fixated is not None:
+            self.fixated_word = self.layout.tokens[fixated]
+
+        if self.events is not None:
+            self.events.append(FIXATION, ZEROTH_WORD if fixated is None else fixated, self.time, launch_site, self.fixation_point)
+
+        if self.stats is not None and not self.resolved: # counted before the fixation can resolve the regions
+            self.stats.fixation(launch_site, self.fixation_point)
+
+        if self.measures is not None:
+            self.measures.fixate(word_of(self.layout, self.fixation_point), self.time)
+
+    def __continue_saccades__(self, new_fixation_point, word, canbeinterrupted):
+        """
+        After a saccade: if there was meanwhile request for another saccade (by __plan_saccade), start executing it now; otherwise either refixate or set __saccade at done (None, the starting point).
+        """
+        if self.__plan_sacade:
+            new_saccade = self.__plan_sacade
+            self.__plan_sacade = False
+            self.__start_saccade__(new_fixation_point=new_saccade[0], word=new_saccade[1], canbeinterrupted=new_saccade[2])
+        else:
+
+            # now two situations: either refixation, or done;
+            random_draw = self.rng.uniform()
+            if self.model_parameters["lambda"] * abs(self.fixation_point - new_fixation_point) >= random_draw:
+                if self.stats is not None and not self.resolved:
+                    self.stats.refixations += 1
+                self.__start_saccade__(new_fixation_point=new_fixation_point, word=word, canbeinterrupted=canbeinterrupted)
+            else:
+                self.__saccade = None
+                self.__canbeinterrupted = True
+
+    def __integration__(self, last_letter, new_fixation_point, new_fixation_point2, word, word_for_attention, next_word):
         """
         Generator simulating integration.
 
         :param first_letter: first_letter of the word to which attention will be directed
         :param new_fixation_point: where to move in case of regression
         :param new_fixation_point2: where to move in case of done regression and moving forward
-        :param elem: what element is being integrated (Word)
-        :param elem_for_attention: what element will be attended to when failure
-        :param next_elem: what element the attention will jump onto after success in reintegration
+        :param word: what element is being integrated (index of Word)
+        :param word_for_attention: what element will be attended to when failure (index of Word; ZEROTH_WORD is outside of the text)
+        :param next_word: what element the attention will jump onto after success in reintegration (index of Word)
         """
-        self.__collect_action__(Action('Started integration', " ".join(["Word:", str(elem.token)]), self.time))
+        elem = self.__word__(word)
 
-        yield self.__timeout__(float(elem.integration_time))
+        self.__collect_action__(STARTED_INTEGRATION, word)
+
+        yield self.__timeout__(self.__noisy__(elem.integration_time))
         
-        random_draw = uniform()
+        random_draw = self.rng.uniform()
 
         # two options - either failed integration or successful
-        if float(elem.integration_failure) >= random_draw:
+        if elem.integration_failure >= random_draw:
         
-            self.__collect_action__(Action('Failed integration', " ".join(["Word:", str(elem.token)]), self.time))
+            self.__collect_action__(FAILED_INTEGRATION, word)
 
             # if failed integration, start saccade back to that word and attend the word again
-            self.__prepare_saccade__(new_fixation_point, str(elem_for_attention.token), canbeinterrupted=False)
-            self.env.process(self.__attend_again__(last_letter, new_fixation_point2, elem=elem_for_attention, next_elem=next_elem))
+            self.__prepare_saccade__(new_fixation_point, word_for_attention, canbeinterrupted=False)
+            self.env.process(self.__attend_again__(last_letter, new_fixation_point2, word=word_for_attention, next_word=next_word))
 
         else:
 
-            self.__collect_action__(Action('Successful integration', " ".join(["Word:", str(elem.token)]), self.time))
+            self.__collect_action__(SUCCESSFUL_INTEGRATION, word)
 
 
 
-    def __attend_again__(self, last_letter, new_fixation_point, elem, next_elem):
+    def __attend_again__(self, last_letter, new_fixation_point, word, next_word):
         """
         Attend the non-integrated word again.
         """
-        old_attended_word = str(elem.token)
+        elem = self.__word__(word)
+        old_attended_word = elem.token
         if self.attended_word != old_attended_word:
-            time_attention_shift = self.model_parameters["time_attention_shift"]
+            time_attention_shift = self.__noisy__(self.model_parameters["time_attention_shift"])
 
             yield self.__timeout__(time_attention_shift)
             self.attended_word = elem
             
-            self.__collect_action__(Action('Attention shift', " ".join(["To word:", str(elem.token)]), self.time))
+            self.__collect_action__(ATTENTION_SHIFT_BACK, word)
 
         # check first if you attend outside of the text (zeroth word)
-        if elem.token == "None":
+        if word == ZEROTH_WORD:
             time_familiarity_check = 50 # just some small number for familiarity if we jump out of text
             self.__repeated_attention += time_familiarity_check
             yield self.__timeout__(time_familiarity_check)
 
-            self.__collect_action__(Action('L1 FAKE', " ".join(["Word:", str(self.attended_word.token)]), self.time))
+            self.__collect_action__(L1_FAKE, word)
 
-            self.__prepare_saccade__(new_fixation_point, str(next_elem.token))
+            self.__prepare_saccade__(new_fixation_point, next_word)
                 
         # otherwise proceed with the standard attention
         else:
             
             distance = last_letter - self.fixation_point
             
-            random_draw = uniform()
+            random_draw = self.rng.uniform()
 
             # calculate L1, either 0 or time according to the formula in ut
             # probably should be zero when you reattend, since the word is familiar already?
@@ -256,30 +417,32 @@ class Simulation(object):
                 time_familiarity_check = 0
 
             else:
-                time_familiarity_check = ut.time_familiarity_check(distance=distance, wordlength=len(elem.token), frequency=elem.frequency, predictability=elem.predictability, eccentricity=self.model_parameters['eccentricity'], alpha1=self.model_parameters['alpha1'], alpha2=self.model_parameters['alpha2'], alpha3=self.model_parameters['alpha3'])
+                time_familiarity_check = self.__noisy__(ut.adjust_familiarity_check(self.__lexical.familiarity_check[word], distance=distance, wordlength=len(elem.token), eccentricity=self.model_parameters['eccentricity']))
             
             self.__repeated_attention += time_familiarity_check
             
             yield self.__timeout__(time_familiarity_check)
 
-            self.__collect_action__(Action('L1', " ".join(["Word:", str(self.attended_word.token)]), self.time))
+            self.__collect_action__(L1, word)
                 
-            self.__prepare_saccade__(new_fixation_point, str(next_elem.token))
+            self.__prepare_saccade__(new_fixation_point, next_word)
 
             # calculate L2, time according to the formula in ut
-            time_lexical_access = ut.time_lexical_access(frequency=elem.frequency, predictability=elem.predictability, delta=self.model_parameters['delta'], alpha1=self.model_parameters['alpha1'], alpha2=self.model_parameters['alpha2'], alpha3=self.model_parameters['alpha3'])
+            time_lexical_access = self.__noisy__(self.__lexical.lexical_access[word])
                 
             self.__repeated_attention += time_lexical_access
 
             yield self.__timeout__(time_lexical_access)
 
-            self.__collect_action__(Action('L2', " ".join(["Word:", str(self.attended_word.token)]), self.time))
+            self.__collect_action__(L2, word)
         
-            self.__repeated_attention += float(elem.integration_time)
+            integration_time = self.__noisy__(elem.integration_time)
+
+            self.__repeated_attention += integration_time
         
-            yield self.__timeout__(float(elem.integration_time))
+            yield self.__timeout__(integration_time)
             
-            self.__collect_action__(Action('Successful integration', " ".join(["Word:", str(elem.token)]), self.time))
+            self.__collect_action__(SUCCESSFUL_INTEGRATION, word)
             
             # reset attended word to continue in normal way
             self.attended_word = old_attended_word
@@ -292,19 +455,23 @@ class Simulation(object):
         """
         first_letter = 1
 
+        # where attention goes after repeated integration while there is no next word (a sentence of one word): the middle of the word, as for the last word of longer sentences
+        next_word = 0
+        new_fixation_point = first_letter - 0.5 + sentence.lengths[0]/2
+
         for i, elem in enumerate(sentence):
             self.attended_word = elem
             # calculate distance from the current fixation to the first letter of the word
             distance = first_letter - self.fixation_point
             
             # calculate L1, either 0 or time according to the formula in ut
-            random_draw = uniform()
+            random_draw = self.rng.uniform()
 
-            if float(elem.predictability) > random_draw:
+            if elem.predictability > random_draw:
                 time_familiarity_check = 0
 
             else:
-                time_familiarity_check = ut.time_familiarity_check(distance=distance, wordlength=len(elem.token), frequency=elem.frequency, predictability=float(elem.predictability), eccentricity=self.model_parameters['eccentricity'], alpha1=self.model_parameters['alpha1'], alpha2=self.model_parameters['alpha2'], alpha3=self.model_parameters['alpha3'])
+                time_familiarity_check = self.__noisy__(ut.adjust_familiarity_check(self.__lexical.familiarity_check[i], distance=distance, wordlength=len(elem.token), eccentricity=self.model_parameters['eccentricity']))
 
             yield self.__timeout__(time_familiarity_check)
             
@@ -312,24 +479,20 @@ class Simulation(object):
             
             self.__repeated_attention = 0
 
-            self.__collect_action__(Action('L1', " ".join(["Word:", str(elem.token)]), self.time))
+            self.__collect_action__(L1, i)
 
             #start programming movement to the next word
 
-            try:
+            if i+1 < len(sentence):
                 # if there is a next word, store that info
-                next_elem = sentence[i+1]
-
-            except IndexError:
-                pass
+                next_word = i+1
 
-            else:
-                new_fixation_point = first_letter + len(elem.token) + 0.5 + len(next_elem.token)/2 # move to the middle of the next word
+                new_fixation_point = first_letter + len(elem.token) + 0.5 + sentence.lengths[next_word]/2 # move to the middle of the next word
 
-                self.__prepare_saccade__(new_fixation_point, str(next_elem.token))
+                self.__prepare_saccade__(new_fixation_point, next_word)
 
             # calculate L2, time according to the formula in ut
-            time_lexical_access = ut.time_lexical_access(frequency=elem.frequency, predictability=elem.predictability, delta=self.model_parameters['delta'], alpha1=self.model_parameters['alpha1'], alpha2=self.model_parameters['alpha2'], alpha3=self.model_parameters['alpha3'])
+            time_lexical_access = self.__noisy__(self.__lexical.lexical_access[i])
 
             yield self.__timeout__(time_lexical_access)
             
@@ -337,32 +500,31 @@ class Simulation(object):
             
             self.__repeated_attention = 0
 
-            self.__collect_action__(Action('L2', " ".join(["Word:", str(elem.token)]), self.time))
+            self.__collect_action__(L2, i)
             ########################
             #  start integration   #
             ########################
 
             if i > 0:
                 # if there is a previous word, store that info, needed for integration
-                prev_pos = first_letter - 0.5 - len(sentence[i-1].token)/2
-                prev_word = sentence[i-1].token
+                prev_pos = first_letter - 0.5 - sentence.lengths[i-1]/2
             else:
                 prev_pos = 0
-                prev_elem = Word('None', 1e06, 1, 0, 0)
 
-            random_draw = uniform()
+            random_draw = self.rng.uniform()
 
             # this checks whether, in case of failure, you will regress to the actual word or one word before that (simplifying assumption about regressions)
+            # (the regression in front of the word attends the zeroth word, outside of the text)
             if float(self.model_parameters["probability_correct_regression"]) >= random_draw:
-                self.env.process(self.__integration__(last_letter=first_letter+len(elem.token), new_fixation_point=first_letter - 0.5 + len(elem.token)/2, new_fixation_point2=new_fixation_point, elem=elem, elem_for_attention=elem, next_elem=next_elem))
+                self.env.process(self.__integration__(last_letter=first_letter+len(elem.token), new_fixation_point=first_letter - 0.5 + len(elem.token)/2, new_fixation_point2=new_fixation_point, word=i, word_for_attention=i, next_word=next_word))
             else:
-                self.env.process(self.__integration__(last_letter=first_letter - 2,new_fixation_point=prev_pos, new_fixation_point2=new_fixation_point, elem=elem, elem_for_attention=prev_elem, next_elem=next_elem))
+                self.env.process(self.__integration__(last_letter=first_letter - 2,new_fixation_point=prev_pos, new_fixation_point2=new_fixation_point, word=i, word_for_attention=ZEROTH_WORD, next_word=next_word))
 
             ########################
             #   end integration    #
             ########################
 
-            time_attention_shift = self.model_parameters["time_attention_shift"]
+            time_attention_shift = self.__noisy__(self.model_parameters["time_attention_shift"])
 
             yield self.__timeout__(time_attention_shift)
             
@@ -370,22 +532,395 @@ class Simulation(object):
 
             self.__repeated_attention = 0
 
-            self.__collect_action__(Action('Attention shift', " ".join(["From word:", str(elem.token)]), self.time))
+            self.__collect_action__(ATTENTION_SHIFT, i)
 
             first_letter += len(elem.token) + 1 #set the first letter of the new word (assuming 1 space btwn words)
 
+    def __schedule__(self, time_in_ms, callback, *args, token=None):
+        """
+        Translate from ms to s and schedule an event (heap engine).
+        :param time_in_ms: time (in ms)
+        :param callback: method called when the event happens
+        :param token: Token; if it is cancelled, the callback is not called (the event only advances the clock)
+        """
+        self.env.schedule(time_in_ms/1000, callback, *args, token=token)
+
+    def __after_repeated_attention__(self, callback, *args):
+        """
+        Wait for the extra time of repeated processing of some previous word, then call callback (heap engine).
+        """
+        self.__schedule__(self.__repeated_attention, self.__repeated_attention_done__, callback, *args)
+
+    def __repeated_attention_done__(self, callback, *args):
+        self.__repeated_attention = 0
+        callback(*args)
+
+    def __saccade_programmed__(self, new_fixation_point, word, canbeinterrupted):
+        """
+        Labile saccade programming M1 finished, proceed to M2 (heap engine).
+        """
+        self.__saccade = None
+        self.__canbeinterrupted = False
+        self.__collect_action__(FINISHED_PROGRAMMING, word, new_fixation_point)
+
+        self.__schedule__(self.__noisy__(self.model_parameters['saccade_finishing']), self.__saccade_finished__, new_fixation_point, word, canbeinterrupted)
+
+    def __saccade_finished__(self, new_fixation_point, word, canbeinterrupted):
+        """
+        Non-labile saccade programming M2 finished, move the eyes (heap engine).
+        """
+        self.__collect_action__(FINISHED_SACCADE, word, new_fixation_point)
+
+        self.__move_eyes__(new_fixation_point)
+
+        self.__continue_saccades__(new_fixation_point, word, canbeinterrupted)
+
+    def __start_integration__(self, last_letter, new_fixation_point, new_fixation_point2, word, word_for_attention, next_word):
+        """
+        Start integration (heap engine); see __integration__ for parameters.
+        """
+        self.__collect_action__(STARTED_INTEGRATION, word)
+
+        self.__schedule__(self.__noisy__(self.__sentence.integration_time[word]), self.__integration_done__, last_letter, new_fixation_point, new_fixation_point2, word, word_for_attention, next_word)
+
+    def __integration_done__(self, last_letter, new_fixation_point, new_fixation_point2, word, word_for_attention, next_word):
+        """
+        Finish integration, either successfully or by a failure and a regression (heap engine).
+        """
+        random_draw = self.rng.uniform()
+
+        if self.__sentence.integration_failure[word] >= random_draw:
+
+            self.__collect_action__(FAILED_INTEGRATION, word)
+
+            self.__prepare_saccade__(new_fixation_point, word_for_attention, canbeinterrupted=False)
+            self.__start_attend_again__(last_letter, new_fixation_point2, word=word_for_attention, next_word=next_word)
+
+        else:
+
+            self.__collect_action__(SUCCESSFUL_INTEGRATION, word)
+
+    def __start_attend_again__(self, last_letter, new_fixation_point, word, next_word):
+        """
+        Attend the non-integrated word again (heap engine); see __attend_again__.
+        """
+        if self.attended_word != self.__word__(word).token:
+            self.__schedule__(self.__noisy__(self.model_parameters["time_attention_shift"]), self.__attention_shifted_again__, last_letter, new_fixation_point, word, next_word)
+        else:
+            self.__reattend__(last_letter, new_fixation_point, word, next_word)
+
+    def __attention_shifted_again__(self, last_letter, new_fixation_point, word, next_word):
+        self.attended_word = self.__word__(word)
+
+        self.__collect_action__(ATTENTION_SHIFT_BACK, word)
+
+        self.__reattend__(last_letter, new_fixation_point, word, next_word)
+
+    def __reattend__(self, last_letter, new_fixation_point, word, next_word):
+        """
+        Start L1 of the word attended again (heap engine).
+        """
+        # check first if you attend outside of the text (zeroth word)
+        if word == ZEROTH_WORD:
+            time_familiarity_check = 50 # just some small number for familiarity if we jump out of text
+            self.__repeated_attention += time_familiarity_check
+            self.__schedule__(time_familiarity_check, self.__fake_familiarity_checked__, new_fixation_point, word, next_word)
+
+        else:
+            elem = self.__sentence[word]
+
+            distance = last_letter - self.fixation_point
+
+            random_draw = self.rng.uniform()
+
+            # as in __attend_again__, predictability is close to 1 the second time around, hence L1 mostly skipped
+            if self.model_parameters["predictability_repeated_attention"] > random_draw:
+                time_familiarity_check = 0
+
+            else:
+                time_familiarity_check = self.__noisy__(ut.adjust_familiarity_check(self.__lexical.familiarity_check[word], distance=distance, wordlength=len(elem.token), eccentricity=self.model_parameters['eccentricity']))
+
+            self.__repeated_attention += time_familiarity_check
+
+            self.__schedule__(time_familiarity_check, self.__familiarity_checked_again__, new_fixation_point, word, next_word)
+
+    def __fake_familiarity_checked__(self, new_fixation_point, word, next_word):
+        self.__collect_action__(L1_FAKE, word)
+
+        self.__prepare_saccade__(new_fixation_point, next_word)
+
+    def __familiarity_checked_again__(self, new_fixation_point, word, next_word):
+        elem = self.__sentence[word]
+
+        self.__collect_action__(L1, word)
+
+        time_lexical_access = self.__noisy__(self.__lexical.lexical_access[word])
+
+        self.__repeated_attention += time_lexical_access
+
+        self.__schedule__(time_lexical_access, self.__lexical_access_done_again__, word)
+
+        self.__prepare_saccade__(new_fixation_point, next_word)
+
+    def __lexical_access_done_again__(self, word):
+        self.__collect_action__(L2, word)
+
+        integration_time = self.__noisy__(self.__sentence.integration_time[word])
+
+        self.__repeated_attention += integration_time
+
+        self.__schedule__(integration_time, self.__integrated_again__, word)
+
+    def __integrated_again__(self, word):
+        self.__collect_action__(SUCCESSFUL_INTEGRATION, word)
+
+        # reset attended word to continue in normal way
+        self.attended_word = self.__sentence.tokens[word]
+
+    def __start_word__(self):
+        """
+        Start visual processing of the next word, L1 (heap engine; one cycle of __visual_processing__ is split in the following methods).
+        """
+        if self.__word_index >= len(self.__sentence):
+            return
+
+        elem = self.__sentence[self.__word_index]
+        self.attended_word = elem
+        # calculate distance from the current fixation to the first letter of the word
+        distance = self.__first_letter - self.fixation_point
+
+        # calculate L1, either 0 or time according to the formula in ut
+        random_draw = self.rng.uniform()
+
+        if elem.predictability > random_draw:
+            time_familiarity_check = 0
+
+        else:
+            time_familiarity_check = self.__noisy__(ut.adjust_familiarity_check(self.__lexical.familiarity_check[self.__word_index], distance=distance, wordlength=len(elem.token), eccentricity=self.model_parameters['eccentricity']))
+
+        self.__schedule__(time_familiarity_check, self.__after_repeated_attention__, self.__familiarity_checked__, self.__word_index)
+
+    def __familiarity_checked__(self, i):
+        """
+        L1 done, calculate L2 and start programming movement to the next word (heap engine).
+        """
+        elem = self.__sentence[i]
+
+        self.__collect_action__(L1, i)
+
+        time_lexical_access = self.__noisy__(self.__lexical.lexical_access[i])
+
+        self.__schedule__(time_lexical_access, self.__after_repeated_attention__, self.__lexical_access_done__, i)
+
+        # if there is a next word, move to the middle of it
+        if i + 1 < len(self.__sentence):
+            self.__next_word = i + 1
+            self.__new_fixation_point = self.__first_letter + len(elem.token) + 0.5 + self.__sentence.lengths[i+1]/2
+
+            self.__prepare_saccade__(self.__new_fixation_point, self.__next_word)
+
+    def __lexical_access_done__(self, i):
+        """
+        L2 done, start integration and shift attention (heap engine).
+        """
+        elem = self.__sentence[i]
+
+        self.__collect_action__(L2, i)
+
+        first_letter = self.__first_letter
+
+        if i > 0:
+            prev_pos = first_letter - 0.5 - self.__sentence.lengths[i-1]/2
+        else:
+            prev_pos = 0
+
+        self.__schedule__(self.__noisy__(self.model_parameters["time_attention_shift"]), self.__after_repeated_attention__, self.__attention_shifted__, i)
+
+        random_draw = self.rng.uniform()
+
+        # in case of failure, regress to the actual word or one word before that (see __visual_processing__)
+        if float(self.model_parameters["probability_correct_regression"]) >= random_draw:
+            self.__start_integration__(last_letter=first_letter+len(elem.token), new_fixation_point=first_letter - 0.5 + len(elem.token)/2, new_fixation_point2=self.__new_fixation_point, word=i, word_for_attention=i, next_word=self.__next_word)
+        else:
+            self.__start_integration__(last_letter=first_letter - 2, new_fixation_point=prev_pos, new_fixation_point2=self.__new_fixation_point, word=i, word_for_attention=ZEROTH_WORD, next_word=self.__next_word)
+
+    def __attention_shifted__(self, i):
+        """
+        Attention shift done, move to the next word (heap engine).
+        """
+        self.__collect_action__(ATTENTION_SHIFT, i)
+
+        self.__first_letter += self.__sentence.lengths[i] + 1 #set the first letter of the new word (assuming 1 space btwn words)
+        self.__word_index += 1
+
+        self.__start_word__()
+
+    @property
+    def resolved(self):
+        """
+        Are the measures of regions final (so that the simulation can stop)?
+        """
+        return self.regions is not None and self.measures.resolved(self.regions)
+
+    def __close_measures__(self, finished):
+        if self.measures is not None:
+            self.measures.close(self.time, finished=finished)
+
+    def __timed_step__(self):
+        """
+        One step of the environment, timed and charged to its process in stats.
+        """
+        start = time.perf_counter()
+        self.env.step() # at the end, EmptySchedule is raised and nothing is charged
+        self.stats.step(time.perf_counter() - start)
+
     def step(self):
         """
-        Make one step through simulation.
+        Make one step through simulation. If the measures of regions are final, the simulation stops (EmptySchedule is raised, as at the end of the simulation).
         """
-        self.env.step()
+        if self.resolved:
+            self.__close_measures__(finished=False)
+            raise simpy.core.EmptySchedule()
+
+        try:
+            if self.stats is None:
+                self.env.step()
+            else:
+                self.__timed_step__()
+        except simpy.core.EmptySchedule:
+            self.__close_measures__(finished=True)
+            raise
 
     def run(self, until):
         """
-        Run simulation.
+        Run simulation (until the measures of regions are final, if regions are given).
         """
+        if self.measures is not None or self.stats is not None:
+            # step, so that the measures are closed at the time of the last event, not at until (and steps are timed)
+            while self.env.peek() < until:
+                if self.resolved:
+                    self.__close_measures__(finished=False)
+                    return
+                if self.stats is None:
+                    self.env.step()
+                else:
+                    self.__timed_step__()
+
+            if self.env.peek() == math.inf:
+                self.__close_measures__(finished=True)
+
         self.env.run(until=until)
 
+    def __clone__(self, rng):
+        """
+        Independent copy of the simulation (heap engine) drawing random numbers from rng. What never changes during a simulation (sentence, layout, lexical times, model parameters) is shared, not copied.
+        """
+        memo = {id(self.rng): rng}
+        for shared in (self.__sentence, self.__lexical, self.layout, self.model_parameters):
+            memo[id(shared)] = shared
+        clone = copy.deepcopy(self, memo) # scheduled events are bound methods, so they are bound to the clone
+        clone.seed = rng.seed
+        return clone
+
+    def snapshot(self, word=None, until=None):
+        """
+        Snapshot of the full state of the simulation (fixation point, saccade programming and planned saccades, repeated attention, scheduled events, measures...), from which independent continuations can be forked (see Snapshot). Only available with the heap engine.
+
+        :param word: if given, first simulate until attention has shifted from the word with this index (its L1, L2 and attention shift are done)
+        :param until: if given, first run until this time (as in run)
+        return: Snapshot
+        """
+        if self.engine != "heap":
+            raise ValueError("Snapshots are only available with the heap engine (simpy processes cannot be copied).")
+
+        if word is not None:
+            try:
+                while self.__word_index <= word:
+                    self.step()
+            except simpy.core.EmptySchedule:
+                pass
+
+        if until is not None:
+            self.run(until)
+
+        return Snapshot(self.__clone__(self.rng))
+
+    def next_use(self):
+        """
+        Which attributes of which word the next event uses for the first time (heap engine): (index of the word, "lexical") if the next event starts L1 of the word (it uses its frequency and predictability), (index of the word, "integration") if it starts its integration (integration time and failure); None for other events.
+
+        First uses come in the order of words, lexical before integration; see ezreader.differential.
+        """
+        event = self.env.next_event() if self.engine == "heap" else None
+        if event is None:
+            return None
+        callback, args = event
+        method = callback.__func__
+        if method is Simulation.__after_repeated_attention__ or method is Simulation.__repeated_attention_done__:
+            method, args = args[0].__func__, args[1:]
+        if method is Simulation.__start_word__:
+            return (self.__word_index, "lexical")
+        if method is Simulation.__attention_shifted__:
+            return (args[0] + 1, "lexical")
+        if method is Simulation.__lexical_access_done__:
+            return (args[0], "integration")
+        return None
+
+    def branch(self, sentence=None):
+        """
+        Copy of the simulation (heap engine) that continues with the same random numbers (the rest of the same stream) and the same model parameters, but with other attributes of words. Events that already happened are kept, so the copy simulates the changed sentence exactly only if the changed attributes were not used yet (see next_use). Model parameters are used from the first event on, so other parameters need a new simulation.
+
+        :param sentence: a Sentence or a list of Words with the same tokens
+        return: Simulation
+        """
+        if self.engine != "heap":
+            raise ValueError("Branches are only available with the heap engine (simpy processes cannot be copied).")
+        clone = self.__clone__(copy.deepcopy(self.rng))
+        if sentence is not None:
+            sentence = Sentence.of(sentence)
+            if sentence.tokens != self.__sentence.tokens:
+                raise ValueError("A branch must have the same tokens as the simulation (only attributes of words can change).")
+            clone.__sentence = sentence
+            clone.__lexical = ut.lexical_times(sentence, clone.model_parameters)
+        return clone
+
+class Snapshot(object):
+    """
+    Frozen state of a simulation. Every fork continues the simulation independently, with its own random numbers, so a shared prefix of trials is simulated only once.
+    """
+
+    def __init__(self, simulation):
+        """
+        :param simulation: the frozen simulation (a copy not used for anything else, see Simulation.snapshot)
+        """
+        self.__simulation = simulation
+        self.time = simulation.time # time of the snapshot in ms
+
+    def fork(self, seed=None, rng=None):
+        """
+        A new simulation continuing from the snapshot.
+
+        :param seed: seed of the random numbers of the continuation; if None, it is drawn from numpy's global random generator (as in Simulation)
+        :param rng: RandomStream to draw random numbers from (instead of creating one from seed)
+        return: Simulation
+        """
+        if rng is None:
+            if seed is None:
+                seed = int(np.random.randint(2**63 - 1, dtype=np.int64))
+            rng = RandomStream(seed)
+        return self.__simulation.__clone__(rng)
+
+    def forks(self, n, seed):
+        """
+        n continuations from the snapshot; the seed of every continuation is derived from seed and its index (as seeds of trials in ezreader.batch).
+
+        return: generator of Simulations
+        """
+        from ezreader.batch import trial_seed
+
+        for index in range(n):
+            yield self.fork(trial_seed(seed, index))
+
 if __name__ == "__main__":
     #examples how to run simulation
     sleeps_fixated = []
@@ -0,0 +1,135 @@
+"""
+Instrumentation of simulations: what the model spends its events and time on.
+
+With stats=True, a simulation counts its events by type, interrupted and completed saccade programs, refixations (the lambda rule), regressive saccades and failed integrations, and measures the wall-clock time of every step, charged to the process whose event the step handled (L1, L2, M1, M2, integration, attention; steps that only pass control, e.g., waiting for repeated attention, are charged to scheduling). Without stats, simulations do not measure anything.
+
+Counts of events are the same in the simpy and heap engines for the same seed; with regions, counting stops at the fixation that makes the measures of regions final, in both engines. Steps are not comparable across engines: a simpy step resumes a process, a heap step calls one callback.
+
+Stats of trials run in different processes are merged with merged:
+
+trials = ezreader.batch.run_trials(sentence, n_trials=1000, workers=4, stats=True)
+print(merged(trial.stats for trial in trials).report())
+"""
+
+from ezreader.recording import EVENTS
+from ezreader.recording import INTERRUPTED_SACCADE, FINISHED_SACCADE, FAILED_INTEGRATION, ATTENTION_SHIFT_BACK, FIXATION
+
+PROCESSES = ('L1', 'L2', 'M1', 'M2', 'integration', 'attention', 'scheduling')
+
+SCHEDULING = PROCESSES.index('scheduling')
+
+# the process to which a step is charged, by the code of the first event of the step
+PROCESS_OF_EVENT = [PROCESSES.index(process) for process in ('M1', 'M1', 'M1', 'M2', 'integration', 'integration', 'integration', 'attention', 'attention', 'L1', 'L1', 'L2', 'M2')]
+
+class Stats(object):
+    """
+    Counters and timers of one or more simulations (see the module).
+    """
+
+    def __init__(self):
+        self.simulations = 0
+        self.events = [0]*len(EVENTS) # number of events, by code (see ezreader.recording)
+        self.refixations = 0 # saccades started again to the same target by the lambda rule
+        self.regressions = 0 # saccades landing left of their launch site
+        self.steps = [0]*len(PROCESSES) # number of steps, by process
+        self.wall_time = [0.0]*len(PROCESSES) # wall-clock time of steps (in s), by process
+        self.__first = None # code of the first event of the running step
+
+    def event(self, code):
+        """
+        Count an event.
+        """
+        self.events[code] += 1
+        if self.__first is None:
+            self.__first = code
+
+    def fixation(self, launch_site, landing_point):
+        """
+        Count a fixation (the end of a saccade).
+        """
+        self.event(FIXATION)
+        if landing_point < launch_site:
+            self.regressions += 1
+
+    def step(self, seconds):
+        """
+        Charge a step that took seconds to the process of its first event.
+        """
+        process = SCHEDULING if self.__first is None else PROCESS_OF_EVENT[self.__first]
+        self.steps[process] += 1
+        self.wall_time[process] += seconds
+        self.__first = None
+
+    @property
+    def completed_saccades(self):
+        return self.events[FINISHED_SACCADE]
+
+    @property
+    def interrupted_saccades(self):
+        return self.events[INTERRUPTED_SACCADE]
+
+    @property
+    def failed_integrations(self):
+        return self.events[FAILED_INTEGRATION]
+
+    def merge(self, other):
+        """
+        Add the counts and times of other to these stats.
+
+        return: self
+        """
+        self.simulations += other.simulations
+        self.refixations += other.refixations
+        self.regressions += other.regressions
+        self.events = [mine + theirs for mine, theirs in zip(self.events, other.events)]
+        self.steps = [mine + theirs for mine, theirs in zip(self.steps, other.steps)]
+        self.wall_time = [mine + theirs for mine, theirs in zip(self.wall_time, other.wall_time)]
+        return self
+
+    def summary(self):
+        """
+        return: dictionary of all counts and times (events by name; steps and wall-clock time by process)
+        """
+        events = {}
+        for code, name in enumerate(EVENTS):
+            if code == ATTENTION_SHIFT_BACK:
+                name = 'Attention shift back'
+            events[name] = self.events[code]
+        return {'simulations': self.simulations, 'events': events, 'completed_saccades': self.completed_saccades, 'interrupted_saccades': self.interrupted_saccades, 'refixations': self.refixations, 'regressions': self.regressions, 'failed_integrations': self.failed_integrations, 'steps': dict(zip(PROCESSES, self.steps)), 'wall_time': dict(zip(PROCESSES, self.wall_time))}
+
+    def report(self):
+        """
+        return: the summary as a printable table
+        """
+        summary = self.summary()
+        n = max(1, self.simulations)
+        lines = ["%d simulations (counts per simulation)" % self.simulations]
+        for name, count in summary['events'].items():
+            lines.append("  %-32s %10.2f" % (name, count/n))
+        for name in ('completed_saccades', 'interrupted_saccades', 'refixations', 'regressions', 'failed_integrations'):
+            lines.append("  %-32s %10.2f" % (name.replace('_', ' '), summary[name]/n))
+        total = sum(self.wall_time) or 1.0
+        lines.append("process        steps/simulation   time/simulation (us)   share of time")
+        for process, steps, seconds in zip(PROCESSES, self.steps, self.wall_time):
+            lines.append("  %-12s %16.2f %22.2f %14.1f%%" % (process, steps/n, 1e06*seconds/n, 100*seconds/total))
+        return "\n".join(lines)
+
+def merged(stats):
+    """
+    Merge stats (e.g., of trials run by different workers); None values are left out.
+
+    return: Stats
+    """
+    total = Stats()
+    for item in stats:
+        if item is not None:
+            total.merge(item)
+    return total
+
+if __name__ == "__main__":
+    #example: where does a simulation of a sentence with frequent integration failures spend its time?
+    from ezreader.batch import run_trials
+    from ezreader.sentence import Word
+    sentence = [Word('john', 5e06, 0.01, 25, 0.3), Word('sleeps', 2e05, 0.01, 25, 0.3), Word('extremely', 1e03, 0.01, 25, 0.3), Word('long', 1e05, 0.01, 25, 0.3)]
+    trials = run_trials(sentence, n_trials=1000, workers=2, seed=1, engine="heap", stats=True)
+    print(merged(trial.stats for trial in trials).report())
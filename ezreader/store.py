@@ -0,0 +1,207 @@
+"""
+Columnar store of simulated trials on disk.
+
+A store is a directory. Results are appended in chunks (e.g., one batch of trials), and every column of a chunk is one .npy file:
+
+fixations: trial, position, word (index of the word as in ezreader.measures: -1 in front of the sentence, number of words after it), start, duration
+trials: time (end of the trial)
+measures: one column per measure (trials x words), see ezreader.measures
+
+A small header (meta.json) holds the tokens of the sentence, a hash of the sentence, the model parameters, the seed and the sizes of chunks. Files of a chunk are written before the header is updated, so an interrupted append leaves the store as it was. Columns are read as memory maps, so only the pages that are used are loaded:
+
+store = ResultStore("results")
+for gaze in store.columns("gaze"): ...
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from ezreader import __version__
+from ezreader.aggregate import Aggregate
+from ezreader.layout import Layout
+from ezreader.measures import MEASURES, word_of, words_of
+from ezreader.sentence import Sentence
+from ezreader.simulation import Simulation
+from ezreader.utilities import write_atomically
+
+FORMAT = 1
+
+META = 'meta.json'
+
+CHUNK = '%s.%05d.npy'
+
+FIXATION_COLUMNS = ('trial', 'position', 'word', 'start', 'duration')
+
+DTYPES = {'trial': np.int64, 'position': np.float64, 'word': np.int32, 'start': np.float64, 'duration': np.float64, 'time': np.float64, 'skipped': np.bool_, 'refixated': np.bool_, 'regression': np.bool_}
+
+def sentence_hash(sentence):
+    """
+    Hash of the words of a sentence (tokens and their attributes).
+    """
+    words = [[str(word.token), float(word.frequency), float(word.predictability), float(word.integration_time), float(word.integration_failure)] for word in sentence]
+    return hashlib.sha256(json.dumps(words).encode()).hexdigest()
+
+def _save(path, values):
+    with open(path, 'wb') as column: # np.save would add .npy to the name of the temporary file
+        np.save(column, values, allow_pickle=False)
+
+def _write_meta(path, meta):
+    def write(temporary):
+        with open(temporary, 'w') as header:
+            json.dump(meta, header, indent=1)
+    write_atomically(os.path.join(path, META), write)
+
+class ResultWriter(object):
+    """
+    Appends chunks of trials to a store (created if it does not exist).
+    """
+
+    def __init__(self, path, sentence, params=None, seed=None, layout=None):
+        """
+        :param path: directory of the store
+        :param sentence: a Sentence or a list of Words
+        :param params: a dictionary of model parameters overriding the default values
+        :param seed: master seed of the simulations (only stored)
+        :param layout: Layout of the sentence (to find words at fixation points); if None, the layout of the sentence
+        """
+        sentence = Sentence.of(sentence)
+        self.path = path
+        self.layout = Layout.of(sentence, layout)
+        parameters = dict(Simulation.model_parameters, **(params or {}))
+
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, META)):
+            with open(os.path.join(path, META)) as header:
+                self.meta = json.load(header)
+            if self.meta['format'] != FORMAT:
+                raise ValueError("%s has format %s; this version reads format %d." % (path, self.meta['format'], FORMAT))
+            if self.meta['sentence_hash'] != sentence_hash(sentence) or self.meta['parameters'] != json.loads(json.dumps(parameters)) or self.meta['seed'] != seed:
+                raise ValueError("%s holds results of a different sentence, parameters or seed; use another directory." % path)
+        else:
+            self.meta = {'format': FORMAT, 'version': __version__, 'tokens': list(sentence.tokens), 'sentence_hash': sentence_hash(sentence), 'parameters': parameters, 'seed': seed, 'columns': {}, 'chunks': []}
+            _write_meta(path, self.meta)
+
+    @property
+    def n_trials(self):
+        return sum(chunk['trials'] for chunk in self.meta['chunks'])
+
+    def append(self, fixations, time, measures):
+        """
+        Append one chunk.
+
+        :param fixations: dictionary of fixation columns (see the module); trial counts from 0 in the chunk
+        :param time: end of every trial (in ms)
+        :param measures: dictionary of arrays (trials x words), as ezreader.measures.stack
+        """
+        n_trials = len(time)
+        columns = {name: np.asarray(fixations[name], dtype=DTYPES[name]) for name in FIXATION_COLUMNS}
+        columns['trial'] = columns['trial'] + self.n_trials # trials are numbered through the whole store
+        columns['time'] = np.asarray(time, dtype=DTYPES['time'])
+        for measure in MEASURES:
+            columns[measure] = np.asarray(measures[measure], dtype=DTYPES.get(measure, np.float64))
+            if columns[measure].shape != (n_trials, len(self.layout)):
+                raise ValueError("%s must be an array of %d trials x %d words." % (measure, n_trials, len(self.layout)))
+
+        chunk = len(self.meta['chunks'])
+        for name, values in columns.items():
+            write_atomically(os.path.join(self.path, CHUNK % (name, chunk)), lambda temporary: _save(temporary, values))
+
+        self.meta['columns'] = {name: values.dtype.str for name, values in columns.items()}
+        self.meta['chunks'].append({'trials': n_trials, 'fixations': len(columns['trial'])})
+        _write_meta(self.path, self.meta)
+
+    def append_simulation(self, simulation):
+        """
+        Append the trials of a VectorizedSimulation after its run.
+        """
+        fixations = simulation.fixations
+        columns = {'trial': fixations['trial'], 'position': fixations['position'], 'word': words_of(self.layout, fixations['position']), 'start': fixations['start'], 'duration': fixations['duration']}
+        self.append(columns, simulation.time, simulation.measures())
+
+    def append_trials(self, trials):
+        """
+        Append Trial records (as returned by ezreader.batch.run_trials).
+        """
+        fixations = [(i, fixation.position, word_of(self.layout, fixation.position), fixation.start, fixation.duration) for i, trial in enumerate(trials) for fixation in trial.fixations]
+        columns = dict(zip(FIXATION_COLUMNS, zip(*fixations))) if fixations else {name: [] for name in FIXATION_COLUMNS}
+        measures = {measure: np.array([getattr(trial.measures, measure) for trial in trials]).reshape(len(trials), len(self.layout)) for measure in MEASURES}
+        self.append(columns, [trial.time for trial in trials], measures)
+
+class ResultStore(object):
+    """
+    Reads a store; columns are memory-mapped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META)) as header:
+            self.meta = json.load(header)
+        if self.meta['format'] != FORMAT:
+            raise ValueError("%s has format %s; this version reads format %d." % (path, self.meta['format'], FORMAT))
+        self.tokens = tuple(self.meta['tokens'])
+        self.parameters = self.meta['parameters']
+        self.seed = self.meta['seed']
+        self.sentence_hash = self.meta['sentence_hash']
+        self.n_chunks = len(self.meta['chunks'])
+        self.n_trials = sum(chunk['trials'] for chunk in self.meta['chunks'])
+        self.n_fixations = sum(chunk['fixations'] for chunk in self.meta['chunks'])
+        self.__first_trials = np.cumsum([0] + [chunk['trials'] for chunk in self.meta['chunks']]) # first trial of every chunk
+
+    def column(self, name, chunk):
+        """
+        One chunk of a column, as a read-only memory map.
+        """
+        if name not in self.meta['columns']:
+            raise ValueError("Unknown column: %s; the store has %s." % (name, ", ".join(self.meta['columns'])))
+        return np.load(os.path.join(self.path, CHUNK % (name, chunk)), mmap_mode='r')
+
+    def columns(self, name):
+        """
+        All chunks of a column, one memory map after another.
+        """
+        for chunk in range(self.n_chunks):
+            yield self.column(name, chunk)
+
+    def read(self, name):
+        """
+        A whole column in memory (concatenated chunks).
+        """
+        return np.concatenate(list(self.columns(name)))
+
+    def fixations(self, trial):
+        """
+        Fixations of one trial (dictionary of fixation columns); only the pages holding the trial are read.
+        """
+        if not 0 <= trial < self.n_trials:
+            raise ValueError("The store has %d trials." % self.n_trials)
+        chunk = int(np.searchsorted(self.__first_trials, trial, side='right')) - 1
+        trials = self.column('trial', chunk)
+        first, last = np.searchsorted(trials, [trial, trial + 1])
+        return {name: np.array(self.column(name, chunk)[first:last]) for name in FIXATION_COLUMNS}
+
+    def aggregate(self, measures=MEASURES, **kwargs):
+        """
+        Aggregate of measures of all trials, chunk by chunk (see ezreader.aggregate.Aggregate; other arguments are passed to it).
+        """
+        aggregate = Aggregate(len(self.tokens), measures, **kwargs)
+        for chunk in range(self.n_chunks):
+            aggregate.add({measure: self.column(measure, chunk) for measure in measures})
+        return aggregate
+
+if __name__ == "__main__":
+    #example: store 10 batches of 10,000 trials and read the gaze durations of the second word without loading everything
+    import tempfile
+    from ezreader.batch import trial_seed
+    from ezreader.sentence import Word
+    from ezreader.vectorized import VectorizedSimulation
+    sentence = Sentence([Word('john', 5e06, 0.01, 25, 0.01), Word('sleeps', 2e05, 0.01, 25, 0.01)])
+    path = tempfile.mkdtemp()
+    writer = ResultWriter(path, sentence, seed=1)
+    for batch in range(10):
+        writer.append_simulation(VectorizedSimulation(sentence, 10000, seed=trial_seed(1, batch)).run())
+    store = ResultStore(path)
+    print(store.n_trials, store.n_fixations, sum(np.nansum(gaze[:, 1]) for gaze in store.columns('gaze')) / store.n_trials)
+    print(store.fixations(12345))
@@ -0,0 +1,162 @@
+"""
+Parameter sweeps of E-Z reader with a persistent cache of results.
+
+A sweep runs a list of parameter sets (for example, a grid). Every parameter set is simulated with VectorizedSimulation and its aggregated results (mean eye-movement measures of words and the mean time of trials) are stored on disk, keyed by a hash of the sentence, the parameters, the number of trials and the seed. Re-running a sweep (after a crash, or with an overlapping grid) only simulates the parameter sets that are not in the cache yet.
+
+Parameter sets are dictionaries. Keys are names of model parameters (see Simulation.model_parameters) or pairs (index of word, attribute of Word), e.g. {"alpha1": 100, (3, "integration_time"): 50}.
+"""
+
+from collections import namedtuple
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import tempfile
+
+import numpy as np
+
+from ezreader.measures import summary
+from ezreader.simulation import Simulation
+from ezreader.utilities import write_atomically
+from ezreader.vectorized import VectorizedSimulation
+
+CACHE_VERSION = 1 # change when the model changes, so that old results are not reused
+
+Result = namedtuple('Result', 'parameters key time measures')
+
+def grid(axes):
+    """
+    All combinations of values of parameters.
+
+    :param axes: dictionary mapping parameters (see the module) to lists of values
+    return: list of parameter sets
+    """
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*(axes[name] for name in names))]
+
+def apply_parameters(sentence, parameters):
+    """
+    Split a parameter set into the modified sentence and the complete model parameters.
+
+    :param sentence: a list of Words
+    :param parameters: parameter set (see the module)
+    return: (sentence, model_parameters)
+    """
+    sentence = list(sentence)
+    model_parameters = dict(Simulation.model_parameters)
+    for name, value in parameters.items():
+        if isinstance(name, tuple):
+            index, attribute = name
+            sentence[index] = sentence[index]._replace(**{attribute: value})
+        elif name in model_parameters:
+            model_parameters[name] = value
+        else:
+            raise ValueError("Unknown model parameter: %s" % name)
+    return sentence, model_parameters
+
+def cache_key(sentence, model_parameters, n_trials, seed):
+    """
+    Hash identifying the results of one parameter set.
+    """
+    description = {'version': CACHE_VERSION, 'sentence': [[str(word.token), float(word.frequency), float(word.predictability), float(word.integration_time), float(word.integration_failure)] for word in sentence], 'parameters': {name: float(value) for name, value in model_parameters.items()}, 'n_trials': int(n_trials), 'seed': None if seed is None else int(seed)}
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+def simulate(sentence, model_parameters, n_trials, seed):
+    """
+    Simulate one parameter set and aggregate the results.
+
+    return: dictionary with the mean time of trials and mean measures of words (lists, one value per word; None if undefined)
+    """
+    sim = VectorizedSimulation(sentence, n_trials, model_parameters=model_parameters, seed=seed).run()
+    measures = summary(sim.measures())
+    return {'time': float(sim.time.mean()), 'measures': {measure: [None if np.isnan(value) else float(value) for value in values] for measure, values in measures.items()}}
+
+def _simulate(task):
+    return simulate(*task)
+
+def load(cache_dir, key):
+    """
+    Cached results of the key (None if they are not in the cache).
+    """
+    try:
+        with open(os.path.join(cache_dir, key + '.json')) as cached:
+            return json.load(cached)
+    except (OSError, ValueError):
+        return None
+
+def save(cache_dir, key, result):
+    """
+    Store results in the cache. The file is written to a temporary file first and then renamed, so an interrupted sweep never leaves a broken file.
+    """
+    def write(temporary):
+        with open(temporary, 'w') as output:
+            json.dump(result, output)
+    os.makedirs(cache_dir, exist_ok=True)
+    write_atomically(os.path.join(cache_dir, key + '.json'), write)
+
+def sweep(sentence, parameter_sets, n_trials=1000, seed=0, cache_dir=None, workers=1, pool=None):
+    """
+    Simulate every parameter set (the same seed is used for all of them, i.e., common random numbers).
+
+    :param sentence: a list of Words
+    :param parameter_sets: list of parameter sets (see the module), e.g. from grid
+    :param n_trials: number of trials per parameter set
+    :param seed: seed of every parameter set; None gives every parameter set other random numbers (and cannot be cached)
+    :param cache_dir: directory of the cache; if None, nothing is cached
+    :param workers: number of processes simulating parameter sets not found in the cache; None uses all cores
+    :param pool: multiprocessing pool to use instead of starting a new one (workers is then ignored)
+    return: list of Result records (parameters, key, mean time of trials, mean measures of words), in the order of parameter_sets
+    """
+    if seed is None and cache_dir is not None:
+        raise ValueError("Results without a seed cannot be cached; give a seed or no cache_dir.")
+
+    tasks, keys = [], []
+    for parameters in parameter_sets:
+        modified, model_parameters = apply_parameters(sentence, parameters)
+        keys.append(cache_key(modified, model_parameters, n_trials, seed))
+        tasks.append((modified, model_parameters, n_trials, seed))
+
+    results = {}
+    if cache_dir is not None:
+        for key in set(keys):
+            cached = load(cache_dir, key)
+            if cached is not None:
+                results[key] = cached
+
+    missing = {}
+    for key, task in zip(keys, tasks):
+        if key not in results:
+            missing.setdefault(key, task)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    own_pool = None
+    if pool is None and workers > 1 and len(missing) > 1:
+        pool = own_pool = multiprocessing.Pool(processes=workers)
+
+    if pool is None or len(missing) <= 1:
+        computed = map(_simulate, missing.values())
+    else:
+        computed = pool.imap(_simulate, missing.values())
+
+    try:
+        # results are stored as soon as they come, so that a crash loses only what is being computed
+        for key, result in zip(missing, computed):
+            results[key] = result
+            if cache_dir is not None:
+                save(cache_dir, key, result)
+    finally:
+        if own_pool is not None:
+            own_pool.close()
+            own_pool.join()
+
+    return [Result(parameters, key, results[key]['time'], {measure: np.array(values, dtype=float) for measure, values in results[key]['measures'].items()}) for parameters, key in zip(parameter_sets, keys)]
+
+if __name__ == "__main__":
+    #example of a sweep over integration time and failure of the last word
+    from ezreader.simulation import Word
+    sentence = [Word('john', 5e06, 0.01, 25, 0.01), Word('sleeps', 2e05, 0.01, 25, 0.01), Word('extremely', 1e03, 0.01, 25, 0.01), Word('long', 1e05, 0.01, 25, 0.01)]
+    for result in sweep(sentence, grid({(3, "integration_time"): [25, 100], (3, "integration_failure"): [0.01, 0.5]}), n_trials=1000, cache_dir=os.path.join(tempfile.gettempdir(), "ezreader-sweep")):
+        print(result.parameters, result.time, result.measures['total'])
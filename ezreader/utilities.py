@@ -2,7 +2,15 @@
 Utilities for E-Z reader. This file collects all basic functions used in E-Z reader.
 """
 
+from collections import namedtuple
+import functools
 import math
+import os
+import tempfile
+
+import numpy as np
+
+LexicalTimes = namedtuple('LexicalTimes', 'familiarity_check lexical_access')
 
 def time_familiarity_check(distance, wordlength, frequency, predictability, eccentricity, alpha1=104, alpha2=3.4, alpha3=39):
     """
@@ -35,6 +43,74 @@ def time_lexical_access(frequency, predictability, delta, alpha1=104, alpha2=3.4
     tL2 = delta*(alpha1 - alpha2*math.log(frequency) - alpha3*predictability)
     return tL2
 
+def adjust_familiarity_check(tL1, distance, wordlength, eccentricity):
+    """
+    Adjust the base time of L1 (without eccentricity, see lexical_times) by eccentricity and distance to the middle point of the word. This is the only part of L1 that depends on where the eyes are.
+
+    :tL1: base time of familiarity check in ms
+    :distance: distance (in number of characters) between fixation and first letter of the word
+    :wordlength: length of words (in number of characters)
+    :eccentricity: a free parameter
+    return: time of familiarity check in ms
+    """
+    return tL1 * pow(eccentricity, (distance+(wordlength-1)/2))
+
+def times_familiarity_check(distance, wordlength, frequency, predictability, eccentricity, alpha1=104, alpha2=3.4, alpha3=39):
+    """
+    Times to calculate L1 (familiarity check) for arrays of words; see time_familiarity_check.
+
+    All arguments can be NumPy arrays (or anything broadcastable with them).
+    return: array of times of familiarity check in ms
+    """
+    tL1 = alpha1 - alpha2*np.log(frequency) - alpha3*np.asarray(predictability, dtype=float)
+    return tL1 * np.power(eccentricity, np.asarray(distance) + (np.asarray(wordlength)-1)/2)
+
+def times_lexical_access(frequency, predictability, delta, alpha1=104, alpha2=3.4, alpha3=39):
+    """
+    Times to calculate L2 (lexical access) for arrays of words; see time_lexical_access.
+
+    All arguments can be NumPy arrays (or anything broadcastable with them).
+    return: array of times of lexical access in ms
+    """
+    return delta*(alpha1 - alpha2*np.log(frequency) - alpha3*np.asarray(predictability, dtype=float))
+
+def lexical_times(sentence, model_parameters):
+    """
+    Base times of L1 (without eccentricity, see adjust_familiarity_check) and times of L2 of all words in a sentence.
+
+    The times are cached per sentence and parameter set, so simulations of the same sentence with the same parameters share them.
+
+    :sentence: Sentence or list of Words (or anything with frequency and predictability)
+    :model_parameters: dictionary with alpha1, alpha2, alpha3 and delta
+    return: LexicalTimes (two tuples, one value per word)
+    """
+    try:
+        words = sentence.lexical_key # Sentence
+    except AttributeError:
+        words = tuple((word.frequency, word.predictability) for word in sentence)
+    return _cached_lexical_times(words, model_parameters['alpha1'], model_parameters['alpha2'], model_parameters['alpha3'], model_parameters['delta'])
+
+@functools.lru_cache(maxsize=1024)
+def _cached_lexical_times(words, alpha1, alpha2, alpha3, delta):
+    familiarity_check = tuple(alpha1 - alpha2*math.log(frequency) - alpha3*predictability for frequency, predictability in words)
+    lexical_access = tuple(delta*tL1 for tL1 in familiarity_check)
+    return LexicalTimes(familiarity_check, lexical_access)
+
+def write_atomically(path, write):
+    """
+    Call write(temporary path) and rename the temporary file to path, so that path is never left half-written.
+    """
+    directory, name = os.path.split(path)
+    handle, temporary = tempfile.mkstemp(dir=directory or '.', prefix='.' + name, suffix='.tmp')
+    os.close(handle)
+    try:
+        result = write(temporary)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+    return result
+
 if __name__ == "__main__":
     #examples how to run functions
     tL1 = time_familiarity_check(3, 4, 3e05, 0.2, 1.15)
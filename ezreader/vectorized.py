@@ -0,0 +1,535 @@
+"""
+Vectorized E-Z reader. Many trials of one sentence are simulated in lockstep.
+
+The model is the same as in ezreader.simulation, but instead of simpy processes, the state of every process (visual processing, saccadic programming, integration and repeated attention after failed integration) is stored in NumPy arrays with one row per trial. In every iteration, each unfinished trial advances to its own next event and all events of one kind are processed together for all trials.
+"""
+
+import numpy as np
+
+import ezreader.utilities as ut
+from ezreader.layout import Layout
+from ezreader.sentence import Sentence
+from ezreader.measures import Measures, from_arrays, words_of
+from ezreader.recording import EVENTS, ZEROTH_WORD
+from ezreader.rng import NOISE, noise_factors
+from ezreader.recording import STARTED_SACCADE, INTERRUPTED_SACCADE, FINISHED_PROGRAMMING, FINISHED_SACCADE, STARTED_INTEGRATION, FAILED_INTEGRATION, SUCCESSFUL_INTEGRATION, ATTENTION_SHIFT, ATTENTION_SHIFT_BACK, L1, L1_FAKE, L2, FIXATION
+from ezreader.simulation import OPTIMAL_SACCADE_LENGTH, Simulation
+
+# stages of visual processing (each waiting stage is followed by waiting for the time of repeated attention)
+VP_L1, VP_L1_REPEATED, VP_L2, VP_L2_REPEATED, VP_SHIFT, VP_SHIFT_REPEATED, VP_DONE = range(7)
+
+# stages of saccadic programming
+SACCADE_NONE, SACCADE_M1, SACCADE_M2 = range(3)
+
+# stages of attending a word again after failed integration
+AGAIN_NONE, AGAIN_SHIFT, AGAIN_FAKE, AGAIN_L1, AGAIN_L2, AGAIN_INTEGRATION = range(6)
+
+SENTINEL = ZEROTH_WORD # index of the zeroth word ('None'), attended when regression goes in front of the integrated word
+SENTINEL_LENGTH = 4 # len('None')
+
+SLOTS = {'integration': ('wake', 'order', 'word', 'correct'), 'again': ('wake', 'order', 'stage', 'word', 'last_letter', 'next')}
+
+FIXATION_DTYPE = np.dtype([('trial', np.int64), ('position', np.float64), ('word', np.int64), ('start', np.float64), ('duration', np.float64)])
+
+class VectorizedSimulation(object):
+    """
+    E-Z reader simulation of n_trials trials of one sentence, run in lockstep.
+    """
+
+    model_parameters = Simulation.model_parameters
+
+    def __init__(self, sentence, n_trials, initial_fixation=1, model_parameters=None, seed=None, slots=4, layout=None, regions=None, noise=False):
+        """
+        :param sentence: a Sentence or a list of Words representing the sentence.
+        :param n_trials: how many trials are simulated.
+        :param initial_fixation: at which point the fixation starts (1 = the first letter).
+        :param model_parameters: a dictionary of model parameters overriding the default values.
+        :param seed: seed of the random generator.
+        :param slots: initial number of integrations (and repeated attentions) that can run at the same time in a trial; more are added when needed.
+        :param layout: Layout of the sentence (with the same tokens, otherwise ValueError is raised); if None, the (cached) layout of the sentence is used.
+        :param regions: indices of words of interest; if given, a trial stops as soon as the first-pass measures of these words are final (a word to their right is fixated).
+        :param noise: noise of durations: False, "gamma" (or True) or "normal", as in Simulation.
+        """
+        if model_parameters:
+            self.model_parameters = dict(self.model_parameters, **model_parameters)
+
+        self.n_trials = n_trials
+        self.rng = np.random.default_rng(seed)
+
+        if noise is True:
+            noise = "gamma"
+        if noise and noise not in NOISE:
+            raise ValueError("Unknown noise: %s; use False, True or one of %s." % (noise, ", ".join(NOISE)))
+        self.noise = noise or None
+        self.__noise_rng = np.random.default_rng(self.rng.integers(2**63)) if self.noise else None # noise factors, drawn in bulk
+
+        sentence = Sentence.of(sentence) # validated once
+        self.layout = Layout.of(sentence, layout)
+        self.tokens = self.layout.tokens
+        self.lengths = self.layout.lengths
+        self.starts = self.layout.starts # first letters of words
+        self.centres = self.layout.centres
+        self.frequency = np.array(sentence.frequency)
+        self.predictability = np.array(sentence.predictability)
+        self.integration_time = np.array(sentence.integration_time)
+        self.integration_failure = np.array(sentence.integration_failure)
+        self.__token_ids = np.unique(self.tokens, return_inverse=True)[1]
+        lexical_times = ut.lexical_times(sentence, self.model_parameters)
+        self.__base_time = np.array(lexical_times.familiarity_check) # L1 without eccentricity
+        self.__lexical_access = np.array(lexical_times.lexical_access) # L2
+
+        n = n_trials
+
+        self.time = np.zeros(n) # time of the last event of each trial (in ms)
+        self.fixation_point = np.full(n, float(initial_fixation))
+        self.fixated_word = self.__fixated_word__(self.fixation_point, np.full(n, SENTINEL))
+        self.attended_word = np.zeros(n, dtype=int)
+        self.__attended_again = np.zeros(n, dtype=bool) # attended word was set back after repeated attention
+        self.repeated_attention = np.zeros(n)
+        self.counts = np.zeros((n, len(EVENTS)), dtype=int) # how many times each event (see ezreader.recording) happened in each trial
+        self.iterations = 0
+        self.__order = 0 # events at the same time are processed in the order in which they were scheduled (as in simpy)
+
+        # visual processing
+        self.vp_stage = np.full(n, VP_L1)
+        self.vp_word = np.zeros(n, dtype=int)
+        self.vp_wake = np.full(n, np.inf)
+        self.vp_order = np.zeros(n, dtype=int)
+        self.vp_target = np.full(n, self.centres[0]) # where to move after L1 (the middle of the next word)
+
+        # saccadic programming
+        self.canbeinterrupted = np.ones(n, dtype=bool)
+        self.saccade_stage = np.full(n, SACCADE_NONE)
+        self.saccade_wake = np.full(n, np.inf)
+        self.saccade_order = np.zeros(n, dtype=int)
+        self.saccade_target = np.zeros(n)
+        self.saccade_word = np.zeros(n, dtype=int)
+        self.saccade_canbeinterrupted = np.ones(n, dtype=bool)
+        self.plan = np.zeros(n, dtype=bool) # saccade planned while the current one could not be interrupted
+        self.plan_target = np.zeros(n)
+        self.plan_word = np.zeros(n, dtype=int)
+        self.plan_canbeinterrupted = np.ones(n, dtype=bool)
+        self.launch_site = np.zeros(n)
+
+        # integrations (several can go on at the same time, one per slot)
+        self.integration_wake = np.full((n, slots), np.inf)
+        self.integration_order = np.zeros((n, slots), dtype=int)
+        self.integration_word = np.zeros((n, slots), dtype=int)
+        self.integration_correct = np.zeros((n, slots), dtype=bool)
+
+        # attending words again after failed integration (one per slot)
+        self.again_wake = np.full((n, slots), np.inf)
+        self.again_order = np.zeros((n, slots), dtype=int)
+        self.again_stage = np.full((n, slots), AGAIN_NONE)
+        self.again_word = np.zeros((n, slots), dtype=int)
+        self.again_last_letter = np.zeros((n, slots))
+        self.again_next = np.zeros((n, slots), dtype=int)
+
+        self.__fixations = [(np.arange(n), self.time.copy(), self.fixation_point.copy(), self.fixated_word.copy())]
+        self.counts[:, FIXATION] = 1
+        self.regions = regions
+        self.rightmost = words_of(self.layout, self.fixation_point) # the rightmost word fixated in each trial (see ezreader.measures)
+        self.stopped = np.zeros(n, dtype=bool) # trials stopped because their regions were resolved
+        self.fixations = None
+
+        self.__start_word__(np.arange(n))
+
+    def __length__(self, word):
+        """
+        Length of words (the zeroth word included).
+        """
+        return np.where(word == SENTINEL, SENTINEL_LENGTH, self.lengths[word])
+
+    def __fixated_word__(self, fixation_point, previous):
+        """
+        Find fixated words. If the fixation is outside of the sentence, the previously fixated word is kept.
+        """
+        return self.layout.words_at(fixation_point, outside=previous)
+
+    def __familiarity_check__(self, word, distance):
+        """
+        Time of L1 (see ezreader.utilities.time_familiarity_check).
+        """
+        return ut.adjust_familiarity_check(self.__base_time[word], distance, self.lengths[word], self.model_parameters['eccentricity'])
+
+    def __noisy__(self, time_in_ms, size):
+        """
+        Durations with noise (if noise is switched on).
+        :param time_in_ms: mean durations (in ms), an array of size or a number
+        """
+        if self.noise is None:
+            return time_in_ms
+        return time_in_ms*noise_factors(self.__noise_rng, self.noise, self.model_parameters["noise_cv"], size)
+
+    def __free_slot__(self, family, idx):
+        """
+        Find a free slot for every trial in idx, adding slots if some trial has none.
+        """
+        wake = getattr(self, family + '_wake')
+        free = np.isinf(wake[idx])
+        if not free.any(axis=1).all():
+            for field in SLOTS[family]:
+                array = getattr(self, family + '_' + field)
+                extra = np.full_like(array, np.inf if field == 'wake' else 0)
+                setattr(self, family + '_' + field, np.concatenate((array, extra), axis=1))
+            return self.__free_slot__(family, idx)
+        return free.argmax(axis=1)
+
+    def __schedule__(self, process, idx, time, slot=None):
+        """
+        Schedule the next event of a process (vp, saccade, integration or again) for the trials in idx.
+        """
+        self.__order += 1
+        where = idx if slot is None else (idx, slot)
+        getattr(self, process + '_wake')[where] = time
+        getattr(self, process + '_order')[where] = self.__order
+
+    def __count__(self, idx, action):
+        self.counts[idx, action] += 1
+
+    def __start_word__(self, idx):
+        """
+        Start visual processing of the word in vp_word (L1).
+        """
+        word = self.vp_word[idx]
+        self.attended_word[idx] = word
+        self.__attended_again[idx] = False
+        distance = self.starts[word] - self.fixation_point[idx]
+        random_draw = self.rng.uniform(size=len(idx))
+        time_familiarity_check = self.__noisy__(np.where(self.predictability[word] > random_draw, 0, self.__familiarity_check__(word, distance)), len(idx))
+        self.vp_stage[idx] = VP_L1
+        self.__schedule__('vp', idx, self.time[idx] + time_familiarity_check)
+
+    def __visual_processing__(self, idx):
+        """
+        Advance visual processing.
+        """
+        stage = self.vp_stage[idx]
+
+        # after L1, L2 and attention shift, wait for the time of repeated attention of some previous word
+        waiting = idx[(stage == VP_L1) | (stage == VP_L2) | (stage == VP_SHIFT)]
+        self.vp_stage[waiting] += 1
+        self.__schedule__('vp', waiting, self.time[waiting] + self.repeated_attention[waiting])
+
+        finished = idx[(stage == VP_L1_REPEATED) | (stage == VP_L2_REPEATED) | (stage == VP_SHIFT_REPEATED)]
+        self.repeated_attention[finished] = 0
+
+        # L1 done, calculate L2 and start programming movement to the next word
+        done = idx[stage == VP_L1_REPEATED]
+        self.__count__(done, L1)
+        word = self.vp_word[done]
+        self.vp_stage[done] = VP_L2
+        self.__schedule__('vp', done, self.time[done] + self.__noisy__(self.__lexical_access[word], len(done)))
+        has_next = word < len(self.tokens) - 1
+        moving = done[has_next]
+        self.vp_target[moving] = self.centres[word[has_next]+1]
+        self.__prepare_saccade__(moving, self.vp_target[moving], word[has_next]+1, True)
+
+        # L2 done, start integration
+        done = idx[stage == VP_L2_REPEATED]
+        self.__count__(done, L2)
+        self.vp_stage[done] = VP_SHIFT
+        self.__schedule__('vp', done, self.time[done] + self.__noisy__(self.model_parameters["time_attention_shift"], len(done)))
+        random_draw = self.rng.uniform(size=len(done))
+        self.__start_integration__(done, self.vp_word[done], float(self.model_parameters["probability_correct_regression"]) >= random_draw)
+
+        # attention shift done, move to the next word
+        done = idx[stage == VP_SHIFT_REPEATED]
+        self.__count__(done, ATTENTION_SHIFT)
+        self.vp_word[done] += 1
+        over = self.vp_word[done] >= len(self.tokens)
+        self.vp_stage[done[over]] = VP_DONE
+        self.vp_wake[done[over]] = np.inf
+        self.__start_word__(done[~over])
+
+    def __start_saccade__(self, idx, target, word, canbeinterrupted):
+        """
+        Start saccadic programming (M1).
+        """
+        self.__count__(idx, STARTED_SACCADE)
+        self.canbeinterrupted[idx] = canbeinterrupted
+        self.saccade_stage[idx] = SACCADE_M1
+        self.__schedule__('saccade', idx, self.time[idx] + self.__noisy__(self.model_parameters['saccade_programming'], len(idx)))
+        self.saccade_target[idx] = target
+        self.saccade_word[idx] = word
+        self.saccade_canbeinterrupted[idx] = canbeinterrupted
+
+    def __prepare_saccade__(self, idx, target, word, canbeinterrupted):
+        """
+        Prepare saccade: interrupt labile programming and start a new one if possible, otherwise plan the saccade for later.
+        """
+        canbeinterrupted = np.broadcast_to(canbeinterrupted, idx.shape)
+        free = self.canbeinterrupted[idx]
+
+        started = idx[free]
+        labile = started[self.saccade_stage[started] == SACCADE_M1]
+        self.__count__(labile, INTERRUPTED_SACCADE)
+        self.saccade_stage[labile] = SACCADE_NONE
+        self.saccade_wake[labile] = np.inf
+
+        # start a saccade only if fixation away from the word
+        half = self.__length__(word[free])/2
+        away = (self.fixation_point[started] < target[free] - half) | (self.fixation_point[started] > target[free] + half)
+        self.__start_saccade__(started[away], target[free][away], word[free][away], canbeinterrupted[free][away])
+
+        planned = idx[~free]
+        moving = self.fixation_point[planned] != target[~free]
+        planned = planned[moving]
+        self.plan[planned] = True
+        self.plan_target[planned] = target[~free][moving]
+        self.plan_word[planned] = word[~free][moving]
+        self.plan_canbeinterrupted[planned] = canbeinterrupted[~free][moving]
+
+    def __saccadic_programming__(self, idx):
+        """
+        Advance saccadic programming.
+        """
+        stage = self.saccade_stage[idx]
+
+        # M1 done, the saccade cannot be interrupted any more (M2)
+        done = idx[stage == SACCADE_M1]
+        self.canbeinterrupted[done] = False
+        self.__count__(done, FINISHED_PROGRAMMING)
+        self.saccade_stage[done] = SACCADE_M2
+        self.__schedule__('saccade', done, self.time[done] + self.__noisy__(self.model_parameters['saccade_finishing'], len(done)))
+
+        # M2 done, move the eyes
+        done = idx[stage == SACCADE_M2]
+        self.__count__(done, FINISHED_SACCADE)
+        target = self.saccade_target[done]
+        if self.layout.n_lines == 1:
+            intended_saccade_length = np.abs(self.fixation_point[done] - target)
+            systematic_error = (OPTIMAL_SACCADE_LENGTH - intended_saccade_length) * ((self.model_parameters["omega1"] - np.log(self.time[done] - self.launch_site[done])) / (self.model_parameters["omega2"]))
+            self.launch_site[done] = self.time[done]
+            self.fixation_point[done] = self.rng.normal(target + systematic_error, self.model_parameters["eta1"] + self.model_parameters["eta2"]*intended_saccade_length)
+        else:
+            # return sweeps, as in Simulation
+            intended_saccade_length, direction, lowest, highest = self.layout.saccades(self.fixation_point[done], target)
+            systematic_error = direction * (OPTIMAL_SACCADE_LENGTH - intended_saccade_length) * ((self.model_parameters["omega1"] - np.log(self.time[done] - self.launch_site[done])) / (self.model_parameters["omega2"]))
+            self.launch_site[done] = self.time[done]
+            self.fixation_point[done] = np.clip(self.rng.normal(target + systematic_error, self.model_parameters["eta1"] + self.model_parameters["eta2"]*intended_saccade_length), lowest, highest)
+        self.fixated_word[done] = self.__fixated_word__(self.fixation_point[done], self.fixated_word[done])
+        self.__fixations.append((done, self.time[done], self.fixation_point[done], self.fixated_word[done]))
+        self.__count__(done, FIXATION)
+        self.rightmost[done] = np.maximum(self.rightmost[done], words_of(self.layout, self.fixation_point[done]))
+
+        # either the planned saccade, or refixation, or done
+        planned = self.plan[done]
+        started = done[planned]
+        self.plan[started] = False
+        self.__start_saccade__(started, self.plan_target[started], self.plan_word[started], self.plan_canbeinterrupted[started])
+
+        rest = done[~planned]
+        random_draw = self.rng.uniform(size=len(rest))
+        refixation = self.model_parameters["lambda"] * np.abs(self.fixation_point[rest] - target[~planned]) >= random_draw
+        started = rest[refixation]
+        self.__start_saccade__(started, self.saccade_target[started], self.saccade_word[started], self.saccade_canbeinterrupted[started])
+        stopped = rest[~refixation]
+        self.saccade_stage[stopped] = SACCADE_NONE
+        self.saccade_wake[stopped] = np.inf
+        self.canbeinterrupted[stopped] = True
+
+    def __start_integration__(self, idx, word, correct):
+        """
+        Start integration of words.
+
+        :param correct: in case of failure, should the regression go to the word itself (otherwise, in front of it)
+        """
+        self.__count__(idx, STARTED_INTEGRATION)
+        slot = self.__free_slot__('integration', idx)
+        self.__schedule__('integration', idx, self.time[idx] + self.__noisy__(self.integration_time[word], len(idx)), slot)
+        self.integration_word[idx, slot] = word
+        self.integration_correct[idx, slot] = correct
+
+    def __integration__(self, idx, slot):
+        """
+        Finish integration.
+        """
+        self.integration_wake[idx, slot] = np.inf
+        word = self.integration_word[idx, slot]
+        correct = self.integration_correct[idx, slot]
+
+        random_draw = self.rng.uniform(size=len(idx))
+        failed = self.integration_failure[word] >= random_draw
+        self.__count__(idx[~failed], SUCCESSFUL_INTEGRATION)
+
+        idx, word, correct = idx[failed], word[failed], correct[failed]
+        self.__count__(idx, FAILED_INTEGRATION)
+
+        # if failed integration, start saccade back to that word (or in front of it) and attend the word again
+        previous = np.where(word > 0, self.starts[word] - 0.5 - self.lengths[np.maximum(word-1, 0)]/2, 0)
+        target = np.where(correct, self.centres[word], previous)
+        attended = np.where(correct, word, SENTINEL)
+        self.__prepare_saccade__(idx, target, attended, False)
+
+        slot = self.__free_slot__('again', idx)
+        self.again_word[idx, slot] = attended
+        self.again_last_letter[idx, slot] = np.where(correct, self.starts[word] + self.lengths[word], self.starts[word] - 2)
+        self.again_next[idx, slot] = np.minimum(word + 1, len(self.tokens) - 1)
+
+        same = self.__attended_again[idx] & (attended != SENTINEL)
+        same[same] = self.__token_ids[self.attended_word[idx[same]]] == self.__token_ids[attended[same]]
+        self.again_stage[idx[~same], slot[~same]] = AGAIN_SHIFT
+        self.__schedule__('again', idx[~same], self.time[idx[~same]] + self.__noisy__(self.model_parameters["time_attention_shift"], np.count_nonzero(~same)), slot[~same])
+        self.__attend_again__(idx[same], slot[same])
+
+    def __attend_again__(self, idx, slot):
+        """
+        Start L1 of the word attended again (or a fake L1 if attention is outside of the text).
+        """
+        word = self.again_word[idx, slot]
+
+        outside = word == SENTINEL
+        self.repeated_attention[idx[outside]] += 50 # just some small number for familiarity if we jump out of text
+        self.again_stage[idx[outside], slot[outside]] = AGAIN_FAKE
+        self.__schedule__('again', idx[outside], self.time[idx[outside]] + 50, slot[outside])
+
+        idx, slot, word = idx[~outside], slot[~outside], word[~outside]
+        distance = self.again_last_letter[idx, slot] - self.fixation_point[idx]
+        random_draw = self.rng.uniform(size=len(idx))
+        time_familiarity_check = self.__noisy__(np.where(self.model_parameters["predictability_repeated_attention"] > random_draw, 0, self.__familiarity_check__(word, distance)), len(idx))
+        self.repeated_attention[idx] += time_familiarity_check
+        self.again_stage[idx, slot] = AGAIN_L1
+        self.__schedule__('again', idx, self.time[idx] + time_familiarity_check, slot)
+
+    def __repeated_attention__(self, idx, slot):
+        """
+        Advance attending words again after failed integration.
+        """
+        stage = self.again_stage[idx, slot]
+
+        done = stage == AGAIN_SHIFT
+        self.attended_word[idx[done]] = self.again_word[idx[done], slot[done]]
+        self.__attended_again[idx[done]] = False
+        self.__count__(idx[done], ATTENTION_SHIFT_BACK)
+        self.__attend_again__(idx[done], slot[done])
+
+        # fake L1 (outside of the text) done, move to the next word
+        done = stage == AGAIN_FAKE
+        self.__count__(idx[done], L1_FAKE)
+        self.again_stage[idx[done], slot[done]] = AGAIN_NONE
+        self.again_wake[idx[done], slot[done]] = np.inf
+        following = self.again_next[idx[done], slot[done]]
+        self.__prepare_saccade__(idx[done], self.centres[following], following, True)
+
+        # L1 done, calculate L2 and move to the next word
+        done = stage == AGAIN_L1
+        self.__count__(idx[done], L1)
+        time_lexical_access = self.__noisy__(self.__lexical_access[self.again_word[idx[done], slot[done]]], np.count_nonzero(done))
+        self.repeated_attention[idx[done]] += time_lexical_access
+        self.again_stage[idx[done], slot[done]] = AGAIN_L2
+        self.__schedule__('again', idx[done], self.time[idx[done]] + time_lexical_access, slot[done])
+        following = self.again_next[idx[done], slot[done]]
+        self.__prepare_saccade__(idx[done], self.centres[following], following, True)
+
+        done = stage == AGAIN_L2
+        self.__count__(idx[done], L2)
+        time_integration = self.__noisy__(self.integration_time[self.again_word[idx[done], slot[done]]], np.count_nonzero(done))
+        self.repeated_attention[idx[done]] += time_integration
+        self.again_stage[idx[done], slot[done]] = AGAIN_INTEGRATION
+        self.__schedule__('again', idx[done], self.time[idx[done]] + time_integration, slot[done])
+
+        # reset attended word to continue in normal way
+        done = stage == AGAIN_INTEGRATION
+        self.__count__(idx[done], SUCCESSFUL_INTEGRATION)
+        self.attended_word[idx[done]] = self.again_word[idx[done], slot[done]]
+        self.__attended_again[idx[done]] = True
+        self.again_stage[idx[done], slot[done]] = AGAIN_NONE
+        self.again_wake[idx[done], slot[done]] = np.inf
+
+    def __stop__(self, idx):
+        """
+        Stop trials (their regions are resolved): no further events are processed.
+        """
+        self.stopped[idx] = True
+        self.vp_wake[idx] = np.inf
+        self.saccade_wake[idx] = np.inf
+        self.integration_wake[idx] = np.inf
+        self.again_wake[idx] = np.inf
+
+    def step(self):
+        """
+        Make one step: every unfinished trial processes its next event.
+
+        return: number of trials that made a step (0 if the simulation is over)
+        """
+        if self.regions is not None:
+            self.__stop__(np.flatnonzero(~self.stopped & (self.rightmost > max(self.regions))))
+
+        n_integration = self.integration_wake.shape[1]
+        wake = np.column_stack((self.vp_wake, self.saccade_wake, self.integration_wake, self.again_wake))
+        first = wake.min(axis=1)
+        idx = np.flatnonzero(np.isfinite(first))
+
+        if len(idx) == 0:
+            return 0
+
+        # among events at the same time, the one scheduled first goes first
+        order = np.column_stack((self.vp_order[idx], self.saccade_order[idx], self.integration_order[idx], self.again_order[idx]))
+        source = np.where(wake[idx] == first[idx, None], order, np.iinfo(order.dtype).max).argmin(axis=1)
+        self.time[idx] = first[idx]
+        self.iterations += 1
+
+        self.__visual_processing__(idx[source == 0])
+        self.__saccadic_programming__(idx[source == 1])
+        integration = (source >= 2) & (source < 2 + n_integration)
+        self.__integration__(idx[integration], source[integration] - 2)
+        again = source >= 2 + n_integration
+        self.__repeated_attention__(idx[again], source[again] - 2 - n_integration)
+
+        return len(idx)
+
+    def run(self):
+        """
+        Run all trials until they are over and collect fixations.
+
+        After the run, fixations is a structured array (trial, position, word, start, duration) ordered by trials and time; word is the index of the fixated word (-1 if no word was fixated yet).
+        """
+        while self.step():
+            pass
+
+        trial, start, position, word = (np.concatenate(column) for column in zip(*self.__fixations))
+        order = np.argsort(trial, kind='stable')
+        fixations = np.empty(len(order), dtype=FIXATION_DTYPE)
+        fixations['trial'] = trial[order]
+        fixations['start'] = start[order]
+        fixations['position'] = position[order]
+        fixations['word'] = word[order]
+        last = np.append(fixations['trial'][1:] != fixations['trial'][:-1], True)
+        fixations['duration'] = np.where(last, self.time[fixations['trial']], np.append(fixations['start'][1:], 0)) - fixations['start']
+        self.fixations = fixations
+
+        return self
+
+    def measures(self):
+        """
+        Eye-movement measures of all trials (see ezreader.measures), computed after the run.
+
+        return: dictionary of arrays (trials x words)
+        """
+        return from_arrays(self.fixations['trial'], words_of(self.layout, self.fixations['position']), self.fixations['start'], self.time, len(self.layout), finished=~self.stopped)
+
+    def trials(self):
+        """
+        Fixations of every trial as Trial records (as returned by ezreader.batch.run_trials). Words are given as tokens.
+        """
+        from ezreader.batch import Fixation, Trial
+
+        bounds = np.searchsorted(self.fixations['trial'], np.arange(self.n_trials + 1))
+        words = words_of(self.layout, self.fixations['position'])
+        trials = []
+        for i in range(self.n_trials):
+            fixations = [Fixation(float(fixation['position']), self.tokens[fixation['word']] if fixation['word'] != SENTINEL else None, float(fixation['start']), float(fixation['duration'])) for fixation in self.fixations[bounds[i]:bounds[i+1]]]
+            measures = Measures(len(self.layout))
+            for word, fixation in zip(words[bounds[i]:bounds[i+1]], fixations):
+                measures.fixate(word, fixation.start)
+            measures.close(float(self.time[i]), finished=not self.stopped[i])
+            trials.append(Trial(i, None, float(self.time[i]), fixations, measures, None))
+        return trials
+
+if __name__ == "__main__":
+    #example how to run many trials at once
+    from ezreader.simulation import Word
+    sim = VectorizedSimulation([Word('john', 5e06, 0.01, 25, 0.01), Word('sleeps', 2e05, 0.01, 25, 0.01), Word('extremely', 1e03, 0.01, 25, 0.01), Word('long', 1e05, 0.01, 25, 0.01)], n_trials=10000, seed=1).run()
+    print(sim.trials()[0])
+    print(np.mean(sim.time))
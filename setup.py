@@ -11,5 +11,6 @@ setup(name='ezreader',
       packages=['ezreader'],
       license='GPL',
       install_requires=['numpy', 'simpy'],
+      entry_points={'console_scripts': ['ezreader=ezreader.cli:main']},
       classifiers=['Programming Language :: Python :: 3', 'License :: OSI Approved :: GNU General Public License v3 (GPLv3)', 'Operating System :: OS Independent', 'Development Status :: 3 - Alpha', 'Topic :: Scientific/Engineering'],
       zip_safe=False)
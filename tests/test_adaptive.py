@@ -0,0 +1,10 @@
+from ezreader.adaptive import run_adaptive
+from ezreader.sentence import Word
+
+def test_words_without_defined_trials_do_not_block_convergence():
+    sentence = [Word('walked', 159, 0, 25, 0), Word('a', 1e12, 1, 0, 0), Word('quad', 10, 1, 25, 0)]
+    exact = {"eta1": 0, "eta2": 0} # saccades land where they are aimed, so 'a' is always skipped and has no gaze duration
+    estimate = run_adaptive({"exact": (sentence, exact)}, measures=('gaze',), width=1000, increment=50, max_trials=200)["exact"]
+    assert estimate.converged
+    assert estimate.n_trials == 50
+    assert estimate.undefined == {'gaze': [1]}
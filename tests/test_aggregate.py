@@ -0,0 +1,11 @@
+import numpy as np
+import pytest
+
+from ezreader.aggregate import Aggregate
+
+def test_merge_refuses_other_bins():
+    aggregate = Aggregate(3)
+    other = Aggregate(3, bins=np.arange(0, 1010, 5.0))
+    with pytest.raises(ValueError):
+        aggregate.merge(other)
+    assert aggregate.n_trials == 0 and not aggregate.count()['gaze'].any()
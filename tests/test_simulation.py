@@ -0,0 +1,41 @@
+import simpy
+
+from ezreader.sentence import Word
+from ezreader.simulation import Simulation
+
+SENTENCE = [Word('john', 5e06, 0.01, 25, 0.01), Word('sleeps', 2e05, 0.01, 25, 0.01), Word('extremely', 1e03, 0.01, 25, 0.01), Word('long', 1e05, 0.01, 25, 0.01)]
+
+def finish(sim):
+    try:
+        while True:
+            sim.step()
+    except simpy.core.EmptySchedule:
+        pass
+    return sim
+
+def records(sim):
+    return repr(sim.events.records.tolist()) # repr, since nan targets are never equal
+
+def test_branch_keeps_parameters_of_the_simulation():
+    parameters = {"alpha1": 90, "eccentricity": 1.3}
+    sim = Simulation(SENTENCE, trace=False, engine="heap", record=True, model_parameters=parameters, seed=3)
+    for _ in range(10):
+        sim.step()
+    branch = sim.branch(sentence=list(SENTENCE))
+    assert branch.model_parameters["alpha1"] == 90
+    assert branch.model_parameters["eccentricity"] == 1.3
+    fresh = finish(Simulation(SENTENCE, trace=False, engine="heap", record=True, model_parameters=parameters, seed=3))
+    assert records(finish(branch)) == records(fresh)
+
+def test_one_word_with_failed_integration():
+    sentence = [Word('sleeps', 2e05, 0.01, 25, 1.0)] # integration always fails
+    for seed in range(5):
+        simpy_sim = finish(Simulation(sentence, trace=False, engine="simpy", record=True, seed=seed))
+        heap_sim = finish(Simulation(sentence, trace=False, engine="heap", record=True, seed=seed))
+        assert records(simpy_sim) == records(heap_sim)
+
+def test_heap_engine_gives_the_traces_of_simpy():
+    for seed in range(10):
+        simpy_sim = finish(Simulation(SENTENCE, trace=False, engine="simpy", record=True, seed=seed))
+        heap_sim = finish(Simulation(SENTENCE, trace=False, engine="heap", record=True, seed=seed))
+        assert records(simpy_sim) == records(heap_sim), seed
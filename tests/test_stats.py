@@ -0,0 +1,16 @@
+from ezreader.batch import run_trial
+from ezreader.benchmark import synthetic_sentence
+
+SENTENCE = synthetic_sentence(10, seed=2)
+
+def counts(trial):
+    summary = trial.stats.summary()
+    del summary["steps"], summary["wall_time"] # steps differ by engine, see ezreader.stats
+    return summary
+
+def test_engines_count_the_same_events():
+    for seed in range(20):
+        for regions in (None, [3]):
+            simpy_trial = run_trial(SENTENCE, seed, engine="simpy", regions=regions, stats=True)
+            heap_trial = run_trial(SENTENCE, seed, engine="heap", regions=regions, stats=True)
+            assert counts(simpy_trial) == counts(heap_trial), (seed, regions)
@@ -0,0 +1,21 @@
+import numpy as np
+
+from ezreader.batch import run_trials
+from ezreader.measures import summary
+from ezreader.sentence import Word
+from ezreader.vectorized import VectorizedSimulation
+
+SENTENCE = [Word('john', 5e06, 0.01, 25, 0.01), Word('sleeps', 2e05, 0.01, 25, 0.01), Word('extremely', 1e03, 0.01, 25, 0.01), Word('long', 1e05, 0.01, 25, 0.01)]
+N_TRIALS = 2000
+
+def test_means_agree_with_scalar_engine():
+    trials = run_trials(SENTENCE, N_TRIALS, seed=1, engine="heap")
+    scalar = summary([trial.measures for trial in trials])
+    sim = VectorizedSimulation(SENTENCE, N_TRIALS, seed=1).run()
+    vectorized = summary(sim.measures())
+    # different random numbers, so only sampling error is allowed for (loosely)
+    assert abs(sim.time.mean() - np.mean([trial.time for trial in trials])) < 0.03*sim.time.mean()
+    for measure in ('first_fixation', 'gaze', 'total'):
+        assert np.allclose(vectorized[measure], scalar[measure], rtol=0.1), measure
+    for measure in ('skipped', 'refixated', 'regression'):
+        assert np.allclose(vectorized[measure], scalar[measure], atol=0.04), measure